@@ -1,155 +1,3653 @@
 # pdf_metadata_analyzer_auto_cache.py
 import os
+import sys
+import argparse
 import hashlib
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import threading
+import multiprocessing
+import multiprocessing.connection
 from datetime import datetime, timedelta
 import fitz  # PyMuPDF
 import webbrowser
 import time
 import json
+import random
+import re
+import html
+import mmap
+import zlib
+import unicodedata
+import heapq
+import itertools
+import bisect
+import asyncio
+import fnmatch
+import csv
+import queue
+import concurrent.futures
+import copy
+import contextlib
+import urllib.request
+import urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import deque, namedtuple, OrderedDict
+from collections.abc import MutableMapping
+from array import array
 import winsound
 
+try:
+    import resource  # Solo en sistemas POSIX
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # Opcional: vigilancia de memoria en Windows
+except ImportError:
+    psutil = None
+
+try:
+    # Opcional: exportación a Parquet
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    # Opcional: eventos del sistema de archivos (inotify en Linux, ReadDirectoryChangesW en Windows)
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+class ScanFilters:
+    """Filtros del recorrido: globs de inclusión/exclusión, profundidad, tamaño y fechas.
+
+    Los globs se comparan con el nombre y con la ruta relativa a la carpeta
+    de búsqueda (con '/'), p. ej. 'backup', '.snapshot' o 'clientes/*/tmp'.
+    Una carpeta excluida o más profunda que `max_depth` no se llega a listar.
+    Las fechas son timestamps (mtime) y los tamaños, bytes.
+    """
+    
+    def __init__(self, include=None, exclude=None, max_depth=None, min_size=None, max_size=None,
+                 modified_after=None, modified_before=None):
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.max_depth = max_depth
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+    
+    def as_dict(self):
+        return {key: value for key, value in vars(self).items() if value not in (None, [])}
+    
+    def cache_key(self):
+        """Clave de la configuración (vacía sin filtros: el almacén de siempre)"""
+        config = self.as_dict()
+        if not config:
+            return ''
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    
+    def _matches(self, patterns, name, relative_path):
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+    
+    def accepts_dir(self, name, relative_path, depth):
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        return not self._matches(self.exclude, name, relative_path)
+    
+    def accepts_file(self, name, relative_path, size, mtime):
+        if self.include and not self._matches(self.include, name, relative_path):
+            return False
+        if self._matches(self.exclude, name, relative_path):
+            return False
+        if (self.min_size is not None and size < self.min_size) or (self.max_size is not None and size > self.max_size):
+            return False
+        if self.modified_after is not None and mtime < self.modified_after:
+            return False
+        if self.modified_before is not None and mtime > self.modified_before:
+            return False
+        return True
+
+class DirectoryTree:
+    """Árbol de carpetas para validar los cachés sin recorrer todos los archivos.
+
+    Cada nodo guarda el mtime de la carpeta, los PDFs que contiene
+    ({nombre: [tamaño, mtime]}) y sus subcarpetas. Crear, borrar o renombrar
+    una entrada cambia el mtime de la carpeta que la contiene, así que al
+    validar solo se listan las carpetas cuyo mtime cambió y el coste crece
+    con las carpetas modificadas, no con los archivos. Editar un PDF en su
+    sitio no cambia el mtime de la carpeta: eso solo se ve con el stat de
+    cada PDF conocido, que se hace si se pide (`check_files`, una revisión
+    completa) o para los archivos que se sabe que cambiaron (`changed_files`).
+
+    Las carpetas se recorren en paralelo con un grupo acotado de hilos: en
+    unidades de red cada stat o listado es un viaje de ida y vuelta y así se
+    solapan. `simulated_latency` añade una espera a cada operación para
+    probarlo en local.
+    """
+    
+    def __init__(self, workers=16, simulated_latency=0.0, filters=None):
+        self.workers = workers
+        self.simulated_latency = simulated_latency
+        self.filters = filters or ScanFilters()
+    
+    def _simulate_latency(self):
+        if self.simulated_latency:
+            time.sleep(self.simulated_latency)
+    
+    def is_pdf_name(self, name):
+        """Indica si un nombre de archivo es un PDF a analizar (excluye temporales ~$)"""
+        return name.lower().endswith('.pdf') and not name.startswith('~$')
+    
+    def list_directory(self, folder, relative='', depth=0):
+        """Lista una carpeta: devuelve ({nombre: [tamaño, mtime]}, [subcarpetas])
+
+        Aplica los filtros: las subcarpetas excluidas se podan aquí y su
+        contenido nunca se recorre.
+        """
+        files = {}
+        subdirs = []
+        self._simulate_latency()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.filters.accepts_dir(entry.name, entry_relative, depth + 1):
+                            subdirs.append(entry.name)
+                    elif entry.is_file() and self.is_pdf_name(entry.name):
+                        entry_stat = entry.stat()
+                        if self.filters.accepts_file(entry.name, entry_relative, entry_stat.st_size, entry_stat.st_mtime):
+                            files[entry.name] = [entry_stat.st_size, entry_stat.st_mtime]
+                except OSError as e:
+                    print(f"Error leyendo {entry.path}: {e}")
+        return files, subdirs
+    
+    def stat_files(self, folder, known_files, relative='', depth=0):
+        """stat de los PDFs ya conocidos de una carpeta: devuelve {nombre: [tamaño, mtime]} actualizado
+
+        Los que desaparecieron o dejan de pasar los filtros se omiten.
+        """
+        files = {}
+        for name in known_files:
+            self._simulate_latency()
+            try:
+                file_stat = (folder / name).stat()
+            except OSError:
+                continue
+            entry_relative = f"{relative}/{name}" if relative else name
+            if self.filters.accepts_file(name, entry_relative, file_stat.st_size, file_stat.st_mtime):
+                files[name] = [file_stat.st_size, file_stat.st_mtime]
+        return files
+    
+    def validate(self, folder_path, cached_tree=None, on_folder=None, should_stop=None, check_files=True,
+                 changed_files=()):
+        """Actualiza el árbol de una carpeta y devuelve (árbol, carpetas_modificadas).
+
+        Sin árbol previo se construye completo y todas las carpetas cuentan como
+        modificadas. Las carpetas modificadas son aquellas cuya lista de PDFs
+        cambió; sus archivos son los únicos que hay que volver a analizar. En
+        las carpetas con el mismo mtime solo se hace stat de los PDFs conocidos
+        con `check_files`, o de los que están en `changed_files` (rutas).
+
+        `on_folder(carpeta, archivos, modificada)` se llama desde los hilos del
+        recorrido en cuanto se conoce cada carpeta, para que la extracción
+        empiece sin esperar al árbol completo. Si `should_stop()` devuelve True
+        el recorrido se abandona y el árbol devuelto es None.
+        """
+        root = Path(folder_path)
+        listings = {}
+        dirty_dirs = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def scan(folder, cached_node, relative):
+                return self._scan_folder(folder, cached_node, relative, on_folder, check_files, changed_files)
+            
+            futures = {pool.submit(scan, root, cached_tree, '')}
+            while futures:
+                if should_stop and should_stop():
+                    for future in futures:
+                        future.cancel()
+                    return None, dirty_dirs
+                done, futures = concurrent.futures.wait(
+                    futures, timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    scanned = future.result()
+                    if scanned is None:
+                        continue
+                    folder, listing = scanned
+                    listings[folder] = listing
+                    if listing['dirty']:
+                        dirty_dirs.append(str(folder))
+                    for name in listing['subdirs']:
+                        relative = f"{listing['relative']}/{name}" if listing['relative'] else name
+                        futures.add(pool.submit(scan, folder / name, listing['cached_dirs'].get(name), relative))
+        
+        return self._build_node(root, listings), dirty_dirs
+    
+    def _scan_folder(self, folder, cached_node, relative, on_folder=None, check_files=True, changed_files=()):
+        """stat de una carpeta y, si su mtime cambió, listado; se ejecuta en un hilo del recorrido"""
+        self._simulate_latency()
+        try:
+            folder_mtime = folder.stat().st_mtime
+        except OSError:
+            return None
+        
+        depth = relative.count('/') + 1 if relative else 0
+        if cached_node and cached_node.get('mtime') == folder_mtime:
+            # Carpeta sin cambios: no se lista, pero un PDF editado en su sitio solo se ve en su propio stat
+            checked = set()
+            if check_files:
+                checked = set(cached_node['files'])
+            elif changed_files:
+                checked = {name for name in cached_node['files'] if str(folder / name) in changed_files}
+            files = cached_node['files']
+            if checked:
+                files = {name: entry for name, entry in files.items() if name not in checked}
+                files.update(self.stat_files(folder, checked, relative, depth))
+            subdirs = list(cached_node['dirs'])
+            cached_dirs = cached_node['dirs']
+            dirty = files != cached_node['files']
+        else:
+            try:
+                files, subdirs = self.list_directory(folder, relative, depth)
+            except OSError as e:
+                print(f"Error listando carpeta {folder}: {e}")
+                return None
+            dirty = not cached_node or files != cached_node.get('files')
+            cached_dirs = cached_node['dirs'] if cached_node else {}
+        
+        if on_folder:
+            on_folder(folder, files, dirty)
+        return folder, {'mtime': folder_mtime, 'files': files, 'subdirs': subdirs,
+                        'cached_dirs': cached_dirs, 'dirty': dirty, 'relative': relative}
+    
+    def _build_node(self, folder, listings):
+        listing = listings.get(folder)
+        if listing is None:
+            return None
+        subdirs = {}
+        for name in listing['subdirs']:
+            node = self._build_node(folder / name, listings)
+            if node is not None:
+                subdirs[name] = node
+        return {
+            'mtime': listing['mtime'],
+            'files': listing['files'],
+            'dirs': subdirs
+        }
+    
+    def iter_files(self, tree, folder_path):
+        """Recorre los PDFs registrados en el árbol: (ruta, tamaño, mtime)"""
+        if not tree:
+            return
+        pending = [(Path(folder_path), tree)]
+        while pending:
+            folder, node = pending.pop()
+            for name, (size, mtime) in node['files'].items():
+                yield folder / name, size, mtime
+            for name, child in node['dirs'].items():
+                pending.append((folder / name, child))
+    
+    def split_folder(self, folder, files, cached_entries, quarantine=None):
+        """Separa los PDFs de una carpeta en entradas reutilizables y archivos por analizar.
+
+        Solo se reutilizan las entradas con el mismo tamaño y mtime que el
+        listado. Un PDF sin entrada (nuevo, o pendiente de un escaneo
+        interrumpido) o modificado se analiza salvo que esté en cuarentena y no
+        haya cambiado.
+        """
+        quarantine = quarantine or {}
+        reusable = {}
+        pending = []
+        for name, (size, mtime) in files.items():
+            pdf_path = folder / name
+            file_key = str(pdf_path)
+            cached_entry = cached_entries.get(file_key)
+            quarantined = quarantine.get(file_key)
+            if (cached_entry is not None and cached_entry.get('tamaño') == size
+                    and timestamp_ns(cached_entry.get('modification_time')) == timestamp_ns(mtime)):
+                reusable[file_key] = cached_entry
+            elif quarantined and quarantined.get('modification_time') == mtime and quarantined.get('tamaño') == size:
+                continue
+            else:
+                pending.append(pdf_path)
+        return reusable, pending
+
+# Peso de cada rasgo en la puntuación de similitud (se configuran en PDFMetadataAnalyzer.feature_weights)
+FEATURE_WEIGHTS = {
+    'creador': 1.0,
+    'productor': 1.0,
+    'fecha_creacion': 2.0,
+    'hash': 3.0,
+    'id_original': 3.0,
+    'id_revision': 2.0,
+    'xmp_documento': 3.0,
+    'xmp_instancia': 2.0,
+    'version_pdf': 0.25,
+    'paginas': 0.5,
+    'fuentes': 1.5
+}
+
+FEATURE_LABELS = {
+    'creador': 'Creator', 'productor': 'Producer', 'fecha_creacion': 'Create Date', 'hash': 'Hash SHA256',
+    'id_original': '/ID original', 'id_revision': '/ID revisión', 'xmp_documento': 'XMP DocumentID',
+    'xmp_instancia': 'XMP InstanceID', 'version_pdf': 'Versión PDF', 'paginas': 'Páginas', 'fuentes': 'Fuentes'
+}
+
+def normalize_feature(value):
+    if value == 'No disponible' or not value:
+        return None
+    return str(value).strip().lower()
+
+def compute_features(document):
+    """Tabla de rasgos de un registro: {campo: valor normalizado}, sin los campos vacíos
+
+    El /ID del trailer se separa en su parte original (fija desde que se creó
+    el documento) y la de revisión; el juego de fuentes se reduce a un resumen.
+    """
+    features = {}
+    for field, key in (('creador', 'creador'), ('productor', 'productor'), ('fecha_creacion', 'fecha_creacion'),
+                       ('hash', 'hash_sha256'), ('xmp_documento', 'xmp_document_id'),
+                       ('xmp_instancia', 'xmp_instance_id'), ('version_pdf', 'version_pdf')):
+        value = normalize_feature(document.get(key))
+        if value:
+            features[field] = value
+    
+    file_id = document.get('id_trailer') or []
+    for field, part in zip(('id_original', 'id_revision'), file_id):
+        if part:
+            features[field] = part.lower()
+    if document.get('paginas'):
+        features['paginas'] = document['paginas']
+    if document.get('fuentes'):
+        features['fuentes'] = hashlib.sha1('|'.join(document['fuentes']).encode('utf-8')).hexdigest()[:16]
+    return features
+
+class FeatureIndex:
+    """Índice invertido de la tabla de rasgos: (campo, valor) → rutas
+
+    Puntuar una referencia solo recorre las listas de sus propios valores, así
+    que añadir rasgos no convierte la consulta en una comparación con todos los
+    registros de la carpeta.
+    
+    Con `lookup(ruta)` el índice no guarda la tabla de cada ruta: se la pide a
+    quien guarda los registros (el almacén la calcula al vuelo). En ese caso
+    remove() debe llamarse antes de cambiar o quitar el registro. Los valores
+    que solo tiene una ruta (hash, identificadores) guardan la ruta sin un
+    conjunto alrededor; son la mayoría de las entradas.
+    """
+    
+    def __init__(self, lookup=None):
+        self.postings = {}
+        self.features = {}
+        self.lookup = lookup
+    
+    def features_of(self, file_path):
+        if self.lookup is not None:
+            return self.lookup(file_path)
+        return self.features.get(file_path)
+    
+    def add(self, file_path, features):
+        if self.lookup is None:
+            self.remove(file_path)
+            self.features[file_path] = features
+        for item in features.items():
+            paths = self.postings.get(item)
+            if paths is None:
+                self.postings[item] = file_path
+            elif isinstance(paths, set):
+                paths.add(file_path)
+            elif paths != file_path:
+                self.postings[item] = {paths, file_path}
+    
+    def remove(self, file_path):
+        if self.lookup is not None:
+            features = self.lookup(file_path)
+        else:
+            features = self.features.pop(file_path, None)
+        for item in (features or {}).items():
+            paths = self.postings.get(item)
+            if isinstance(paths, set):
+                paths.discard(file_path)
+                if len(paths) == 1:
+                    self.postings[item] = paths.pop()
+            elif paths == file_path:
+                del self.postings[item]
+    
+    def paths(self, item):
+        """Rutas con el valor `item` = (campo, valor)"""
+        paths = self.postings.get(item, ())
+        return (paths,) if isinstance(paths, str) else paths
+    
+    def score(self, reference_features, weights, threshold=0.0):
+        """{ruta: (puntuación, [campos coincidentes])} de los candidatos a llegar a `threshold`
+
+        Los rasgos más débiles que ni sumados alcanzan el umbral (versión,
+        páginas...) no generan candidatos: sus listas, que suelen ser enormes,
+        no se recorren, y solo se comprueban en los candidatos que aportan los
+        demás.
+        """
+        fields = sorted((field for field in reference_features if weights.get(field)), key=lambda field: weights[field])
+        weak_total = 0.0
+        while fields and weak_total + weights[fields[0]] < threshold:
+            weak_total += weights[fields.pop(0)]
+        
+        candidates = set()
+        for field in fields:
+            candidates.update(self.paths((field, reference_features[field])))
+        
+        scores = {}
+        for file_path in candidates:
+            features = self.features_of(file_path)
+            if features is None:
+                # Eliminado después de reunir los candidatos
+                continue
+            matched = [field for field, value in reference_features.items()
+                       if weights.get(field) and features.get(field) == value]
+            scores[file_path] = (sum(weights[field] for field in matched), matched)
+        return scores
+
+class TextSimilarityIndex:
+    """Índice LSH en memoria de firmas MinHash para detectar textos casi duplicados.
+
+    Cada documento se reduce a una firma de `num_perm` mínimos sobre sus
+    shingles de palabras; la fracción de posiciones iguales entre dos firmas
+    estima la similitud de Jaccard de sus textos. Las firmas se dividen en
+    bandas y solo se comparan los documentos que comparten alguna banda, de
+    modo que una consulta no recorre todo el corpus.
+    """
+    
+    MERSENNE_PRIME = (1 << 61) - 1
+    
+    def __init__(self, num_perm=64, bands=16, shingle_size=5):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        
+        # Permutaciones deterministas para que las firmas sean comparables entre ejecuciones
+        rng = random.Random(20240101)
+        self.permutations = [(rng.randrange(1, self.MERSENNE_PRIME), rng.randrange(0, self.MERSENNE_PRIME))
+                             for _ in range(num_perm)]
+        
+        self.documents = {}
+        self.buckets = {}
+    
+    def shingles(self, text):
+        """Conjunto de shingles (grupos de palabras consecutivas) del texto normalizado"""
+        words = text.lower().split()
+        if not words:
+            return set()
+        if len(words) < self.shingle_size:
+            return {zlib.crc32(' '.join(words).encode('utf-8'))}
+        return {zlib.crc32(' '.join(words[i:i + self.shingle_size]).encode('utf-8'))
+                for i in range(len(words) - self.shingle_size + 1)}
+    
+    def signature(self, text):
+        """Calcula la firma MinHash de un texto (None si no tiene palabras)"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        prime = self.MERSENNE_PRIME
+        return [min(((a * value + b) % prime) & 0xFFFFFFFF for value in shingles)
+                for a, b in self.permutations]
+    
+    def band_keys(self, signature):
+        for band in range(self.bands):
+            values = signature[band * self.rows:(band + 1) * self.rows]
+            yield f"{band}:{zlib.crc32(repr(list(values)).encode('utf-8'))}"
+    
+    def estimate_jaccard(self, sig_a, sig_b):
+        """Estima la similitud de Jaccard a partir de dos firmas"""
+        equal = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+        return equal / self.num_perm
+    
+    def _insert(self, file_path, doc):
+        self.documents[file_path] = doc
+        if doc['signature'] is not None:
+            for key in self.band_keys(doc['signature']):
+                self.buckets.setdefault(key, set()).add(file_path)
+    
+    def remove(self, file_path):
+        doc = self.documents.pop(file_path, None)
+        if doc and doc['signature'] is not None:
+            for key in self.band_keys(doc['signature']):
+                bucket = self.buckets.get(key)
+                if bucket:
+                    bucket.discard(file_path)
+    
+    def add(self, file_path, signature):
+        """Añade o reemplaza la firma de un documento (None si no tiene texto)"""
+        self.remove(file_path)
+        self._insert(file_path, {'signature': signature})
+    
+    def query(self, signature, threshold, candidates=None):
+        """Devuelve {ruta: jaccard_estimado} de los documentos con similitud >= threshold
+
+        `candidates` restringe el resultado a un conjunto de rutas (p. ej. la
+        carpeta de búsqueda actual).
+        """
+        matches = {}
+        if signature is None:
+            return matches
+        seen = set()
+        for key in self.band_keys(signature):
+            for file_path in self.buckets.get(key, ()):
+                if file_path in seen:
+                    continue
+                seen.add(file_path)
+                if candidates is not None and file_path not in candidates:
+                    continue
+                score = self.estimate_jaccard(signature, self.documents[file_path]['signature'])
+                if score >= threshold:
+                    matches[file_path] = score
+        return matches
+
+def difference_hash(samples, width, height, stride, hash_size=8):
+    """dHash de una imagen en escala de grises: compara celdas vecinas de una rejilla 9x8"""
+    cols, rows = hash_size + 1, hash_size
+    cells = []
+    for r in range(rows):
+        y0 = r * height // rows
+        y1 = max(y0 + 1, (r + 1) * height // rows)
+        row = []
+        for c in range(cols):
+            x0 = c * width // cols
+            x1 = max(x0 + 1, (c + 1) * width // cols)
+            total = 0
+            for y in range(y0, y1):
+                total += sum(samples[y * stride + x0:y * stride + x1])
+            row.append(total / ((y1 - y0) * (x1 - x0)))
+        cells.append(row)
+    
+    value = 0
+    for row in cells:
+        for c in range(hash_size):
+            value = (value << 1) | (1 if row[c] > row[c + 1] else 0)
+    return value
+
+def compute_visual_fingerprint(pdf_path, pages=1):
+    """Huella visual de las primeras páginas de un PDF: un dHash hexadecimal por página.
+
+    Renderiza cada página en gris a ~72 px por el lado mayor. Es una función
+    de módulo para poder ejecutarla en los procesos de extracción.
+    """
+    hashes = []
+    try:
+        with fitz.open(pdf_path) as doc:
+            for page_number in range(min(pages, len(doc))):
+                page = doc[page_number]
+                zoom = 72.0 / max(page.rect.width, page.rect.height, 1)
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+                value = difference_hash(pix.samples, pix.width, pix.height, pix.stride)
+                hashes.append(format(value, '016x'))
+    except Exception as e:
+        print(f"Error renderizando {pdf_path}: {str(e)}")
+    return hashes
+
+class BKTree:
+    """Árbol BK sobre la distancia de Hamming para consultar huellas visuales.
+
+    Cada nodo guarda un hash, las rutas que lo comparten y sus hijos por
+    distancia; la desigualdad triangular permite descartar ramas enteras.
+    Se mantiene al día con add/remove: un nodo que se queda sin rutas sigue
+    en el árbol para no reorganizar sus hijos.
+    """
+    
+    def __init__(self):
+        self.root = None
+        self.size = 0
+        self.values = {}
+    
+    @staticmethod
+    def hamming(a, b):
+        return bin(a ^ b).count('1')
+    
+    def find_node(self, value):
+        node = self.root
+        while node is not None:
+            distance = self.hamming(value, node[0])
+            if distance == 0:
+                return node
+            node = node[2].get(distance)
+        return None
+    
+    def add(self, value, item):
+        """Añade o reemplaza el hash de `item`"""
+        self.remove(item)
+        self.values[item] = value
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = self.hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+    
+    def remove(self, item):
+        value = self.values.pop(item, None)
+        if value is None:
+            return
+        node = self.find_node(value)
+        if node is not None and item in node[1]:
+            node[1].remove(item)
+            self.size -= 1
+    
+    def query(self, value, max_distance):
+        """Devuelve [(item, distancia)] de los hashes a distancia <= max_distance"""
+        results = []
+        pending = [self.root] if self.root else []
+        while pending:
+            node = pending.pop()
+            distance = self.hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((item, distance) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        return results
+
+PDFReference = namedtuple('PDFReference', 'num gen')
+
+class PDFInfoReader:
+    """Lector rápido del diccionario Info, el número de páginas, el /ID y el XMP de un PDF.
+
+    Lee solo el trailer, las referencias cruzadas (tabla o stream) y los
+    objetos necesarios a través de un mmap, sin construir el árbol de páginas
+    como hace fitz.open. Ante cualquier estructura que no entiende (cifrado,
+    filtros distintos de FlateDecode, xref dañada) lanza ValueError para que
+    el llamador recurra a fitz. Se usa una instancia por archivo.
+    """
+    
+    WHITESPACE = b' \t\r\n\x0c\x00'
+    DELIMITERS = b'()<>[]{}/%'
+    XREF_ENTRY = re.compile(rb'\s*(\d+)\s+(\d+)\s+([nf])')
+    INFO_KEYS = {
+        '/Title': 'title', '/Author': 'author', '/Subject': 'subject', '/Keywords': 'keywords',
+        '/Creator': 'creator', '/Producer': 'producer', '/CreationDate': 'creationDate',
+        '/ModDate': 'modDate', '/Trapped': 'trapped'
+    }
+    XMP_KEYS = {
+        'creator': 'xmp:CreatorTool', 'producer': 'pdf:Producer', 'creationDate': 'xmp:CreateDate',
+        'modDate': 'xmp:ModifyDate', 'documentID': 'xmpMM:DocumentID', 'instanceID': 'xmpMM:InstanceID'
+    }
+    
+    def __init__(self):
+        self.data = None
+        self.offsets = {}
+        self.object_streams = {}
+    
+    def read(self, pdf_path):
+        """Devuelve un dict con las claves de fitz (`doc.metadata`) más 'page_count', 'id' y 'xmp'"""
+        with open(pdf_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("Archivo vacío")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.data = data
+                try:
+                    return self._read_document()
+                except (IndexError, KeyError, TypeError, AttributeError, zlib.error, RecursionError) as e:
+                    raise ValueError(f"Estructura no soportada: {e}")
+                finally:
+                    self.data = None
+                    self.offsets = {}
+                    self.object_streams = {}
+    
+    def _read_document(self):
+        data = self.data
+        header = data[:1024]
+        version_match = re.search(rb'%PDF-(\d\.\d)', header)
+        if not version_match:
+            raise ValueError("Cabecera %PDF no encontrada")
+        
+        startxref = data.rfind(b'startxref', max(0, len(data) - 4096))
+        if startxref < 0:
+            raise ValueError("startxref no encontrado")
+        xref_offset, _ = self._parse(data, startxref + len('startxref'))
+        if not isinstance(xref_offset, int):
+            raise ValueError("startxref inválido")
+        
+        trailer = self._read_xref_chain(xref_offset)
+        if '/Encrypt' in trailer:
+            raise ValueError("PDF cifrado")
+        
+        metadata = {key: '' for key in self.INFO_KEYS.values()}
+        metadata['format'] = f"PDF {version_match.group(1).decode('ascii')}"
+        metadata['encryption'] = None
+        
+        info = self._resolve(trailer.get('/Info'))
+        if isinstance(info, dict):
+            for pdf_key, key in self.INFO_KEYS.items():
+                value = self._resolve(info.get(pdf_key))
+                if isinstance(value, bytes):
+                    metadata[key] = self._decode_text(value)
+                elif isinstance(value, str):
+                    metadata[key] = value.lstrip('/')
+        
+        catalog = self._resolve(trailer.get('/Root'))
+        if not isinstance(catalog, dict):
+            raise ValueError("Catálogo no encontrado")
+        pages = self._resolve(catalog.get('/Pages'))
+        page_count = self._resolve(pages.get('/Count')) if isinstance(pages, dict) else None
+        if not isinstance(page_count, int):
+            raise ValueError("Número de páginas no encontrado")
+        metadata['page_count'] = page_count
+        
+        file_id = self._resolve(trailer.get('/ID'))
+        metadata['id'] = [self._resolve(part).hex() for part in file_id] if isinstance(file_id, list) else []
+        
+        metadata['xmp'] = self._read_xmp(catalog)
+        # Los campos vacíos del Info se completan con el XMP (PDF 2.0 puede no tener Info)
+        for key in ('creator', 'producer', 'creationDate', 'modDate'):
+            if not metadata[key] and metadata['xmp'].get(key):
+                metadata[key] = metadata['xmp'][key]
+        return metadata
+    
+    # --- Referencias cruzadas ---
+    
+    def _read_xref_chain(self, offset):
+        """Recorre las secciones xref desde la más reciente; las entradas nuevas prevalecen"""
+        trailer = {}
+        visited = set()
+        pending = [offset]
+        while pending:
+            offset = pending.pop(0)
+            if offset in visited:
+                continue
+            visited.add(offset)
+            pos = self._skip_whitespace(self.data, offset)
+            if self.data[pos:pos + 4] == b'xref':
+                section_trailer = self._read_xref_table(pos + 4)
+                if isinstance(section_trailer.get('/XRefStm'), int):
+                    pending.insert(0, section_trailer['/XRefStm'])
+            else:
+                section_trailer = self._read_xref_stream(pos)
+            for key, value in section_trailer.items():
+                trailer.setdefault(key, value)
+            if isinstance(section_trailer.get('/Prev'), int):
+                pending.append(section_trailer['/Prev'])
+        return trailer
+    
+    def _read_xref_table(self, pos):
+        data = self.data
+        while True:
+            pos = self._skip_whitespace(data, pos)
+            if data[pos:pos + 7] == b'trailer':
+                trailer, _ = self._parse(data, pos + 7)
+                if not isinstance(trailer, dict):
+                    raise ValueError("Trailer inválido")
+                return trailer
+            start, pos = self._parse(data, pos)
+            count, pos = self._parse(data, pos)
+            if not isinstance(start, int) or not isinstance(count, int):
+                raise ValueError("Subsección xref inválida")
+            for num in range(start, start + count):
+                entry = self.XREF_ENTRY.match(data, pos)
+                if not entry:
+                    raise ValueError("Entrada xref inválida")
+                pos = entry.end()
+                if entry.group(3) == b'n':
+                    self.offsets.setdefault(num, (1, int(entry.group(1))))
+                else:
+                    self.offsets.setdefault(num, None)
+    
+    def _read_xref_stream(self, pos):
+        _, stream_dict, raw, _ = self._parse_indirect(self.data, pos)
+        if stream_dict is None or stream_dict.get('/Type') != '/XRef':
+            raise ValueError("Stream xref no encontrado")
+        decoded = self._decode_stream(stream_dict, raw)
+        widths = stream_dict['/W']
+        index = stream_dict.get('/Index', [0, stream_dict['/Size']])
+        pos = 0
+        for i in range(0, len(index), 2):
+            for num in range(index[i], index[i] + index[i + 1]):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(decoded[pos:pos + width], 'big') if width else None)
+                    pos += width
+                entry_type = 1 if fields[0] is None else fields[0]
+                if entry_type == 1:
+                    self.offsets.setdefault(num, (1, fields[1]))
+                elif entry_type == 2:
+                    self.offsets.setdefault(num, (2, fields[1], fields[2]))
+                else:
+                    self.offsets.setdefault(num, None)
+        return stream_dict
+    
+    # --- Objetos ---
+    
+    def _resolve(self, value, depth=0):
+        while isinstance(value, PDFReference):
+            if depth > 32:
+                raise ValueError("Referencias circulares")
+            value = self._get_object(value.num)
+            depth += 1
+        return value
+    
+    def _get_object(self, num, with_stream=False):
+        entry = self.offsets.get(num)
+        if entry is None:
+            return (None, None) if with_stream else None
+        if entry[0] == 1:
+            value, stream_dict, raw, _ = self._parse_indirect(self.data, entry[1], num)
+            if with_stream:
+                return stream_dict, raw
+            return value
+        if with_stream:
+            raise ValueError("Stream dentro de un object stream")
+        return self._get_compressed_object(entry[1], entry[2])
+    
+    def _get_compressed_object(self, stream_num, index):
+        if stream_num not in self.object_streams:
+            stream_dict, raw = self._get_object(stream_num, with_stream=True)
+            if stream_dict is None:
+                raise ValueError("Object stream no encontrado")
+            decoded = self._decode_stream(stream_dict, raw)
+            pos = 0
+            header = []
+            for _ in range(2 * stream_dict['/N']):
+                value, pos = self._parse(decoded, pos)
+                header.append(value)
+            offsets = [stream_dict['/First'] + header[i] for i in range(1, len(header), 2)]
+            self.object_streams[stream_num] = (decoded, offsets)
+        decoded, offsets = self.object_streams[stream_num]
+        value, _ = self._parse(decoded, offsets[index])
+        return value
+    
+    def _parse_indirect(self, data, pos, expected_num=None):
+        """Lee 'n g obj ... endobj'; devuelve (valor, dict_stream, datos_stream, pos)
+
+        Con `expected_num` la cabecera tiene que ser la de ese objeto: un
+        desplazamiento de la xref que apunta a otro objeto es una xref dañada.
+        """
+        num, pos = self._parse(data, pos)
+        gen, pos = self._parse(data, pos)
+        keyword, pos = self._parse(data, pos)
+        if not isinstance(num, int) or not isinstance(gen, int) or keyword != 'obj':
+            raise ValueError("Objeto indirecto inválido")
+        if expected_num is not None and num != expected_num:
+            raise ValueError(f"La xref apunta al objeto {num} en lugar del {expected_num}")
+        value, pos = self._parse(data, pos)
+        after = self._skip_whitespace(data, pos)
+        if isinstance(value, dict) and data[after:after + 6] == b'stream':
+            start = after + 6
+            if data[start:start + 2] == b'\r\n':
+                start += 2
+            elif data[start:start + 1] in (b'\n', b'\r'):
+                start += 1
+            length = self._resolve(value.get('/Length'))
+            if not isinstance(length, int):
+                raise ValueError("Longitud de stream inválida")
+            return value, value, data[start:start + length], start + length
+        return value, None, None, pos
+    
+    def _decode_stream(self, stream_dict, raw):
+        filters = stream_dict.get('/Filter')
+        params = stream_dict.get('/DecodeParms')
+        if isinstance(filters, list):
+            if len(filters) > 1:
+                raise ValueError("Filtros encadenados no soportados")
+            filters = filters[0] if filters else None
+            params = params[0] if isinstance(params, list) and params else params
+        if filters is None:
+            return raw
+        if filters != '/FlateDecode':
+            raise ValueError(f"Filtro no soportado: {filters}")
+        decoded = zlib.decompress(raw)
+        params = self._resolve(params)
+        if isinstance(params, dict) and params.get('/Predictor', 1) >= 10:
+            decoded = self._png_unpredict(decoded, params)
+        return decoded
+    
+    def _png_unpredict(self, data, params):
+        colors = params.get('/Colors', 1)
+        bits = params.get('/BitsPerComponent', 8)
+        columns = params.get('/Columns', 1)
+        bpp = max(1, colors * bits // 8)
+        row_length = (colors * bits * columns + 7) // 8
+        output = bytearray()
+        previous = bytearray(row_length)
+        for start in range(0, len(data), row_length + 1):
+            filter_type = data[start]
+            row = bytearray(data[start + 1:start + 1 + row_length])
+            for i in range(len(row)):
+                left = row[i - bpp] if i >= bpp else 0
+                up = previous[i]
+                if filter_type == 1:
+                    row[i] = (row[i] + left) & 0xFF
+                elif filter_type == 2:
+                    row[i] = (row[i] + up) & 0xFF
+                elif filter_type == 3:
+                    row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+                elif filter_type == 4:
+                    up_left = previous[i - bpp] if i >= bpp else 0
+                    p = left + up - up_left
+                    pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                    predictor = left if pa <= pb and pa <= pc else (up if pb <= pc else up_left)
+                    row[i] = (row[i] + predictor) & 0xFF
+            output += row
+            previous = row
+        return bytes(output)
+    
+    def _read_xmp(self, catalog):
+        """Extrae campos básicos del stream XMP del catálogo (si existe)"""
+        reference = catalog.get('/Metadata')
+        if not isinstance(reference, PDFReference):
+            return {}
+        try:
+            stream_dict, raw = self._get_object(reference.num, with_stream=True)
+            if stream_dict is None:
+                return {}
+            xmp = self._decode_stream(stream_dict, raw).decode('utf-8', errors='replace')
+        except ValueError:
+            return {}
+        return self.parse_xmp(xmp)
+    
+    def parse_xmp(self, xmp):
+        """Campos básicos de un paquete XMP (también se usa con el XMP que devuelve fitz)"""
+        fields = {}
+        for key, tag in self.XMP_KEYS.items():
+            match = (re.search(rf'<{tag}>\s*([^<]*?)\s*</{tag}>', xmp)
+                     or re.search(rf'{tag}="([^"]*)"', xmp))
+            if match and match.group(1):
+                value = html.unescape(match.group(1))
+                if key in ('creationDate', 'modDate'):
+                    value = self._xmp_date_to_pdf(value)
+                fields[key] = value
+        return fields
+    
+    def _xmp_date_to_pdf(self, value):
+        """Convierte una fecha XMP (ISO 8601) al formato D:AAAAMMDDHHmmSS"""
+        digits = re.sub(r'\D', '', value.split('+')[0].split('Z')[0][:19])
+        return f"D:{digits}" if digits else value
+    
+    def _decode_text(self, value):
+        if value.startswith(b'\xfe\xff'):
+            return value[2:].decode('utf-16-be', errors='replace')
+        if value.startswith(b'\xef\xbb\xbf'):
+            return value[3:].decode('utf-8', errors='replace')
+        return value.decode('latin-1')
+    
+    # --- Analizador léxico ---
+    
+    def _skip_whitespace(self, data, pos):
+        length = len(data)
+        while pos < length:
+            char = data[pos]
+            if char in self.WHITESPACE:
+                pos += 1
+            elif char == 0x25:  # comentario
+                while pos < length and data[pos] not in (0x0A, 0x0D):
+                    pos += 1
+            else:
+                break
+        return pos
+    
+    def _read_token(self, data, pos):
+        start = pos
+        length = len(data)
+        while pos < length and data[pos] not in self.WHITESPACE and data[pos] not in self.DELIMITERS:
+            pos += 1
+        return bytes(data[start:pos]), pos
+    
+    def _parse(self, data, pos):
+        """Analiza un objeto PDF en `pos`; devuelve (valor, nueva_pos)"""
+        pos = self._skip_whitespace(data, pos)
+        char = data[pos]
+        
+        if data[pos:pos + 2] == b'<<':
+            result = {}
+            pos += 2
+            while True:
+                pos = self._skip_whitespace(data, pos)
+                if data[pos:pos + 2] == b'>>':
+                    return result, pos + 2
+                key, pos = self._parse(data, pos)
+                value, pos = self._parse(data, pos)
+                result[key] = value
+        if char == 0x5B:  # [
+            result = []
+            pos += 1
+            while True:
+                pos = self._skip_whitespace(data, pos)
+                if data[pos] == 0x5D:  # ]
+                    return result, pos + 1
+                value, pos = self._parse(data, pos)
+                result.append(value)
+        if char == 0x28:  # (
+            return self._parse_literal_string(data, pos + 1)
+        if char == 0x3C:  # <
+            end = data.find(b'>', pos)
+            hex_digits = re.sub(rb'\s', b'', bytes(data[pos + 1:end]))
+            if len(hex_digits) % 2:
+                hex_digits += b'0'
+            return bytes.fromhex(hex_digits.decode('ascii')), end + 1
+        if char == 0x2F:  # /
+            token, pos = self._read_token(data, pos + 1)
+            name = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), token)
+            return '/' + name.decode('latin-1'), pos
+        
+        token, end = self._read_token(data, pos)
+        if not token:
+            raise ValueError(f"Token inesperado en {pos}")
+        if token == b'true':
+            return True, end
+        if token == b'false':
+            return False, end
+        if token == b'null':
+            return None, end
+        try:
+            number = int(token)
+        except ValueError:
+            try:
+                return float(token), end
+            except ValueError:
+                return token.decode('latin-1'), end
+        
+        # Referencia indirecta: "num gen R"
+        gen_pos = self._skip_whitespace(data, end)
+        gen_token, gen_end = self._read_token(data, gen_pos)
+        if gen_token.isdigit():
+            r_pos = self._skip_whitespace(data, gen_end)
+            if data[r_pos:r_pos + 1] == b'R' and (r_pos + 1 >= len(data) or data[r_pos + 1] in self.WHITESPACE
+                                                   or data[r_pos + 1] in self.DELIMITERS):
+                return PDFReference(number, int(gen_token)), r_pos + 1
+        return number, end
+    
+    def _parse_literal_string(self, data, pos):
+        result = bytearray()
+        depth = 1
+        escapes = {0x6E: 0x0A, 0x72: 0x0D, 0x74: 0x09, 0x62: 0x08, 0x66: 0x0C}
+        while True:
+            char = data[pos]
+            pos += 1
+            if char == 0x5C:  # barra invertida
+                char = data[pos]
+                pos += 1
+                if char in escapes:
+                    result.append(escapes[char])
+                elif 0x30 <= char <= 0x37:
+                    octal = chr(char)
+                    while len(octal) < 3 and 0x30 <= data[pos] <= 0x37:
+                        octal += chr(data[pos])
+                        pos += 1
+                    result.append(int(octal, 8) & 0xFF)
+                elif char == 0x0D:
+                    if data[pos] == 0x0A:
+                        pos += 1
+                elif char != 0x0A:
+                    result.append(char)
+            elif char == 0x28:
+                depth += 1
+                result.append(char)
+            elif char == 0x29:
+                depth -= 1
+                if depth == 0:
+                    return bytes(result), pos
+                result.append(char)
+            else:
+                result.append(char)
+
+def page_budget_ranges(page_count, first_pages=None, last_pages=0):
+    """Rangos [inicio, fin) de las páginas que cubre un presupuesto; None = todas"""
+    if first_pages is None or first_pages + last_pages >= page_count:
+        return [[0, page_count]]
+    ranges = [[0, first_pages]] if first_pages else []
+    if last_pages:
+        ranges.append([page_count - last_pages, page_count])
+    return ranges
+
+def read_page_text(doc, ranges=None):
+    """Texto de cada página de un documento fitz abierto; las que quedan fuera de `ranges` van vacías"""
+    if ranges is None:
+        return [page.get_text() for page in doc]
+    pages_text = [""] * len(doc)
+    for start, end in ranges:
+        for page_number in range(start, min(end, len(doc))):
+            pages_text[page_number] = doc[page_number].get_text()
+    return pages_text
+
+# Forma de búsqueda de cada carácter (se calcula una vez por carácter distinto)
+FOLDED_CHARS = {'ñ': 'ñ', 'Ñ': 'ñ'}
+
+def fold_char(char):
+    folded = FOLDED_CHARS.get(char)
+    if folded is None:
+        folded = ''.join(part for part in unicodedata.normalize('NFKD', char)
+                         if not unicodedata.combining(part)).casefold()
+        FOLDED_CHARS[char] = folded
+    return folded
+
+def fold_text(text):
+    """Forma normalizada de un texto para buscar: (texto, mapa de desplazamientos)
+
+    Se descompone en Unicode (NFKD), se quitan los acentos y se pasa a
+    minúsculas con casefold; la ñ se conserva. Un carácter puede quedar en
+    varios ('ß' → 'ss', ligaduras) o en ninguno (un acento suelto), así que
+    el mapa ([posiciones_normalizadas], [posiciones_originales]) anota cada
+    punto donde la correspondencia deja de ser uno a uno; original_offset lo
+    recorre. Un texto ASCII solo se pasa a minúsculas y su mapa va vacío.
+    """
+    if text.isascii():
+        return text.lower(), [[], []]
+    pieces = []
+    folded_positions = []
+    original_positions = []
+    folded_length = 0
+    delta = 0
+    for position, char in enumerate(text):
+        folded = FOLDED_CHARS.get(char)
+        if folded is None:
+            folded = fold_char(char)
+        for _ in folded:
+            if position - folded_length != delta:
+                delta = position - folded_length
+                folded_positions.append(folded_length)
+                original_positions.append(position)
+            folded_length += 1
+        pieces.append(folded)
+    return ''.join(pieces), [folded_positions, original_positions]
+
+def original_offset(offsets, position):
+    """Posición en el texto original de la posición `position` de su forma normalizada"""
+    folded_positions, original_positions = offsets
+    index = bisect.bisect_right(folded_positions, position) - 1
+    if index < 0:
+        return position
+    return original_positions[index] + position - folded_positions[index]
+
+def extraction_worker(conn, memory_limit_mb=None):
+    """Bucle de un proceso de extracción: recibe (tipo, ruta, opciones) y responde (ok, resultado)
+
+    Es una función de módulo para poder lanzarla con multiprocessing. Donde
+    existe el módulo resource, el límite de memoria se aplica al propio proceso.
+    """
+    if resource is not None and memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            print(f"No se pudo limitar la memoria del proceso: {e}")
+    
+    analyzer = PDFMetadataAnalyzer()
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        
+        kind, file_path, options = task
+        try:
+            if kind == 'document':
+                result = analyzer.extract_document(Path(file_path), options.get('primeras_paginas'),
+                                                   options.get('ultimas_paginas', 0),
+                                                   options.get('calcular_hash', True))
+            elif kind == 'text':
+                with fitz.open(file_path) as doc:
+                    result = (True, read_page_text(doc, options.get('paginas_extraidas')))
+            elif kind == 'visual':
+                result = (True, compute_visual_fingerprint(file_path, options.get('pages', 1)))
+            else:
+                result = (False, f"Tipo de extracción desconocido: {kind}")
+        except MemoryError:
+            result = (False, "Memoria agotada")
+        except Exception as e:
+            result = (False, str(e))
+        conn.send(result)
+
+class ExtractionSupervisor:
+    """Ejecuta extracciones en procesos vigilados con límite de tiempo y de memoria por archivo.
+
+    Un PDF que cuelga fitz o que tumba el intérprete solo afecta a su proceso:
+    el supervisor lo mata, arranca otro y anota el archivo en `quarantined`
+    para que el caché lo salte en las siguientes ejecuciones.
+    
+    Los procesos no tienen trabajo asignado de antemano: cada uno toma el
+    siguiente archivo pendiente en cuanto queda libre. `durations` anota los
+    segundos de cada extracción correcta (los usa el modelo de coste).
+    """
+    
+    # El aviso de memoria sin vigilar se muestra una vez por ejecución
+    memory_warning_shown = False
+    
+    def __init__(self, workers=None, timeout=120, memory_limit_mb=2048):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.quarantined = {}
+        self.durations = {}
+        if memory_limit_mb and resource is None and psutil is None and not ExtractionSupervisor.memory_warning_shown:
+            ExtractionSupervisor.memory_warning_shown = True
+            print(f"⚠ Sin límite de memoria para la extracción ({memory_limit_mb} MB): "
+                  "este sistema no tiene el módulo resource; instale psutil (pip install psutil) para vigilarla")
+    
+    def _start_worker(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=extraction_worker, args=(child_conn, self.memory_limit_mb),
+                                          daemon=True)
+        process.start()
+        child_conn.close()
+        return {'process': process, 'conn': parent_conn, 'task': None, 'started': None}
+    
+    def _stop_worker(self, worker, kill=False):
+        if kill:
+            worker['process'].kill()
+        else:
+            try:
+                worker['conn'].send(None)
+            except (OSError, ValueError):
+                pass
+        worker['process'].join(timeout=5)
+        if worker['process'].is_alive():
+            worker['process'].kill()
+            worker['process'].join()
+        worker['conn'].close()
+    
+    def _memory_exceeded(self, process):
+        """Vigila la memoria desde fuera cuando el proceso no puede limitarse a sí mismo (Windows)"""
+        if resource is not None or psutil is None or not self.memory_limit_mb:
+            return False
+        try:
+            return psutil.Process(process.pid).memory_info().rss > self.memory_limit_mb * 1024 * 1024
+        except psutil.Error:
+            return False
+    
+    def run(self, kind, pdf_files, options=None, should_stop=None, file_options=None):
+        """Extrae `kind` ('document', 'text' o 'visual') de cada PDF; genera (ruta, ok, resultado)
+
+        Los resultados llegan en orden de finalización. Si `should_stop()`
+        devuelve True se dejan de repartir archivos y se detienen los procesos.
+        `pdf_files` puede ser una queue.Queue que otro hilo va llenando (el
+        recorrido de carpetas) y cierra con None; los procesos se arrancan a
+        medida que hay trabajo. `file_options` ({ruta: opciones}) completa
+        `options` para archivos concretos.
+        """
+        source = pdf_files if isinstance(pdf_files, queue.Queue) else None
+        pending = deque() if source is not None else deque(pdf_files)
+        exhausted = source is None
+        workers = []
+        try:
+            while True:
+                if should_stop and should_stop():
+                    break
+                
+                # Archivos nuevos del recorrido, sin bloquear mientras haya extracciones en curso
+                busy_count = sum(1 for worker in workers if worker['task'] is not None)
+                while not exhausted:
+                    try:
+                        item = source.get(timeout=0.5) if not pending and not busy_count else source.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        exhausted = True
+                    else:
+                        pending.append(item)
+                
+                if not pending and not busy_count:
+                    if exhausted:
+                        break
+                    continue
+                
+                while len(workers) < min(self.workers, len(pending) + busy_count):
+                    workers.append(self._start_worker())
+                
+                for worker in workers:
+                    if worker['task'] is None and pending:
+                        worker['task'] = pending.popleft()
+                        worker['started'] = time.monotonic()
+                        task_options = dict(options or {}, **(file_options or {}).get(str(worker['task']), {}))
+                        worker['conn'].send((kind, str(worker['task']), task_options))
+                
+                busy = [worker['conn'] for worker in workers if worker['task'] is not None]
+                ready = multiprocessing.connection.wait(busy, timeout=0.5)
+                
+                for i, worker in enumerate(workers):
+                    if worker['task'] is None:
+                        continue
+                    pdf_file = worker['task']
+                    failure = None
+                    if worker['conn'] in ready:
+                        try:
+                            success, result = worker['conn'].recv()
+                        except (EOFError, OSError):
+                            failure = "El proceso de extracción terminó inesperadamente"
+                        else:
+                            worker['task'] = None
+                            if success:
+                                self.durations[str(pdf_file)] = time.monotonic() - worker['started']
+                            yield pdf_file, success, result
+                            continue
+                    elif time.monotonic() - worker['started'] > self.timeout:
+                        failure = f"Tiempo agotado ({self.timeout}s)"
+                    elif self._memory_exceeded(worker['process']):
+                        failure = f"Memoria excedida ({self.memory_limit_mb} MB)"
+                    elif not worker['process'].is_alive():
+                        failure = "El proceso de extracción terminó inesperadamente"
+                    
+                    if failure:
+                        print(f"⚠ {failure}: {pdf_file} - reiniciando proceso")
+                        self._stop_worker(worker, kill=True)
+                        workers[i] = self._start_worker()
+                        self.quarantined[str(pdf_file)] = failure
+                        yield pdf_file, False, failure
+        finally:
+            for worker in workers:
+                self._stop_worker(worker, kill=worker['task'] is not None)
+    
+    def quarantine_entries(self):
+        """Entradas de cuarentena para el caché: se saltan mientras el archivo no cambie"""
+        entries = {}
+        for file_path, reason in self.quarantined.items():
+            try:
+                file_stat = Path(file_path).stat()
+            except OSError:
+                continue
+            entries[file_path] = {
+                'tamaño': file_stat.st_size,
+                'modification_time': file_stat.st_mtime,
+                'motivo': reason,
+                'fecha': datetime.now().isoformat()
+            }
+        return entries
+
+class QueryResultCache:
+    """Caché LRU de resultados de consultas, con un número máximo de entradas.
+
+    Las claves incluyen la generación del almacén consultado, que cambia con
+    cualquier modificación de sus registros: un resultado nunca se sirve para
+    un almacén distinto del que lo produjo y las entradas viejas simplemente
+    dejan de usarse hasta que las expulsa el LRU.
+    """
+    
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+    
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class ExtractionCostModel:
+    """Coste estimado de extraer un PDF, aprendido de los escaneos anteriores.
+
+    Ajusta por mínimos cuadrados segundos ≈ fijo + por_mb * tamaño con las
+    extracciones observadas; las sumas decaen (DECAY) para seguir los cambios
+    de disco o de máquina y se guardan en `path` entre ejecuciones. Sin datos
+    suficientes se usan los valores por defecto.
+    """
+    
+    DECAY = 0.999
+    DEFAULT_FIXED = 0.05
+    DEFAULT_PER_MB = 0.05
+    
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.sums = {'n': 0.0, 'x': 0.0, 'y': 0.0, 'xx': 0.0, 'xy': 0.0}
+        self.lock = threading.Lock()
+        if self.path is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.sums.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+    
+    def observe(self, size, seconds):
+        """Añade una extracción de `size` bytes que tardó `seconds`"""
+        x = size / 1e6
+        with self.lock:
+            for key in self.sums:
+                self.sums[key] *= self.DECAY
+            self.sums['n'] += 1
+            self.sums['x'] += x
+            self.sums['y'] += seconds
+            self.sums['xx'] += x * x
+            self.sums['xy'] += x * seconds
+    
+    def coefficients(self):
+        """(segundos fijos por archivo, segundos por MB)"""
+        with self.lock:
+            n, x, y, xx, xy = (self.sums[key] for key in ('n', 'x', 'y', 'xx', 'xy'))
+        if n < 2:
+            return self.DEFAULT_FIXED, self.DEFAULT_PER_MB
+        denominator = n * xx - x * x
+        if denominator <= 1e-9:
+            # Todos del mismo tamaño: solo se sabe el coste medio
+            return y / n, self.DEFAULT_PER_MB
+        per_mb = max(0.0, (n * xy - x * y) / denominator)
+        return max(0.0, (y - per_mb * x) / n), per_mb
+    
+    def estimate(self, size):
+        fixed, per_mb = self.coefficients()
+        return fixed + per_mb * size / 1e6
+    
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            with self.lock:
+                data = json.dumps(self.sums)
+            temp_file = self.path.with_suffix('.tmp')
+            temp_file.write_text(data, encoding='utf-8')
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            print(f"Error guardando el modelo de coste: {e}")
+
+class ExtractionPipeline:
+    """Escaneo por etapas orquestado con asyncio, con colas acotadas entre ellas.
+
+    recorrido → lectura → extracción → hash → escritura. El recorrido llena
+    la primera cola desde sus hilos; la lectura trae cada PDF a la caché del
+    sistema en un pool de hilos, por bloques de READ_CHUNK y sin retener los
+    bytes; los metadatos y el texto se extraen en los procesos vigilados del
+    supervisor; el SHA-256 se calcula en otro pool leyendo el archivo por
+    bloques (ya en la caché) y la escritura en el almacén la hace un único
+    hilo. Así el disco no espera a fitz ni fitz al disco, y por las colas
+    acotadas solo pasan rutas: la memoria no crece con el tamaño de los PDFs.
+
+    Cada cola se nombra por la etapa que la consume: la que pasa más tiempo
+    llena señala el cuello de botella (ver report()).
+    
+    Lo que entrega el recorrido no pasa a la lectura en el orden del disco:
+    espera en una cola de prioridad y se lee primero lo de mayor coste
+    estimado (cost_model, aprendido de ejecuciones anteriores). Así los PDFs
+    enormes empiezan pronto y el final del escaneo lo ocupan los pequeños,
+    repartidos entre los procesos que van quedando libres, en lugar de una
+    cola de un solo proceso con el último archivo grande.
+    """
+    
+    QUEUES = ('lectura', 'extraccion', 'hash', 'escritura')
+    READ_CHUNK = 1024 * 1024
+    
+    def __init__(self, supervisor, read_workers=4, hash_workers=2, queue_size=8, cost_model=None):
+        self.supervisor = supervisor
+        self.read_workers = read_workers
+        self.hash_workers = hash_workers
+        self.queue_size = queue_size
+        self.cost_model = cost_model or ExtractionCostModel()
+        self.queues = {}
+        self.metrics = {}
+    
+    def run(self, walk, store_result, options=None, should_stop=None):
+        """Ejecuta la canalización completa; devuelve las métricas de las colas
+
+        `walk(submit)` recorre las carpetas y llama a submit(ruta, tamaño) desde
+        sus hilos por cada PDF a extraer; `store_result(ruta, ok, resultado)`
+        es la etapa de escritura. Al terminar se guarda el modelo de coste.
+        """
+        self.metrics = {name: {'capacidad': self.queue_size, 'maxima': 0, 'suma': 0, 'muestras': 0, 'elementos': 0}
+                        for name in self.QUEUES}
+        start = time.perf_counter()
+        asyncio.run(self._run(walk, store_result, options or {}, should_stop))
+        self.metrics['segundos'] = round(time.perf_counter() - start, 3)
+        self.cost_model.save()
+        return self.summary()
+    
+    async def _run(self, walk, store_result, options, should_stop):
+        loop = asyncio.get_running_loop()
+        self.queues = {name: asyncio.Queue(self.queue_size) for name in self.QUEUES}
+        read_pool = concurrent.futures.ThreadPoolExecutor(self.read_workers)
+        hash_pool = concurrent.futures.ThreadPoolExecutor(self.hash_workers)
+        write_pool = concurrent.futures.ThreadPoolExecutor(1)
+        # Lo descubierto espera aquí por coste estimado, de mayor a menor (sin límite: solo son rutas)
+        schedule = asyncio.PriorityQueue()
+        order = itertools.count()
+        # El supervisor consume una queue.Queue; los huecos limitan los PDFs leídos en espera de un proceso
+        parse_source = queue.Queue()
+        parse_slots = asyncio.Semaphore(self.supervisor.workers * 2)
+        in_flight = {}
+        parser_done = False
+        failed = False
+        
+        def stopping():
+            return failed or bool(should_stop and should_stop())
+        
+        async def put(name, item):
+            await self.queues[name].put(item)
+            metrics = self.metrics[name]
+            depth = self.queues[name].qsize()
+            metrics['maxima'] = max(metrics['maxima'], depth)
+            metrics['suma'] += depth
+            metrics['muestras'] += 1
+        
+        async def get(name):
+            item = await self.queues[name].get()
+            if item is not None:
+                self.metrics[name]['elementos'] += 1
+            return item
+        
+        def submit(pdf_file, size=None):
+            if size is None:
+                try:
+                    size = Path(pdf_file).stat().st_size
+                except OSError:
+                    size = 0
+            item = (-self.cost_model.estimate(size), next(order), pdf_file)
+            asyncio.run_coroutine_threadsafe(schedule.put(item), loop).result()
+        
+        async def walk_stage():
+            try:
+                await loop.run_in_executor(None, walk, submit)
+            except Exception as e:
+                print(f"Error recorriendo carpetas: {e}")
+            finally:
+                await schedule.put((float('inf'), next(order), None))
+        
+        async def schedule_stage():
+            while True:
+                _, _, pdf_file = await schedule.get()
+                if pdf_file is None:
+                    break
+                if not stopping():
+                    await put('lectura', pdf_file)
+            for _ in range(self.read_workers):
+                await put('lectura', None)
+        
+        def warm_up(pdf_file):
+            """Lee el archivo por bloques para llevarlo a la caché del sistema; devuelve los bytes leídos"""
+            size = 0
+            with open(pdf_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.READ_CHUNK), b''):
+                    size += len(chunk)
+            return size
+        
+        async def read_worker():
+            while True:
+                pdf_file = await get('lectura')
+                if pdf_file is None:
+                    return
+                if stopping():
+                    continue
+                try:
+                    size = await loop.run_in_executor(read_pool, warm_up, pdf_file)
+                except OSError:
+                    # La extracción informará del error
+                    size = None
+                await put('extraccion', (pdf_file, size))
+        
+        async def read_stage():
+            await asyncio.gather(*(read_worker() for _ in range(self.read_workers)))
+            await put('extraccion', None)
+        
+        async def feed_parser():
+            while True:
+                item = await get('extraccion')
+                if item is None:
+                    break
+                if stopping() or parser_done:
+                    continue
+                await parse_slots.acquire()
+                in_flight[str(item[0])] = item[1]
+                parse_source.put(item[0])
+            parse_source.put(None)
+        
+        async def parsed(pdf_file, success, result):
+            parse_slots.release()
+            size = in_flight.pop(str(pdf_file), None)
+            seconds = self.supervisor.durations.pop(str(pdf_file), None)
+            if seconds is not None and size is not None:
+                self.cost_model.observe(size, seconds)
+            await put('hash', (pdf_file, success, result))
+        
+        def parse():
+            for pdf_file, success, result in self.supervisor.run('document', parse_source, options, stopping):
+                asyncio.run_coroutine_threadsafe(parsed(pdf_file, success, result), loop).result()
+        
+        async def parse_stage():
+            nonlocal parser_done
+            feeder = asyncio.ensure_future(feed_parser())
+            try:
+                await loop.run_in_executor(None, parse)
+            finally:
+                # Si el supervisor se detuvo antes, el alimentador no debe quedarse esperando hueco
+                parser_done = True
+                for _ in range(self.queue_size + self.supervisor.workers * 2):
+                    parse_slots.release()
+                await feeder
+            for _ in range(self.hash_workers):
+                await put('hash', None)
+        
+        async def hash_worker():
+            while True:
+                item = await get('hash')
+                if item is None:
+                    return
+                pdf_file, success, result = item
+                if success and not result.get('hash_sha256'):
+                    try:
+                        result['hash_sha256'] = await loop.run_in_executor(hash_pool, file_sha256, pdf_file,
+                                                                           self.READ_CHUNK)
+                    except OSError as e:
+                        success, result = False, f"Error al calcular el hash: {e}"
+                await put('escritura', (pdf_file, success, result))
+        
+        async def hash_stage():
+            await asyncio.gather(*(hash_worker() for _ in range(self.hash_workers)))
+            await put('escritura', None)
+        
+        async def write_stage():
+            while True:
+                item = await get('escritura')
+                if item is None:
+                    return
+                await loop.run_in_executor(write_pool, store_result, *item)
+        
+        try:
+            await asyncio.gather(walk_stage(), schedule_stage(), read_stage(), parse_stage(), hash_stage(),
+                                 write_stage())
+        except BaseException:
+            # Una etapa falló: el hilo del supervisor no debe quedarse esperando archivos
+            failed = True
+            parse_source.put(None)
+            raise
+        finally:
+            for pool in (read_pool, hash_pool, write_pool):
+                pool.shutdown(wait=False)
+    
+    def summary(self):
+        """Profundidad máxima y media de cada cola y la etapa que hace de cuello de botella"""
+        queues = {}
+        for name in self.QUEUES:
+            metrics = self.metrics[name]
+            queues[name] = {'capacidad': metrics['capacidad'], 'maxima': metrics['maxima'],
+                            'media': round(metrics['suma'] / metrics['muestras'], 2) if metrics['muestras'] else 0.0,
+                            'elementos': metrics['elementos']}
+        bottleneck = max(self.QUEUES, key=lambda name: queues[name]['media'])
+        return {'colas': queues, 'cuello_de_botella': bottleneck if queues[bottleneck]['media'] else None,
+                'segundos': self.metrics.get('segundos')}
+    
+    def report(self):
+        summary = self.summary()
+        depths = ", ".join(f"{name} {data['media']}/{data['capacidad']} (máx {data['maxima']})"
+                           for name, data in summary['colas'].items())
+        return f"Colas de la canalización: {depths} - cuello de botella: {summary['cuello_de_botella'] or 'ninguno'}"
+
+TextEntry = namedtuple('TextEntry', 'pages folded offsets')
+
+class TextBlobStore:
+    """Caché del texto de los documentos con presupuesto de memoria y de disco.
+
+    Cada entrada (TextEntry) guarda el texto de las páginas y, calculada una
+    sola vez, su forma normalizada para buscar (fold_text del texto completo)
+    con el mapa de desplazamientos al original. Se guarda comprimida (zlib)
+    en su propio archivo bajo `directory` y las más usadas se mantienen
+    además en memoria, ya descomprimidas; los fríos se expulsan de la
+    memoria y se vuelven a leer del disco cuando una búsqueda los necesita.
+    `memory_budget` cuenta lo que ocupan de verdad en memoria (páginas,
+    forma normalizada y mapa, ver memory_size_of); `disk_budget`, los bytes
+    de los archivos comprimidos. Se expulsan los menos usados; un texto
+    expulsado de los dos niveles lo vuelve a extraer el almacén de documentos.
+    """
+    
+    def __init__(self, directory, memory_budget=256 * 1024 * 1024, disk_budget=8 * 1024 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.disk = None
+        self.disk_size = 0
+        self.stats = {'aciertos_memoria': 0, 'lecturas_disco': 0, 'fallos': 0,
+                      'expulsiones_memoria': 0, 'expulsiones_disco': 0, 'reextracciones': 0}
+        self.lock = threading.Lock()
+    
+    def blob_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.z"
+    
+    def load_disk_index(self):
+        """Índice LRU de los textos en disco, del menos al más reciente (se crea al primer uso)"""
+        if self.disk is not None:
+            return
+        entries = []
+        if self.directory.exists():
+            for sub_dir in os.scandir(self.directory):
+                if sub_dir.is_dir():
+                    for entry in os.scandir(sub_dir.path):
+                        if entry.name.endswith('.z'):
+                            file_stat = entry.stat()
+                            entries.append((file_stat.st_mtime, entry.path, file_stat.st_size))
+        entries.sort()
+        self.disk = OrderedDict((file_path, size) for _, file_path, size in entries)
+        self.disk_size = sum(self.disk.values())
+    
+    def get(self, key):
+        """Páginas de texto de `key`, o None si no están en ningún nivel"""
+        entry = self.get_entry(key)
+        return entry.pages if entry is not None else None
+    
+    def get_entry(self, key):
+        """TextEntry de `key`, o None si no está en ningún nivel"""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats['aciertos_memoria'] += 1
+                return self.memory[key][0]
+        
+        blob_path = self.blob_path(key)
+        try:
+            with open(blob_path, 'rb') as f:
+                blob = f.read()
+            data = json.loads(zlib.decompress(blob).decode('utf-8'))
+        except (OSError, ValueError, zlib.error):
+            with self.lock:
+                self.stats['fallos'] += 1
+            return None
+        
+        if isinstance(data, list):
+            # Texto guardado sin forma normalizada: se calcula ahora y se reescribe
+            return self.put(key, data)
+        entry = TextEntry(data['paginas'], data['normalizado'], data['mapa'])
+        size = self.memory_size_of(entry)
+        with self.lock:
+            self.stats['lecturas_disco'] += 1
+            self.load_disk_index()
+            if str(blob_path) in self.disk:
+                self.disk.move_to_end(str(blob_path))
+            self.remember(key, entry, size)
+        return entry
+    
+    def put(self, key, pages, folded=None):
+        """Guarda el texto en disco (comprimido) y en memoria; devuelve su TextEntry
+
+        `folded` es el resultado de fold_text del texto completo si ya se
+        calculó (en el proceso de extracción); si no, se calcula aquí.
+        """
+        folded_text, offsets = folded or fold_text("".join(pages))
+        entry = TextEntry(pages, folded_text, offsets)
+        blob_path = self.blob_path(key)
+        data = zlib.compress(json.dumps({'paginas': pages, 'normalizado': folded_text, 'mapa': offsets},
+                                        ensure_ascii=False).encode('utf-8'), 6)
+        try:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = blob_path.with_name(f"{blob_path.name}.{threading.get_ident()}.tmp")
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, blob_path)
+        except OSError as e:
+            print(f"Error guardando texto en caché: {e}")
+            return entry
+        
+        size = self.memory_size_of(entry)
+        with self.lock:
+            self.load_disk_index()
+            self.disk_size += len(data) - self.disk.pop(str(blob_path), 0)
+            self.disk[str(blob_path)] = len(data)
+            self.remember(key, entry, size)
+            self.evict_disk()
+        return entry
+    
+    @staticmethod
+    def memory_size_of(entry):
+        """Bytes que ocupa una entrada descomprimida: textos de las páginas, forma normalizada y mapa"""
+        size = sys.getsizeof(entry.pages) + sum(sys.getsizeof(page) for page in entry.pages)
+        size += sys.getsizeof(entry.folded)
+        for positions in entry.offsets:
+            size += sys.getsizeof(positions) + sum(sys.getsizeof(position) for position in positions)
+        return size
+    
+    def remember(self, key, entry, size):
+        """Guarda la entrada en memoria (`size`: memory_size_of) y expulsa las menos usadas si sobra"""
+        if key in self.memory:
+            self.memory_size -= self.memory.pop(key)[1]
+        self.memory[key] = (entry, size)
+        self.memory_size += size
+        while self.memory_size > self.memory_budget and len(self.memory) > 1:
+            _, (_, evicted_size) = self.memory.popitem(last=False)
+            self.memory_size -= evicted_size
+            self.stats['expulsiones_memoria'] += 1
+    
+    def evict_disk(self):
+        while self.disk_size > self.disk_budget and len(self.disk) > 1:
+            file_path, size = self.disk.popitem(last=False)
+            self.disk_size -= size
+            self.stats['expulsiones_disco'] += 1
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+    
+    def statistics(self):
+        with self.lock:
+            self.load_disk_index()
+            return dict(self.stats,
+                        en_memoria=len(self.memory), bytes_memoria=self.memory_size,
+                        en_disco=len(self.disk), bytes_disco=self.disk_size)
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA256 de un archivo leído por bloques (no lo carga entero en memoria)"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def timestamp_ns(value):
+    """Marca de tiempo entera en nanosegundos de un mtime en segundos, un datetime o su texto ISO
+
+    Un entero se considera ya en nanosegundos. Dos mtimes se comparan por
+    este valor: el que devuelve un DocumentRecord no es idéntico al float de
+    os.stat, pero su conversión sí lo es.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return round(value * 1e9)
+
+class DocumentRecord(MutableMapping):
+    """Registro compacto de un documento del almacén, con vista de diccionario.
+
+    Con cientos de miles de documentos en memoria un diccionario por registro
+    ocupa mucho más que sus datos. Aquí los campos conocidos van en slots;
+    los textos que se repiten entre documentos (creador, productor, 'No
+    disponible'...) se internan, el SHA-256 ocupa sus 32 bytes, las fechas
+    de modificación son enteros en nanosegundos, la firma MinHash un array
+    de enteros de 32 bits y las tuplas repetidas (fuentes, rangos de
+    páginas) se comparten. Hacia fuera se lee como el diccionario de
+    siempre: el hash en hexadecimal, 'modificado' como datetime y
+    'modification_time' en segundos (compárese con timestamp_ns). Las claves
+    que no están en FIELDS van a un diccionario aparte. La tabla de rasgos no
+    se guarda: features() la calcula de los propios campos cuando se necesita.
+    """
+    
+    FIELDS = ('ruta', 'nombre', 'tamaño', 'modificado', 'hash_sha256', 'creador', 'productor', 'titulo', 'asunto',
+              'palabras_clave', 'fecha_creacion', 'fecha_modificacion', 'paginas', 'version_pdf', 'id_trailer',
+              'xmp_document_id', 'xmp_instance_id', 'modification_time', 'fuentes', 'paginas_extraidas',
+              'texto_completo', 'firma_minhash', 'huella_rapida', 'huella_visual')
+    INTERNED = frozenset(('creador', 'productor', 'titulo', 'asunto', 'palabras_clave', 'fecha_creacion',
+                          'fecha_modificacion', 'version_pdf', 'xmp_document_id', 'xmp_instance_id'))
+    __slots__ = FIELDS + ('extra',)
+    SLOTS = frozenset(FIELDS)
+    # Tuplas que se repiten entre registros (juegos de fuentes, rangos de páginas): una sola copia
+    shared_values = {}
+    
+    def __init__(self, values=()):
+        self.extra = None
+        self.update(values)
+    
+    @classmethod
+    def shared(cls, value):
+        return cls.shared_values.setdefault(value, value)
+    
+    def __setitem__(self, key, value):
+        if key not in self.SLOTS:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+        if value is None:
+            pass
+        elif key in self.INTERNED:
+            if isinstance(value, str):
+                value = sys.intern(value)
+        elif key == 'hash_sha256':
+            try:
+                value = bytes.fromhex(value)
+            except (TypeError, ValueError):
+                pass
+        elif key in ('modificado', 'modification_time'):
+            value = timestamp_ns(value)
+        elif key == 'firma_minhash':
+            value = array('I', value)
+        elif key == 'id_trailer':
+            value = tuple(sys.intern(item) for item in value)
+        elif key == 'fuentes':
+            value = self.shared(tuple(sys.intern(item) for item in value))
+        elif key == 'paginas_extraidas':
+            value = self.shared(tuple(tuple(pages) for pages in value))
+        setattr(self, key, value)
+    
+    def __getitem__(self, key):
+        if key in self.SLOTS:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if value is None:
+                return value
+            if key == 'hash_sha256' and isinstance(value, bytes):
+                return value.hex()
+            if key == 'modificado':
+                return datetime.fromtimestamp(value / 1e9)
+            if key == 'modification_time':
+                return value / 1e9
+            return value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+    
+    def __delitem__(self, key):
+        if key in self.SLOTS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+    
+    def __contains__(self, key):
+        if key in self.SLOTS:
+            return hasattr(self, key)
+        return bool(self.extra) and key in self.extra
+    
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.extra:
+            yield from list(self.extra)
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __repr__(self):
+        return f"DocumentRecord({dict(self)!r})"
+    
+    def features(self):
+        """Tabla de rasgos del registro (compute_features), calculada en cada llamada"""
+        return compute_features(self)
+    
+    def serializable(self):
+        """Diccionario listo para JSON (la fecha de modificación en ISO)"""
+        data = dict(self)
+        if data.get('modificado') is not None:
+            data['modificado'] = data['modificado'].isoformat()
+        if data.get('firma_minhash') is not None:
+            data['firma_minhash'] = data['firma_minhash'].tolist()
+        return data
+
+class DocumentStore:
+    """Almacén único de documentos de una carpeta, compartido por las dos pestañas.
+
+    Cada registro reúne los metadatos de un PDF, el texto de cada página y sus
+    huellas (SHA256, firma MinHash y huella visual), de modo que una sola
+    pasada de extracción abre cada archivo una vez para todo. En memoria cada
+    registro es un DocumentRecord (compacto, con vista de diccionario). En disco es un
+    archivo JSON Lines por carpeta: una cabecera con el árbol de carpetas y la
+    cuarentena, y una línea por documento. El texto de las páginas no va en
+    ese archivo sino en la caché de textos (TextBlobStore), que limita lo que
+    ocupa en memoria y en disco.
+
+    Con un presupuesto de páginas (`page_budget` = (primeras, últimas)) la
+    primera pasada solo extrae esas páginas; cada registro anota en
+    'paginas_extraidas' los rangos leídos y en 'texto_completo' si los cubren
+    todos. extend_text completa el resto cuando una consulta lo necesita o
+    en los ratos libres del indexador.
+
+    Los resultados de extracción también se localizan por contenido: un PDF
+    con el mismo tamaño y la misma huella rápida que un registro conocido
+    (una copia o un archivo renombrado) reutiliza sus metadatos, texto y
+    huellas sin volver a abrirse.
+    """
+    
+    VERSION = 1
+    QUICK_CHUNK = 64 * 1024
+    CHECKPOINT_SECONDS = 30
+    # Cada cuánto un refresco hace stat de todos los PDFs (los editados en su sitio sin evento)
+    FULL_CHECK_SECONDS = 24 * 3600
+    # Fragmentos de contexto que se guardan por documento en una búsqueda de texto
+    MAX_HITS = 3
+    SNIPPET_CONTEXT = 40
+    
+    def __init__(self, cache_dir, search_folder, supervisor_factory=None, result_cache=None, directory_builder=None,
+                 text_store=None, page_budget=None, pipeline_factory=None):
+        self.search_folder = search_folder
+        self.supervisor_factory = supervisor_factory or ExtractionSupervisor
+        self.pipeline_factory = pipeline_factory or ExtractionPipeline
+        self.pipeline_metrics = None
+        self.directory_builder = directory_builder or DirectoryTree()
+        # Los filtros forman parte de la clave: cada configuración tiene su propio almacén
+        self.filter_key = self.directory_builder.filters.cache_key()
+        folder_key = hashlib.sha1((search_folder + self.filter_key).encode('utf-8')).hexdigest()[:16]
+        self.store_file = Path(cache_dir) / f"documentos_{folder_key}.jsonl"
+        self.text_index = TextSimilarityIndex()
+        self.feature_index = FeatureIndex(self.document_features)
+        self.visual_index = BKTree()
+        self.documents = {}
+        self.directory_tree = None
+        # Última revisión completa de los archivos (segundos desde epoch)
+        self.files_checked = None
+        self.quarantine = {}
+        self.loaded = False
+        self.disk_mtime = None
+        # Cambia con cada modificación de los registros; invalida los resultados en caché
+        self.generation = 0
+        self.result_cache = result_cache
+        self.text_store = text_store or TextBlobStore(Path(cache_dir) / 'textos')
+        self.page_budget = page_budget or (None, 0)
+        # Consultas permanentes que se comprueban con cada archivo nuevo o modificado
+        self.watchlist = None
+        # `lock` protege los registros y los índices y solo se toma el tiempo de
+        # aplicarlos o consultarlos; `update_lock` ordena los refrescos (las dos
+        # pestañas o el indexador pueden refrescar el mismo almacén). Nunca se
+        # toma update_lock con lock en la mano.
+        self.lock = threading.RLock()
+        self.update_lock = threading.Lock()
+        self.refreshing = False
+    
+    def load(self):
+        """Carga el almacén desde disco; devuelve el estado de la carga"""
+        self.generation += 1
+        self.documents = {}
+        self.text_index = TextSimilarityIndex()
+        self.feature_index = FeatureIndex(self.document_features)
+        self.visual_index = BKTree()
+        self.directory_tree = None
+        self.files_checked = None
+        self.quarantine = {}
+        self.loaded = True
+        self.inline_text = False
+        self.disk_mtime = self.read_disk_mtime()
+        if self.disk_mtime is None:
+            return "No existe almacén de documentos"
+        try:
+            with open(self.store_file, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if (header.get('version') != self.VERSION or header.get('search_folder') != self.search_folder
+                        or header.get('filtros', {}) != self.directory_builder.filters.as_dict()):
+                    return "Almacén de otra versión o carpeta"
+                for line in f:
+                    try:
+                        document = json.loads(line)
+                    except ValueError:
+                        # Última línea a medias de un escaneo que se cortó
+                        print(f"Registro incompleto descartado en {self.store_file.name}")
+                        continue
+                    self.add_document(document)
+            self.directory_tree = header.get('directory_tree')
+            self.files_checked = header.get('revision_archivos')
+            self.quarantine = header.get('quarantine', {})
+            if self.inline_text:
+                # Almacén antiguo con el texto en cada línea: ya se pasó a la caché de textos
+                self.save()
+            return "Almacén cargado"
+        except Exception as e:
+            print(f"Error cargando almacén de documentos: {e}")
+            self.documents = {}
+            self.text_index = TextSimilarityIndex()
+            self.feature_index = FeatureIndex(self.document_features)
+            self.visual_index = BKTree()
+            return f"Error: {str(e)}"
+    
+    def save(self):
+        """Guarda el almacén completo (se escribe en un temporal y se reemplaza)"""
+        try:
+            temp_file = self.store_file.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                header = {
+                    'version': self.VERSION,
+                    'search_folder': self.search_folder,
+                    'filtros': self.directory_builder.filters.as_dict(),
+                    'directory_tree': self.directory_tree,
+                    'revision_archivos': self.files_checked,
+                    'quarantine': self.quarantine,
+                    'cache_date': datetime.now().isoformat(),
+                    'total_files': len(self.documents)
+                }
+                f.write(json.dumps(header, ensure_ascii=False) + '\n')
+                for document in self.documents.values():
+                    f.write(self.serialize_document(document))
+            os.replace(temp_file, self.store_file)
+            self.disk_mtime = self.read_disk_mtime()
+            print(f"Almacén de documentos guardado: {len(self.documents)} archivos")
+        except Exception as e:
+            print(f"Error guardando almacén de documentos: {e}")
+    
+    def ensure_loaded(self):
+        """Carga el almacén si aún no está en memoria o si otro proceso lo reescribió"""
+        with self.lock:
+            # Durante un refresco el archivo crece con los puntos de control: no es otro proceso
+            if self.loaded and (self.refreshing or not self.changed_on_disk()):
+                return "Almacén en memoria"
+            return self.load()
+    
+    def search_hits(self, search_string, should_stop=None, full_coverage=False, max_hits=None):
+        """Genera (ruta, aciertos) de los documentos cuyo texto contiene `search_string`
+
+        La búsqueda no distingue mayúsculas ni acentos: se compara la consulta
+        normalizada con fold_text contra la forma normalizada que guarda la
+        caché de textos. `aciertos` es {'total': N,
+        'aciertos': [...]} con como mucho `max_hits` (MAX_HITS) entradas
+        {'pagina', 'inicio', 'fin', 'fragmento'}: la página (desde 1), los
+        desplazamientos dentro del texto de esa página y un fragmento de
+        contexto, todo sacado del texto en caché sin abrir el PDF.
+
+        Una búsqueda completa queda en la caché de resultados hasta que el
+        almacén cambie; repetirla no vuelve a recorrer los textos. Con
+        `full_coverage` antes se completa el texto de los documentos que el
+        presupuesto de páginas dejó a medias.
+        """
+        if full_coverage:
+            self.extend_text(should_stop=should_stop)
+        needle = fold_text(search_string)[0]
+        max_hits = self.MAX_HITS if max_hits is None else max_hits
+        cache_key = ('texto', self.search_folder, self.filter_key, self.generation, needle, max_hits)
+        if self.result_cache is not None:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                yield from cached
+                return
+        
+        found_files = []
+        # Textos que la caché ya expulsó: se vuelven a extraer todos juntos al final
+        missing = {}
+        for file_path in list(self.documents):
+            if should_stop and should_stop():
+                return
+            document = self.documents.get(file_path)
+            if document is None:
+                continue
+            entry = self.text_store.get_entry(self.text_key(document))
+            if entry is None:
+                missing[file_path] = document
+                continue
+            hits = self.find_hits(entry, needle, max_hits)
+            if hits['total']:
+                found_files.append((file_path, hits))
+                yield file_path, hits
+        
+        for file_path, entry in self.recover_texts(missing.values(), should_stop):
+            hits = self.find_hits(entry, needle, max_hits)
+            if hits['total']:
+                found_files.append((file_path, hits))
+                yield file_path, hits
+        if should_stop and should_stop():
+            return
+        
+        if self.result_cache is not None:
+            self.result_cache.put(cache_key, found_files)
+    
+    def search_text(self, search_string, should_stop=None, full_coverage=False):
+        """Genera solo las rutas de search_hits"""
+        for file_path, _ in self.search_hits(search_string, should_stop, full_coverage):
+            yield file_path
+    
+    def find_hits(self, entry, needle, max_hits):
+        """Cuenta las apariciones de `needle` (normalizada) y sitúa las primeras `max_hits`
+
+        Se busca en la forma normalizada del texto completo, así que también
+        se encuentran las que cruzan de una página a la siguiente (se sitúan
+        en la página donde empiezan). Las posiciones y el fragmento se
+        traducen al texto original con el mapa de desplazamientos.
+        """
+        if entry is None or not needle:
+            return {'total': 0, 'aciertos': []}
+        total = entry.folded.count(needle)
+        hits = []
+        if total:
+            text = "".join(entry.pages)
+            page_starts = []
+            offset = 0
+            for page in entry.pages:
+                page_starts.append(offset)
+                offset += len(page)
+            position = entry.folded.find(needle)
+            while position >= 0 and len(hits) < max_hits:
+                match_start = original_offset(entry.offsets, position)
+                match_end = original_offset(entry.offsets, position + len(needle) - 1) + 1
+                page_index = bisect.bisect_right(page_starts, match_start) - 1
+                start = max(0, match_start - self.SNIPPET_CONTEXT)
+                end = match_end + self.SNIPPET_CONTEXT
+                snippet = " ".join(text[start:end].split())
+                hits.append({
+                    'pagina': page_index + 1,
+                    'inicio': match_start - page_starts[page_index],
+                    'fin': match_end - page_starts[page_index],
+                    'texto': text[match_start:match_end],
+                    'fragmento': ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+                })
+                position = entry.folded.find(needle, position + len(needle))
+        return {'total': total, 'aciertos': hits}
+    
+    def read_disk_mtime(self):
+        try:
+            return self.store_file.stat().st_mtime_ns
+        except OSError:
+            return None
+    
+    def iter_records(self):
+        """Genera los registros tal como están en disco, de uno en uno (sin cargar el almacén)"""
+        try:
+            with open(self.store_file, 'r', encoding='utf-8') as f:
+                f.readline()
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            return
+    
+    def changed_on_disk(self):
+        """True si otro proceso (p. ej. el indexador en segundo plano) reescribió el almacén"""
+        return self.loaded and self.read_disk_mtime() != self.disk_mtime
+    
+    def serialize_document(self, document):
+        """Línea JSON de un registro (la fecha de modificación se guarda en ISO)"""
+        return json.dumps(document.serializable(), ensure_ascii=False) + '\n'
+    
+    def text_key(self, document):
+        """Clave del texto en la caché: el contenido del archivo (las copias lo comparten)"""
+        return document.get('huella_rapida') or f"{document['ruta']}|{document.get('modification_time')}"
+    
+    def get_pages(self, document):
+        """Texto por página de un registro, desde la caché de textos"""
+        entry = self.get_text(document)
+        return entry.pages if entry is not None else []
+    
+    def get_text(self, document):
+        """TextEntry de un registro (páginas y forma normalizada), o None si no hay texto
+
+        Si la caché ya lo expulsó del disco se vuelve a extraer (recover_texts).
+        """
+        entry = self.text_store.get_entry(self.text_key(document))
+        if entry is not None:
+            return entry
+        for _, entry in self.recover_texts([document]):
+            return entry
+        return None
+    
+    def recover_texts(self, documents, should_stop=None):
+        """Vuelve a extraer el texto expulsado de la caché; genera (ruta, TextEntry)
+
+        Todos los registros van a una sola ejecución del supervisor (procesos
+        vigilados, con su límite de tiempo y su cuarentena), cada uno con sus
+        rangos de páginas; las copias comparten texto y se extrae una vez. Se
+        saltan los archivos que cambiaron desde que se extrajo el registro y
+        los que están en cuarentena.
+        """
+        by_content = {}
+        file_options = {}
+        with self.lock:
+            quarantine = set(self.quarantine)
+        for document in documents:
+            file_path = document['ruta']
+            try:
+                if timestamp_ns(os.stat(file_path).st_mtime) != timestamp_ns(document.get('modification_time')):
+                    continue
+            except OSError:
+                continue
+            if file_path in quarantine:
+                continue
+            paths = by_content.setdefault(self.text_key(document), [])
+            paths.append(file_path)
+            if len(paths) == 1:
+                ranges = document.get('paginas_extraidas')
+                file_options[file_path] = {'paginas_extraidas': [list(pages_range) for pages_range in ranges]
+                                           if ranges is not None else None}
+        if not by_content:
+            return
+        
+        targets = {paths[0]: key for key, paths in by_content.items()}
+        supervisor = self.supervisor_factory()
+        try:
+            for file_path, success, pages in supervisor.run('text', list(targets), should_stop=should_stop,
+                                                           file_options=file_options):
+                if not success:
+                    print(f"Error recuperando texto de {file_path}: {pages}")
+                    continue
+                key = targets[str(file_path)]
+                with self.text_store.lock:
+                    self.text_store.stats['reextracciones'] += 1
+                entry = self.text_store.put(key, pages)
+                for copy_path in by_content[key]:
+                    yield copy_path, entry
+        finally:
+            if supervisor.quarantined:
+                with self.lock:
+                    self.quarantine.update(supervisor.quarantine_entries())
+    
+    def add_document(self, document):
+        """Añade o reemplaza un registro, su firma en el índice de texto y sus rasgos
+
+        El diccionario se guarda como DocumentRecord, que es lo que devuelve.
+        Si el registro trae el texto de sus páginas se pasa a la caché de textos.
+        Los rasgos no se guardan con el registro: el índice los calcula al
+        vuelo (document_features).
+        """
+        if 'paginas_texto' in document:
+            self.text_store.put(self.text_key(document), document.pop('paginas_texto'),
+                                document.pop('texto_normalizado', None))
+            self.inline_text = True
+        # Almacenes antiguos guardaban la tabla de rasgos en cada línea
+        document.pop('rasgos', None)
+        if not isinstance(document, DocumentRecord):
+            document = DocumentRecord(document)
+        # Las entradas del registro anterior se quitan mientras todavía se puede calcular su tabla
+        self.feature_index.remove(document['ruta'])
+        self.documents[document['ruta']] = document
+        self.text_index.add(document['ruta'], document.get('firma_minhash'))
+        self.feature_index.add(document['ruta'], document.features())
+        self.index_visual(document['ruta'], document)
+        self.generation += 1
+        return document
+    
+    def remove_document(self, file_path):
+        if file_path in self.documents:
+            self.feature_index.remove(file_path)
+            del self.documents[file_path]
+            self.text_index.remove(file_path)
+            self.visual_index.remove(file_path)
+            self.generation += 1
+    
+    def document_features(self, file_path):
+        """Tabla de rasgos de un registro del almacén, o None si no está (la consulta FeatureIndex)"""
+        document = self.documents.get(file_path)
+        return document.features() if document is not None else None
+    
+    def index_visual(self, file_path, document):
+        """Indexa la primera página de la huella visual; las uniformes (hash 0, p. ej. en blanco) no"""
+        hashes = (document.get('huella_visual') or {}).get('hashes')
+        if hashes and int(hashes[0], 16) != 0:
+            self.visual_index.add(int(hashes[0], 16), file_path)
+        else:
+            self.visual_index.remove(file_path)
+    
+    def content_key(self, pdf_path):
+        """Clave de contenido: tamaño + SHA1 del inicio, el centro y el final del archivo"""
+        size = pdf_path.stat().st_size
+        digest = hashlib.sha1()
+        with open(pdf_path, 'rb') as f:
+            for offset in (0, max(0, size // 2 - self.QUICK_CHUNK // 2), max(0, size - self.QUICK_CHUNK)):
+                f.seek(offset)
+                digest.update(f.read(self.QUICK_CHUNK))
+        return f"{size}:{digest.hexdigest()}"
+    
+    def clone_document(self, source, pdf_path):
+        """Registro de una copia: datos de contenido del original y datos de archivo propios
+
+        La clave de contenido solo muestrea el archivo: la copia se confirma
+        con el SHA256 de su propio archivo y, si no coincide con el del
+        original, devuelve None para que se extraiga.
+        """
+        file_stat = pdf_path.stat()
+        file_hash = file_sha256(pdf_path)
+        if not source.get('hash_sha256') or file_hash != source['hash_sha256']:
+            return None
+        document = dict(source,
+                        ruta=str(pdf_path),
+                        nombre=pdf_path.name,
+                        tamaño=file_stat.st_size,
+                        modificado=datetime.fromtimestamp(file_stat.st_mtime),
+                        modification_time=file_stat.st_mtime,
+                        hash_sha256=file_hash)
+        return document
+    
+    def duplicate_groups(self):
+        """Grupos de rutas con el mismo contenido: {clave_contenido: [rutas]}"""
+        groups = {}
+        for file_path, document in list(self.documents.items()):
+            if document.get('huella_rapida'):
+                groups.setdefault(document['huella_rapida'], []).append(file_path)
+        return {key: paths for key, paths in groups.items() if len(paths) > 1}
+    
+    def refresh(self, progress_callback=None, should_stop=None, changed_paths=None):
+        """Pone el almacén al día con la carpeta; devuelve (estado, rutas_extraídas)
+
+        Solo se listan las carpetas cuyo mtime cambió, se descartan los
+        registros de archivos que ya no existen y los PDFs nuevos o modificados
+        pasan por la canalización de extracción (ExtractionPipeline, con los
+        procesos vigilados), salvo los que son copia de un contenido ya
+        conocido. Los que fallan quedan en cuarentena hasta que
+        cambien.
+
+        Durante la extracción cada registro nuevo se añade al final del
+        archivo y se vuelca a disco cada CHECKPOINT_SECONDS, así que un
+        escaneo cancelado o interrumpido se reanuda en la siguiente llamada
+        extrayendo solo los archivos que faltan. Los archivos incorporados se
+        comprueban contra las consultas de vigilancia (`watchlist`).
+
+        En las carpetas sin cambios no se hace stat de cada PDF salvo en una
+        revisión completa, cada FULL_CHECK_SECONDS: un PDF editado en su sitio
+        se detecta antes solo si llega en `changed_paths`, los PDFs que se
+        sabe que cambiaron (p. ej. por un evento del sistema de archivos), que
+        se vuelven a extraer aunque su tamaño y mtime coincidan con el registro.
+
+        El recorrido y la extracción se hacen sin el bloqueo de los registros
+        (`lock`): las consultas siguen respondiendo con lo ya indexado y cada
+        registro nuevo se aplica bajo el bloqueo en cuanto está listo.
+        """
+        with self.update_lock:
+            with self.lock:
+                status = self.ensure_loaded()
+                self.refreshing = True
+            try:
+                return self._refresh(status, progress_callback, should_stop, changed_paths)
+            finally:
+                self.refreshing = False
+    
+    def _refresh(self, status, progress_callback, should_stop, changed_paths):
+        with self.lock:
+            had_tree = self.directory_tree is not None
+            check_files = (not had_tree or self.files_checked is None
+                           or time.time() - self.files_checked >= self.FULL_CHECK_SECONDS)
+            # Contenidos conocidos antes de descartar nada: un renombrado reutiliza su registro antiguo
+            known_contents = {document['huella_rapida']: document for document in self.documents.values()
+                              if document.get('huella_rapida')}
+        forced = {str(Path(path)) for path in changed_paths or ()}
+        
+        # El recorrido (en sus hilos) clasifica cada carpeta modificada en cuanto la lista
+        # y entrega a la canalización los PDFs por extraer; solo se extrae uno por contenido
+        pending = []
+        copies = {}
+        content_keys = {}
+        clones = deque()
+        classify_lock = threading.Lock()
+        walk_result = {}
+        walk_start = time.time()
+        
+        # Trabajo pendiente en bytes y en coste estimado (para la estimación de tiempo)
+        pipeline = self.pipeline_factory(self.supervisor_factory())
+        work = {'bytes': 0, 'bytes_total': 0, 'coste': 0.0, 'coste_total': 0.0}
+        estimates = {}
+        
+        def walk(submit):
+            def classify_folder(folder, files, dirty):
+                folder_forced = [name for name in files if str(folder / name) in forced] if forced else []
+                if not dirty and not folder_forced:
+                    # Mismos PDFs con el mismo tamaño y mtime que en el recorrido anterior
+                    return
+                _, folder_pending = self.directory_builder.split_folder(folder, files, self.documents,
+                                                                        self.quarantine)
+                queued = {pdf_file.name for pdf_file in folder_pending}
+                folder_pending.extend(folder / name for name in folder_forced if name not in queued)
+                for pdf_file in folder_pending:
+                    try:
+                        content_key = self.content_key(pdf_file)
+                    except OSError as e:
+                        print(f"Error leyendo {pdf_file}: {e}")
+                        continue
+                    with classify_lock:
+                        pending.append(pdf_file)
+                        content_keys[str(pdf_file)] = content_key
+                        # Un archivo modificado no se clona de lo conocido: su clave de contenido solo muestrea
+                        if content_key in known_contents and str(pdf_file) not in forced:
+                            clones.append((known_contents[content_key], pdf_file))
+                            continue
+                        if content_key in copies:
+                            copies[content_key].append(pdf_file)
+                            continue
+                        copies[content_key] = []
+                        size = files[pdf_file.name][0]
+                        estimates[str(pdf_file)] = (size, pipeline.cost_model.estimate(size))
+                        work['bytes_total'] += size
+                        work['coste_total'] += estimates[str(pdf_file)][1]
+                    submit(pdf_file, size)
+            
+            walk_result['tree'], dirty_folders = self.directory_builder.validate(
+                self.search_folder, self.directory_tree, classify_folder, should_stop, check_files, forced)
+            if had_tree and dirty_folders:
+                print(f"{len(dirty_folders)} carpetas con cambios" + (" (revisión completa)" if check_files else ""))
+        
+        extracted = []
+        reused = 0
+        processed = 0
+        checkpoint = None
+        last_checkpoint = time.monotonic()
+        
+        def store_document(document):
+            nonlocal checkpoint
+            with self.lock:
+                if checkpoint is None:
+                    # Los registros se añaden detrás de lo guardado; un árbol antiguo en la
+                    # cabecera solo hace que se vuelvan a listar algunas carpetas
+                    if not had_tree or not self.store_file.exists():
+                        self.save()
+                    checkpoint = open(self.store_file, 'a', encoding='utf-8')
+                document = self.add_document(document)
+            checkpoint.write(self.serialize_document(document))
+            extracted.append(document['ruta'])
+        
+        # Copias cuyo SHA256 no coincide con el original: se extraen al final
+        mismatched = []
+        
+        def store_clone(source_document, pdf_file):
+            nonlocal reused
+            try:
+                document = self.clone_document(source_document, pdf_file)
+            except OSError as e:
+                print(f"Error leyendo {pdf_file}: {e}")
+                return
+            if document is None:
+                mismatched.append(pdf_file)
+                return
+            store_document(document)
+            reused += 1
+        
+        def store_clones():
+            while clones:
+                store_clone(*clones.popleft())
+        
+        supervisor = pipeline.supervisor
+        
+        def store_result(pdf_file, success, result):
+            """Etapa de escritura: un único hilo añade los registros al almacén"""
+            nonlocal processed, reused, last_checkpoint
+            store_clones()
+            with classify_lock:
+                size, cost = estimates.pop(str(pdf_file), (0, 0.0))
+                work['bytes'] += size
+                work['coste'] += cost
+                progress = dict(work)
+            if progress_callback and hasattr(progress_callback, '__call__'):
+                progress_callback(processed, len(pending), f"Extrayendo: {pdf_file.name}", progress)
+            processed += 1
+            content_key = content_keys[str(pdf_file)]
+            if success:
+                result['huella_rapida'] = content_key
+                store_document(result)
+                with classify_lock:
+                    waiting_copies = copies[content_key]
+                    # Las copias que aparezcan a partir de ahora se clonan directamente
+                    known_contents[content_key] = result
+                for copy_file in waiting_copies:
+                    store_clone(result, copy_file)
+            else:
+                print(f"Error extrayendo {pdf_file}: {result}")
+                with classify_lock:
+                    failed_files = [pdf_file] + copies[content_key]
+                for failed_file in failed_files:
+                    supervisor.quarantined[str(failed_file)] = result
+            
+            # 🔥 Punto de control: lo extraído sobrevive a una cancelación o un cierre inesperado
+            if checkpoint is not None and time.monotonic() - last_checkpoint >= self.CHECKPOINT_SECONDS:
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+                last_checkpoint = time.monotonic()
+                print(f"Punto de control: {len(extracted)}/{len(pending)} archivos guardados")
+        
+        # 🔥 Recorrido → lectura (el mayor coste primero) → extracción → hash → escritura, con colas acotadas
+        options = {'primeras_paginas': self.page_budget[0], 'ultimas_paginas': self.page_budget[1],
+                   'calcular_hash': False}
+        self.pipeline_metrics = pipeline.run(walk, store_result, options, should_stop)
+        if processed:
+            print(pipeline.report())
+        store_clones()
+        if mismatched:
+            # Misma clave de contenido pero distinto contenido: extracción normal
+            print(f"{len(mismatched)} archivos con la clave de un contenido conocido pero otro SHA256")
+            fallback_options = dict(options, calcular_hash=True)
+            for pdf_file, success, result in supervisor.run('document', mismatched, fallback_options, should_stop):
+                if success:
+                    # La clave muestreada la comparte otro contenido: se distingue con el SHA256
+                    result['huella_rapida'] = f"{content_keys[str(pdf_file)]}|{result['hash_sha256']}"
+                    store_document(result)
+                else:
+                    print(f"Error extrayendo {pdf_file}: {result}")
+                    supervisor.quarantined[str(pdf_file)] = result
+        if checkpoint is not None:
+            checkpoint.close()
+        interrupted = bool(should_stop and should_stop())
+        
+        with self.lock:
+            self.quarantine.update(supervisor.quarantine_entries())
+            # Un archivo en cuarentena que se ha podido extraer tras cambiar sale de ella
+            for file_path in extracted:
+                self.quarantine.pop(file_path, None)
+            changed = bool(extracted or supervisor.quarantined)
+            
+            # Con el recorrido completo se descartan los registros de archivos que ya no existen
+            removed = []
+            directory_tree = walk_result.get('tree')
+            if directory_tree is not None:
+                current_files = {str(pdf_file) for pdf_file, _, _ in
+                                 self.directory_builder.iter_files(directory_tree, self.search_folder)}
+                # Los que se intentaron extraer y fallaron pierden su registro antiguo
+                failed_files = {str(pdf_file) for pdf_file in pending}.difference(extracted)
+                removed = [file_path for file_path in self.documents
+                           if file_path not in current_files or file_path in failed_files]
+                for file_path in removed:
+                    self.remove_document(file_path)
+                vanished = [file_path for file_path in self.quarantine if not os.path.exists(file_path)]
+                for file_path in vanished:
+                    del self.quarantine[file_path]
+                # Detenido a medias no se guarda el árbol nuevo: el siguiente recorrido vuelve a
+                # ver esas carpetas como cambiadas y extrae lo que falta (lo ya guardado se reutiliza)
+                if not interrupted:
+                    changed = changed or directory_tree != self.directory_tree
+                    self.directory_tree = directory_tree
+                    if check_files:
+                        self.files_checked = walk_start
+                        changed = True
+                changed = changed or bool(removed or vanished)
+            
+            if changed:
+                self.save()
+            new_documents = [self.documents[file_path] for file_path in extracted if file_path in self.documents]
+        
+        # 🔥 Vigilancia incremental: solo lo que se acaba de incorporar, no toda la carpeta
+        if self.watchlist is not None and new_documents:
+            self.watchlist.check(self.search_folder, new_documents)
+        
+        if had_tree and not pending and not removed:
+            status = "Caché válido"
+        elif interrupted:
+            status = f"Escaneo detenido: faltan {len(pending) - len(extracted)} archivos (se reanudará)"
+        elif had_tree:
+            status = (f"{len(extracted) - reused} archivos extraídos, {reused} reutilizados por contenido, "
+                      f"{len(removed)} eliminados")
+        return status, extracted
+    
+    def incomplete_documents(self):
+        """Rutas de los registros cuyo texto no cubre todas las páginas"""
+        return [file_path for file_path, document in list(self.documents.items())
+                if not document.get('texto_completo', True)]
+    
+    def extend_text(self, progress_callback=None, should_stop=None, limit=None):
+        """Extrae en procesos vigilados las páginas que faltan; devuelve cuántos registros completó
+
+        Las copias comparten texto, así que cada contenido se extrae una vez y
+        se completan todos sus registros. `limit` acota los contenidos de una
+        llamada (el indexador trabaja por lotes para no retener el almacén).
+        """
+        with self.lock:
+            self.ensure_loaded()
+            by_content = {}
+            for file_path in self.incomplete_documents():
+                by_content.setdefault(self.text_key(self.documents[file_path]), []).append(file_path)
+        if not by_content:
+            return 0
+        targets = {paths[0]: key for key, paths in list(by_content.items())[:limit]}
+        
+        # La extracción va sin bloqueo; cada resultado se aplica con él
+        completed = 0
+        supervisor = self.supervisor_factory()
+        for i, (file_path, success, pages) in enumerate(supervisor.run('text', list(targets), should_stop=should_stop)):
+            if progress_callback and hasattr(progress_callback, '__call__'):
+                progress_callback(i, len(targets), f"Completando texto: {Path(file_path).name}")
+            if not success:
+                print(f"Error completando texto de {file_path}: {pages}")
+                continue
+            key = targets[str(file_path)]
+            self.text_store.put(key, pages)
+            signature = self.text_index.signature("".join(pages))
+            with self.lock:
+                for copy_path in by_content[key]:
+                    document = self.documents.get(copy_path)
+                    if document is None:
+                        continue
+                    document['paginas_extraidas'] = [[0, len(pages)]]
+                    document['texto_completo'] = True
+                    document['firma_minhash'] = signature
+                    self.text_index.add(copy_path, document['firma_minhash'])
+                    completed += 1
+                self.generation += 1
+        
+        if completed:
+            with self.lock:
+                self.save()
+            print(f"Texto completado en {completed} documentos")
+        return completed
+    
+    def ensure_visual_fingerprints(self, pages, progress_callback=None, should_stop=None):
+        """Calcula en procesos vigilados las huellas visuales que faltan
+
+        Guarda en cada registro 'huella_visual' = {'paginas': N, 'hashes': [...]}
+        y devuelve cuántas se calcularon; las ya presentes se reutilizan.
+        """
+        with self.lock:
+            pending = [file_path for file_path, document in self.documents.items()
+                       if (document.get('huella_visual') or {}).get('paginas') != pages]
+        if not pending:
+            return 0
+        
+        supervisor = self.supervisor_factory()
+        results = supervisor.run('visual', pending, options={'pages': pages}, should_stop=should_stop)
+        for i, (file_path, success, hashes) in enumerate(results):
+            if not success:
+                print(f"Error calculando huella visual de {file_path}: {hashes}")
+                hashes = []
+            with self.lock:
+                document = self.documents.get(str(file_path))
+                if document is not None:
+                    document['huella_visual'] = {'paginas': pages, 'hashes': hashes}
+                    self.index_visual(str(file_path), document)
+                    self.generation += 1
+            
+            if progress_callback and hasattr(progress_callback, '__call__'):
+                progress_callback(i, len(pending), f"Huella visual: {Path(file_path).name}")
+        
+        with self.lock:
+            self.save()
+        return len(pending)
+
+class Watchlist:
+    """Consultas permanentes de vigilancia evaluadas solo sobre los documentos nuevos.
+
+    Cada consulta guarda los rasgos de su referencia (y su firma MinHash si
+    vigila también el texto), así que el PDF de referencia no tiene que
+    seguir existiendo. Las consultas se indexan como si fueran documentos
+    (FeatureIndex y TextSimilarityIndex): comprobar un documento solo recorre
+    las consultas con las que comparte algún rasgo. Los almacenes llaman a
+    check con los archivos que acaban de incorporar, de modo que el coste
+    sigue al volumen de cambios y no al tamaño del archivo. Cada coincidencia
+    nueva se añade al informe (JSON Lines) y no se repite para el mismo
+    archivo con el mismo contenido (se recuerdan las MAX_REPORTED más
+    recientes de cada consulta).
+
+    El archivo lo comparten la CLI, la GUI y el indexador en segundo plano:
+    se vuelve a leer cuando cambia y cada guardado fusiona, bajo un bloqueo
+    entre procesos, los cambios locales con lo que haya en disco.
+    """
+    
+    MAX_REPORTED = 5000
+    LOCK_TIMEOUT = 10.0
+    LOCK_STALE_SECONDS = 60.0
+    
+    def __init__(self, path, report_path, weights=None):
+        self.path = Path(path)
+        self.report_path = Path(report_path)
+        self.weights = weights if weights is not None else dict(FEATURE_WEIGHTS)
+        self.queries = {}
+        self.reported = {}
+        # Cambios aún no guardados: {nombre: consulta o None si se eliminó} y {nombre: {clave: fecha}}
+        self.changed_queries = {}
+        self.new_reports = {}
+        self.loaded_signature = None
+        self.lock = threading.RLock()
+        self.load()
+    
+    def file_signature(self):
+        try:
+            file_stat = self.path.stat()
+        except OSError:
+            return None
+        return file_stat.st_mtime_ns, file_stat.st_size
+    
+    def read_file(self):
+        """Lee el archivo de consultas: devuelve (datos, firma del archivo leído)"""
+        signature = self.file_signature()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f), signature
+        except (OSError, ValueError):
+            return {}, signature
+    
+    def merge(self, data):
+        """Aplica los cambios locales sin guardar sobre los datos del archivo: devuelve (consultas, notificados)"""
+        queries = dict(data.get('consultas', {}))
+        reported = {}
+        for name, keys in data.get('notificados', {}).items():
+            # Formato anterior: lista de claves sin fecha
+            reported[name] = dict(keys) if isinstance(keys, dict) else dict.fromkeys(keys, '')
+        for name, query in self.changed_queries.items():
+            reported.pop(name, None)
+            if query is None:
+                queries.pop(name, None)
+            else:
+                queries[name] = query
+        for name, keys in self.new_reports.items():
+            if name in queries:
+                reported.setdefault(name, {}).update(keys)
+        for name in list(reported):
+            if name not in queries:
+                del reported[name]
+            elif len(reported[name]) > self.MAX_REPORTED:
+                newest = sorted(reported[name].items(), key=lambda item: item[1])[-self.MAX_REPORTED:]
+                reported[name] = dict(newest)
+        return queries, reported
+    
+    def load(self):
+        data, signature = self.read_file()
+        self.queries, self.reported = self.merge(data)
+        self.loaded_signature = signature
+        self.build_index()
+    
+    def reload_if_changed(self):
+        """Vuelve a leer el archivo si otro proceso lo modificó desde la última lectura"""
+        with self.lock:
+            if self.file_signature() != self.loaded_signature:
+                self.load()
+    
+    @contextlib.contextmanager
+    def file_lock(self):
+        """Bloqueo entre procesos del archivo de consultas (un archivo .lock creado en exclusiva)"""
+        lock_path = self.path.with_suffix('.lock')
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except (FileExistsError, PermissionError):
+                try:
+                    if time.time() - lock_path.stat().st_mtime > self.LOCK_STALE_SECONDS:
+                        # Bloqueo abandonado por un proceso que terminó sin liberarlo
+                        lock_path.unlink()
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{lock_path} está bloqueado por otro proceso")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            try:
+                lock_path.unlink()
+            except OSError:
+                pass
+    
+    def build_index(self):
+        self.feature_index = FeatureIndex()
+        self.text_index = TextSimilarityIndex()
+        for name, query in self.queries.items():
+            self.feature_index.add(name, query['rasgos'])
+            if query.get('firma_minhash'):
+                self.text_index.add(name, query['firma_minhash'])
+    
+    def save(self):
+        """Guarda los cambios locales fusionados con el contenido actual del archivo"""
+        try:
+            with self.file_lock():
+                data, _ = self.read_file()
+                queries, reported = self.merge(data)
+                temp_file = self.path.with_suffix('.tmp')
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump({'consultas': queries, 'notificados': reported}, f, ensure_ascii=False, indent=1)
+                os.replace(temp_file, self.path)
+                self.loaded_signature = self.file_signature()
+        except OSError as e:
+            # Los cambios se aplican en memoria y quedan pendientes para el siguiente guardado
+            print(f"Error guardando las consultas de vigilancia: {e}")
+            self.queries, self.reported = self.merge({'consultas': self.queries, 'notificados': self.reported})
+            self.build_index()
+            return
+        self.queries, self.reported = queries, reported
+        self.changed_queries.clear()
+        self.new_reports.clear()
+        self.build_index()
+    
+    def add(self, name, features, score_threshold, signature=None, text_threshold=None, reference=None):
+        """Añade o reemplaza una consulta; `signature` y `text_threshold` vigilan también el texto"""
+        with self.lock:
+            self.changed_queries[name] = {
+                'referencia': reference,
+                'rasgos': features,
+                'umbral': score_threshold,
+                'firma_minhash': list(signature) if signature is not None and text_threshold is not None else None,
+                'umbral_texto': text_threshold,
+                'creada': datetime.now().isoformat(timespec='seconds')
+            }
+            self.new_reports.pop(name, None)
+            self.save()
+    
+    def remove(self, name):
+        with self.lock:
+            self.reload_if_changed()
+            if name not in self.queries:
+                return False
+            self.changed_queries[name] = None
+            self.new_reports.pop(name, None)
+            self.save()
+            return True
+    
+    def check(self, folder, documents):
+        """Comprueba `documents` contra todas las consultas; devuelve las coincidencias nuevas
+
+        Las coincidencias se añaden al informe. Una consulta coincide si la
+        puntuación de los rasgos llega a su 'umbral' o, si vigila el texto,
+        si la similitud de texto llega a su 'umbral_texto'.
+        """
+        with self.lock:
+            self.reload_if_changed()
+            if not self.queries:
+                return []
+            score_threshold = min(query['umbral'] for query in self.queries.values())
+            text_thresholds = [query['umbral_texto'] for query in self.queries.values()
+                               if query.get('umbral_texto') is not None]
+            
+            hits = []
+            for document in documents:
+                features = compute_features(document)
+                scores = self.feature_index.score(features, self.weights, score_threshold)
+                text_scores = {}
+                if text_thresholds and document.get('firma_minhash') is not None:
+                    text_scores = self.text_index.query(document['firma_minhash'], min(text_thresholds))
+                
+                for name in dict.fromkeys(list(scores) + list(text_scores)):
+                    query = self.queries[name]
+                    score, matched_fields = scores.get(name, (0.0, []))
+                    text_similarity = text_scores.get(name)
+                    if text_similarity is not None and text_similarity < query['umbral_texto']:
+                        text_similarity = None
+                    if score < query['umbral'] and text_similarity is None:
+                        continue
+                    content_key = f"{document['ruta']}|{document.get('huella_rapida') or document.get('hash_sha256')}"
+                    if content_key in self.reported.setdefault(name, {}):
+                        continue
+                    found_at = datetime.now().isoformat(timespec='seconds')
+                    self.reported[name][content_key] = found_at
+                    self.new_reports.setdefault(name, {})[content_key] = found_at
+                    hits.append({
+                        'fecha': found_at,
+                        'consulta': name,
+                        'referencia': query.get('referencia'),
+                        'carpeta': folder,
+                        'ruta': document['ruta'],
+                        'puntuacion': round(score, 2),
+                        'rasgos': [FEATURE_LABELS[field] for field in matched_fields],
+                        'similitud_texto': round(text_similarity, 3) if text_similarity is not None else None
+                    })
+            
+            if hits:
+                try:
+                    with open(self.report_path, 'a', encoding='utf-8') as f:
+                        for hit in hits:
+                            f.write(json.dumps(hit, ensure_ascii=False) + '\n')
+                except OSError as e:
+                    print(f"Error escribiendo el informe de vigilancia: {e}")
+                self.save()
+                for hit in hits:
+                    print(f"⚠ Vigilancia «{hit['consulta']}»: {hit['ruta']} (puntuación {hit['puntuacion']:g})")
+            return hits
+
+class FolderEventHandler(FileSystemEventHandler):
+    """Traduce los eventos de watchdog en avisos al indexador (solo carpetas y PDFs)"""
+    
+    def __init__(self, indexer, folder):
+        super().__init__()
+        self.indexer = indexer
+        self.folder = folder
+    
+    def on_any_event(self, event):
+        # Abrir o leer un PDF (p. ej. la propia extracción) no es un cambio
+        if event.event_type in ('opened', 'closed_no_write'):
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        pdf_paths = [path for path in paths if str(path).lower().endswith('.pdf')]
+        if event.is_directory or pdf_paths:
+            self.indexer.notify(self.folder, pdf_paths)
+
+class BackgroundIndexer:
+    """Mantiene al día en segundo plano los almacenes de documentos de unas carpetas.
+
+    Con watchdog instalado cada cambio en una carpeta vigilada programa un
+    refresco; sin él se sondea cada `poll_interval` segundos (el árbol de
+    carpetas hace que un sondeo sin cambios solo cueste un stat por carpeta;
+    un PDF editado en su sitio sin evento espera a la revisión completa del
+    almacén, ver DocumentStore.FULL_CHECK_SECONDS). Las ráfagas de eventos
+    se agrupan: una carpeta se refresca cuando lleva `debounce` segundos sin
+    eventos, y el refresco solo extrae los PDFs que cambiaron (los que
+    nombran los eventos se extraen siempre). Sin eventos pendientes
+    completa, por lotes de `idle_batch`, el texto que el presupuesto de
+    páginas dejó a medias. Los almacenes se escriben en disco, así que la
+    interfaz encuentra el caché ya caliente aunque se ejecute en otro proceso.
+    """
+    
+    def __init__(self, analyzer, folders, debounce=2.0, poll_interval=60, idle_batch=20):
+        self.analyzer = analyzer
+        self.folders = list(folders)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.idle_batch = idle_batch
+        self.incomplete = set()
+        self.pending = {}
+        self.changed_paths = {}
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.observer = None
+        self.thread = None
+        self.last_status = {}
+    
+    def start(self):
+        """Arranca la vigilancia; el primer refresco de cada carpeta se hace enseguida"""
+        for folder in self.folders:
+            self.pending[folder] = time.monotonic() - self.debounce
+        
+        if Observer is not None:
+            self.observer = Observer()
+            for folder in self.folders:
+                self.observer.schedule(FolderEventHandler(self, folder), folder, recursive=True)
+            self.observer.start()
+            print(f"Indexador: vigilando {len(self.folders)} carpetas con eventos del sistema")
+        else:
+            print(f"Indexador: watchdog no disponible - sondeo cada {self.poll_interval}s")
+        
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        if self.thread is not None:
+            self.thread.join()
+    
+    def notify(self, folder, paths=()):
+        """Registra un cambio en `folder` (y en los PDFs `paths`); el refresco espera a que acabe la ráfaga"""
+        with self.condition:
+            self.pending[folder] = time.monotonic()
+            self.changed_paths.setdefault(folder, set()).update(paths)
+            self.condition.notify()
+    
+    def run(self):
+        next_poll = time.monotonic() + self.poll_interval
+        while not self.stop_event.is_set():
+            with self.condition:
+                now = time.monotonic()
+                if now >= next_poll:
+                    # El sondeo también cubre los eventos perdidos (p. ej. unidades de red)
+                    for folder in self.folders:
+                        self.pending.setdefault(folder, now - self.debounce)
+                    next_poll = now + self.poll_interval
+                
+                due = [folder for folder, last_event in self.pending.items() if now - last_event >= self.debounce]
+                idle = [folder for folder in self.folders if folder in self.incomplete and not self.pending]
+                if not due and not idle:
+                    deadlines = [last_event + self.debounce for last_event in self.pending.values()]
+                    self.condition.wait(max(0.05, min(deadlines + [next_poll]) - now))
+                    continue
+                changed_paths = {}
+                for folder in due:
+                    del self.pending[folder]
+                    changed_paths[folder] = self.changed_paths.pop(folder, set())
+            
+            for folder in due:
+                self.refresh_folder(folder, changed_paths[folder])
+            if not due and idle:
+                self.extend_folder(idle[0])
+    
+    def refresh_folder(self, folder, changed_paths=None):
+        try:
+            store = self.analyzer.get_document_store(folder)
+            status, extracted = store.refresh(should_stop=self.stop_event.is_set, changed_paths=changed_paths)
+            self.last_status[folder] = status
+            if extracted or status != "Caché válido":
+                print(f"Indexador: {folder} - {status}")
+            if store.incomplete_documents():
+                self.incomplete.add(folder)
+        except Exception as e:
+            print(f"Indexador: error refrescando {folder}: {e}")
+    
+    def extend_folder(self, folder):
+        """Pasada en ratos libres: se interrumpe en cuanto llega un evento"""
+        try:
+            store = self.analyzer.get_document_store(folder)
+            store.extend_text(should_stop=lambda: self.stop_event.is_set() or bool(self.pending),
+                              limit=self.idle_batch)
+            if not store.incomplete_documents():
+                self.incomplete.discard(folder)
+                print(f"Indexador: texto completo en {folder}")
+        except Exception as e:
+            self.incomplete.discard(folder)
+            print(f"Indexador: error completando texto de {folder}: {e}")
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """Atiende las peticiones JSON del servidor de consultas (cada una en su propio hilo)"""
+    
+    def do_GET(self):
+        if self.path == '/estado':
+            self.send_json(200, self.server.query_server.status())
+        else:
+            self.send_json(404, {'error': f"Ruta desconocida: {self.path}"})
+    
+    def do_POST(self):
+        routes = {'/similares': self.server.query_server.find_similar,
+                  '/buscar': self.server.query_server.search_text}
+        if self.path not in routes:
+            self.send_json(404, {'error': f"Ruta desconocida: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            self.send_json(200, routes[self.path](request))
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(400, {'error': f"Petición no válida: {e}"})
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+    
+    def send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        print(f"Servidor: {self.address_string()} {format % args}")
+
+class QueryServer:
+    """Servidor local de consultas con los almacenes de documentos residentes en memoria.
+
+    Varias interfaces o scripts pueden consultar el mismo índice caliente en
+    lugar de cargar cada uno su copia. Escucha solo en 127.0.0.1. Las carpetas
+    que mantiene un BackgroundIndexer se consultan sin revalidar; las demás se
+    refrescan en cada consulta (solo se listan las carpetas modificadas).
+    Lo que actualiza el almacén (refresco, huellas visuales, texto completo)
+    se hace antes y sin bloqueo; la consulta en sí se resuelve con el
+    bloqueo de los registros, que el indexador solo toma para aplicar cada
+    registro, así que no espera a que termine un refresco.
+    """
+    
+    def __init__(self, analyzer=None, host='127.0.0.1', port=8765, indexer=None):
+        self.analyzer = analyzer or PDFMetadataAnalyzer()
+        self.indexer = indexer
+        self.httpd = ThreadingHTTPServer((host, port), QueryRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.query_server = self
+    
+    def is_indexed(self, folder):
+        return self.indexer is not None and folder in self.indexer.folders
+    
+    def status(self):
+        return {'carpetas': {f"{store.search_folder} {store.filter_key}".strip(): len(store.documents)
+                             for store in list(self.analyzer.document_stores.values())},
+                'indexadas': self.indexer.folders if self.indexer else [],
+                'cache_textos': self.analyzer.get_text_store().statistics(),
+                'canalizacion': {f"{store.search_folder} {store.filter_key}".strip(): store.pipeline_metrics
+                                 for store in list(self.analyzer.document_stores.values())}}
+    
+    def find_similar(self, request):
+        analyzer = self.analyzer.for_reference(request['referencia'])
+        success, reference_metadata = analyzer.get_pdf_metadata(Path(request['referencia']))
+        if not success:
+            raise ValueError(reference_metadata)
+        store = analyzer.get_document_store(request['carpeta'])
+        self.prepare(store, request['carpeta'])
+        if request.get('visual_distance') is not None:
+            store.ensure_visual_fingerprints(analyzer.visual_pages)
+        if request.get('text_threshold') is not None:
+            store.extend_text()
+        with store.lock:
+            similar_files, cache_used = analyzer.find_similar_by_metadata(
+                reference_metadata,
+                request['carpeta'],
+                request.get('include_hash', False),
+                request.get('min_matches', 2),
+                text_threshold=request.get('text_threshold'),
+                visual_distance=request.get('visual_distance'),
+                refresh=False,
+                score_threshold=request.get('score_threshold')
+            )
+        return {'resultados': [self.public_result(result) for result in similar_files], 'cache_used': cache_used}
+    
+    def search_text(self, request):
+        store = self.analyzer.get_document_store(request['carpeta'])
+        self.prepare(store, request['carpeta'])
+        if request.get('cobertura_completa', False):
+            store.extend_text()
+        with store.lock:
+            results = list(store.search_hits(request['texto']))
+        return {'resultados': [file_path for file_path, _ in results],
+                'fragmentos': {file_path: hits for file_path, hits in results},
+                'cache_used': True}
+    
+    def prepare(self, store, folder):
+        """Pone al día el almacén de una carpeta no indexada (sin bloqueo); las indexadas solo se cargan"""
+        if self.is_indexed(folder):
+            store.ensure_loaded()
+        else:
+            store.refresh()
+    
+    def public_result(self, result):
+        """Resultado sin el texto ni la firma del documento (no hacen falta en el cliente)"""
+        metadata = {key: value for key, value in result['metadata'].items()
+                    if key not in ('paginas_texto', 'texto_normalizado', 'firma_minhash')}
+        return dict(result, metadata=metadata)
+    
+    def serve_forever(self):
+        host, port = self.httpd.server_address[:2]
+        print(f"Servidor de consultas en http://{host}:{port}")
+        self.httpd.serve_forever()
+    
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class QueryClient:
+    """Cliente ligero del servidor de consultas (lo usan la interfaz y la línea de comandos)"""
+    
+    def __init__(self, url='http://127.0.0.1:8765', timeout=600):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+    
+    def request(self, path, data=None):
+        body = None if data is None else json.dumps(data).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read().decode('utf-8')).get('error', str(e)))
+    
+    def status(self):
+        return self.request('/estado')
+    
+    def find_similar(self, reference_file, search_folder, include_hash=False, min_matches=2, text_threshold=None, visual_distance=None, score_threshold=None):
+        """Igual que PDFMetadataAnalyzer.find_similar_by_metadata, resuelto en el servidor"""
+        response = self.request('/similares', {
+            'referencia': reference_file,
+            'carpeta': search_folder,
+            'include_hash': include_hash,
+            'min_matches': min_matches,
+            'text_threshold': text_threshold,
+            'visual_distance': visual_distance,
+            'score_threshold': score_threshold
+        })
+        for result in response['resultados']:
+            try:
+                result['metadata']['modificado'] = datetime.fromisoformat(result['metadata']['modificado'])
+            except (KeyError, TypeError, ValueError):
+                pass
+        return response['resultados'], response['cache_used']
+    
+    def search_text(self, search_folder, search_string, full_coverage=False):
+        return [file_path for file_path, _ in self.search_hits(search_folder, search_string, full_coverage)]
+    
+    def search_hits(self, search_folder, search_string, full_coverage=False):
+        """Lista de (ruta, aciertos) como DocumentStore.search_hits"""
+        response = self.request('/buscar', {'carpeta': search_folder, 'texto': search_string,
+                                            'cobertura_completa': full_coverage})
+        return [(file_path, response['fragmentos'].get(file_path, {'total': 0, 'aciertos': []}))
+                for file_path in response['resultados']]
+
+class RecordExporter:
+    """Exporta registros en streaming a JSON Lines, CSV o Parquet (con pyarrow instalado).
+
+    Los registros llegan de un iterable (p. ej. DocumentStore.iter_records o
+    los resultados de iter_similar_by_metadata) y se escriben por lotes de
+    `batch_size`, así que la memoria no depende del tamaño del corpus. Solo se
+    escriben las `columns` pedidas; las listas se unen con '|' y las fechas
+    van en ISO 8601.
+    """
+    
+    FORMATS = ('jsonl', 'csv', 'parquet')
+    DEFAULT_COLUMNS = ('ruta', 'nombre', 'tamaño', 'modificado', 'hash_sha256', 'creador', 'productor', 'titulo',
+                       'asunto', 'palabras_clave', 'fecha_creacion', 'fecha_modificacion', 'paginas', 'version_pdf',
+                       'id_trailer', 'xmp_document_id', 'xmp_instance_id', 'fuentes', 'huella_rapida')
+    MATCH_COLUMNS = ('nivel', 'puntuacion', 'puntuacion_max', 'coincidencias', 'similitud_texto',
+                     'distancia_visual', 'detalles')
+    JOIN_COLUMNS = ('entrante', 'archivo', 'nivel', 'puntuacion', 'puntuacion_max', 'coincidencias',
+                    'similitud_texto', 'detalles')
+    INTEGER_COLUMNS = {'tamaño', 'paginas', 'coincidencias', 'distancia_visual'}
+    FLOAT_COLUMNS = {'puntuacion', 'puntuacion_max', 'similitud_texto', 'modification_time'}
+    
+    def __init__(self, columns=None, batch_size=10000):
+        self.columns = list(columns) if columns else None
+        self.batch_size = batch_size
+    
+    @classmethod
+    def match_record(cls, result):
+        """Registro plano de un resultado de la búsqueda de similares"""
+        return dict(result['metadata'],
+                    nivel=result['similarity_level'],
+                    puntuacion=result.get('score'),
+                    puntuacion_max=result.get('max_score'),
+                    coincidencias=result['matches'],
+                    similitud_texto=result.get('text_similarity'),
+                    distancia_visual=result.get('visual_distance'),
+                    detalles=result['match_details'])
+    
+    def format_for(self, output_path, file_format=None):
+        file_format = (file_format or Path(output_path).suffix.lstrip('.')).lower()
+        if file_format == 'json':
+            file_format = 'jsonl'
+        if file_format not in self.FORMATS:
+            raise ValueError(f"Formato de exportación desconocido: {file_format} (usa {', '.join(self.FORMATS)})")
+        if file_format == 'parquet' and pyarrow is None:
+            raise ValueError("La exportación a Parquet necesita pyarrow: pip install pyarrow")
+        return file_format
+    
+    PLAIN_TYPES = (str, int, float, bool, type(None))
+    
+    def row(self, record, columns):
+        """Valores de las columnas pedidas (los tipos simples pasan sin convertir)"""
+        values = []
+        for column in columns:
+            value = record.get(column)
+            values.append(value if value.__class__ in self.PLAIN_TYPES else self.convert(value))
+        return values
+    
+    def convert(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, (list, tuple, array)):
+            return '|'.join(str(item) for item in value)
+        if isinstance(value, dict):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+    
+    def batches(self, records):
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def export(self, records, output_path, file_format=None, columns=None):
+        """Escribe los registros en `output_path`; devuelve cuántos se exportaron"""
+        file_format = self.format_for(output_path, file_format)
+        columns = list(columns or self.columns or self.DEFAULT_COLUMNS)
+        temp_file = Path(f"{output_path}.tmp")
+        writer = getattr(self, f"write_{file_format}")
+        try:
+            total = writer(self.batches(records), temp_file, columns)
+        except Exception:
+            temp_file.unlink(missing_ok=True)
+            raise
+        os.replace(temp_file, output_path)
+        return total
+    
+    def write_jsonl(self, batches, output_path, columns):
+        total = 0
+        # Un solo codificador: json.dumps con opciones crea uno nuevo en cada llamada
+        encoder = json.JSONEncoder(ensure_ascii=False, default=str)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for batch in batches:
+                f.write(''.join(encoder.encode(dict(zip(columns, self.row(record, columns)))) + '\n'
+                                for record in batch))
+                total += len(batch)
+        return total
+    
+    def write_csv(self, batches, output_path, columns):
+        total = 0
+        # utf-8-sig para que Excel reconozca los acentos
+        with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for batch in batches:
+                writer.writerows(self.row(record, columns) for record in batch)
+                total += len(batch)
+        return total
+    
+    def write_parquet(self, batches, output_path, columns):
+        fields = []
+        for column in columns:
+            if column in self.INTEGER_COLUMNS:
+                fields.append(pyarrow.field(column, pyarrow.int64()))
+            elif column in self.FLOAT_COLUMNS:
+                fields.append(pyarrow.field(column, pyarrow.float64()))
+            else:
+                fields.append(pyarrow.field(column, pyarrow.string()))
+        schema = pyarrow.schema(fields)
+        
+        total = 0
+        with pyarrow.parquet.ParquetWriter(str(output_path), schema) as writer:
+            for batch in batches:
+                rows = [self.row(record, columns) for record in batch]
+                data = {}
+                for i, field in enumerate(fields):
+                    values = [row[i] for row in rows]
+                    if field.type == pyarrow.string():
+                        values = [None if value is None else str(value) for value in values]
+                    data[field.name] = values
+                writer.write_table(pyarrow.Table.from_pydict(data, schema=schema))
+                total += len(batch)
+        return total
+
 class PDFMetadataAnalyzer:
     def __init__(self):
         self.reference_file = None
         self.search_folder = None
-        self.cache_file = Path("C:/Users/Jose/Proyectos/analizador_metadata_archivobase/cache.json")
-        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_dir = Path("C:/Users/Jose/Proyectos/analizador_metadata_archivobase")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.document_stores = {}
+        self.result_cache = QueryResultCache()
+        self.text_index = TextSimilarityIndex()
+        # Puntuación ponderada: pesos por rasgo y puntuación mínima de cada nivel (baja, media, alta)
+        self.feature_weights = dict(FEATURE_WEIGHTS)
+        self.score_thresholds = {1: 1.0, 2: 3.0, 3: 4.0}
+        # Presupuestos de la caché de textos: lo que no cabe en memoria se lee del disco
+        self.text_memory_mb = 256
+        self.text_disk_mb = 8192
+        self.text_store = None
+        # Presupuesto de páginas de la primera extracción (None = todas)
+        self.text_first_pages = None
+        self.text_last_pages = 0
+        self.visual_pages = 1
+        self.extraction_workers = max(1, (os.cpu_count() or 2) - 1)
+        self.extraction_timeout = 120
+        self.extraction_memory_mb = 2048
+        self.walk_workers = 16
+        # Concurrencia de las etapas de la canalización (la extracción usa extraction_workers)
+        self.read_workers = 4
+        self.hash_workers = 2
+        self.pipeline_queue_size = 8
+        # Coste de extracción aprendido de escaneos anteriores (orden de trabajo y estimación de tiempo)
+        self.cost_model = None
+        # Consultas de vigilancia guardadas junto a los cachés
+        self.watchlist = None
+        self.scan_filters = ScanFilters()
     
-    def get_folder_modification_time(self, folder_path):
-        """Obtiene el tiempo de modificación de una carpeta recursivamente"""
-        try:
-            folder = Path(folder_path)
-            if not folder.exists():
-                return None
-            
-            # Obtener el tiempo de modificación de la carpeta principal
-            latest_time = folder.stat().st_mtime
-            
-            # Buscar recursivamente en subcarpetas
-            for item in folder.rglob('*'):
-                if item.is_file():
-                    item_time = item.stat().st_mtime
-                    if item_time > latest_time:
-                        latest_time = item_time
-            
-            return latest_time
-        except Exception as e:
-            print(f"Error obteniendo tiempo de modificación de carpeta: {e}")
-            return None
+    def for_reference(self, reference_file):
+        """Copia ligera del analizador con otra referencia; comparte los almacenes de documentos"""
+        self.get_text_store()
+        self.get_cost_model()
+        self.get_watchlist()
+        analyzer = copy.copy(self)
+        analyzer.reference_file = reference_file
+        return analyzer
+    
+    def get_document_store(self, search_folder):
+        """Almacén de documentos de una carpeta con los filtros actuales (compartido entre pestañas)"""
+        store_key = (search_folder, self.scan_filters.cache_key())
+        store = self.document_stores.get(store_key)
+        if store is None:
+            store = DocumentStore(self.cache_dir, search_folder, self.create_supervisor, self.result_cache,
+                                  DirectoryTree(self.walk_workers, filters=self.scan_filters),
+                                  self.get_text_store(), pipeline_factory=self.create_pipeline)
+            self.document_stores[store_key] = store
+        store.page_budget = (self.text_first_pages, self.text_last_pages)
+        store.watchlist = self.get_watchlist()
+        return store
+    
+    def get_text_store(self):
+        """Caché de textos compartida por todos los almacenes de documentos"""
+        if self.text_store is None:
+            self.text_store = TextBlobStore(self.cache_dir / 'textos',
+                                            self.text_memory_mb * 1024 * 1024,
+                                            self.text_disk_mb * 1024 * 1024)
+        return self.text_store
     
-    def load_cache(self, search_folder):
-        """Carga el caché si existe y es válido - Ahora completamente automático"""
+    def read_pdf_info(self, pdf_path):
+        """Lee el diccionario Info y el número de páginas de un PDF
+
+        Usa primero PDFInfoReader (solo trailer, xref y los objetos necesarios)
+        y recurre a fitz.open cuando el lector rápido no entiende el archivo.
+        """
         try:
-            if not self.cache_file.exists():
-                return None, "No existe archivo de caché"
-            
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            
-            # Verificar si la carpeta es la misma
-            cached_folder = cache_data.get('search_folder')
-            if cached_folder != search_folder:
-                return None, "Carpeta diferente"
-            
-            # Verificar si la carpeta ha sido modificada
-            current_mod_time = self.get_folder_modification_time(search_folder)
-            cached_mod_time = cache_data.get('folder_modification_time')
-            
-            if current_mod_time != cached_mod_time:
-                return None, "Carpeta modificada"
-            
-            # Verificar integridad de los archivos en caché
-            pdf_files = cache_data.get('pdf_files', {})
-            for file_path, file_data in pdf_files.items():
-                if not Path(file_path).exists():
-                    return None, "Archivo en caché no existe"
-                
-                # Verificar si el archivo ha sido modificado
-                current_file_time = Path(file_path).stat().st_mtime
-                cached_file_time = file_data.get('modification_time')
-                if current_file_time != cached_file_time:
-                    return None, "Archivo modificado"
-            
-            return pdf_files, "Caché válido"
-            
-        except Exception as e:
-            print(f"Error cargando caché: {e}")
-            return None, f"Error: {str(e)}"
+            return PDFInfoReader().read(pdf_path)
+        except (ValueError, OSError) as e:
+            print(f"Lector rápido no disponible para {pdf_path.name}: {e} - usando fitz")
+        
+        with fitz.open(pdf_path) as doc:
+            metadata = dict(doc.metadata or {})
+            metadata['page_count'] = len(doc)
+            file_id = re.search(r'/ID\s*\[\s*<([0-9A-Fa-f]*)>\s*<([0-9A-Fa-f]*)>', doc.pdf_trailer() or '')
+            metadata['id'] = [part.lower() for part in file_id.groups()] if file_id else []
+            metadata['xmp'] = PDFInfoReader().parse_xmp(doc.get_xml_metadata() or '')
+            return metadata
     
-    def save_cache(self, search_folder, pdf_files):
-        """Guarda los metadatos en caché"""
+    def get_pdf_metadata(self, pdf_path, compute_hash=True):
+        """Extrae metadatos completos de un PDF"""
         try:
-            # Convertir objetos datetime a strings para serialización JSON
-            serializable_pdf_files = {}
-            for file_path, file_data in pdf_files.items():
-                serializable_data = file_data.copy()
-                # Convertir datetime a string ISO format
-                if isinstance(serializable_data.get('modificado'), datetime):
-                    serializable_data['modificado'] = serializable_data['modificado'].isoformat()
-                serializable_pdf_files[file_path] = serializable_data
-            
-            cache_data = {
-                'search_folder': search_folder,
-                'folder_modification_time': self.get_folder_modification_time(search_folder),
-                'cache_timestamp': time.time(),
-                'cache_date': datetime.now().isoformat(),
-                'total_files': len(pdf_files),
-                'pdf_files': serializable_pdf_files
-            }
-            
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, ensure_ascii=False)
-            
-            print(f"Caché guardado exitosamente: {len(pdf_files)} archivos")
-            
+            return True, self.build_metadata(pdf_path, self.read_pdf_info(pdf_path), compute_hash)
         except Exception as e:
-            print(f"Error guardando caché: {e}")
+            return False, f"Error al leer metadatos: {str(e)}"
     
-    def get_pdf_metadata(self, pdf_path):
-        """Extrae metadatos completos de un PDF"""
+    def build_metadata(self, pdf_path, metadata, compute_hash=True):
+        """Completa el diccionario Info leído con el hash y los datos del sistema de archivos"""
+        # Calcular hash SHA256 (solo para información, no para comparación)
+        file_hash = None
+        if compute_hash:
+            with open(pdf_path, 'rb') as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+        
+        # Obtener información del sistema de archivos
+        file_stat = pdf_path.stat()
+        file_size = file_stat.st_size
+        file_modified = datetime.fromtimestamp(file_stat.st_mtime)
+        
+        # Formatear fecha de creación
+        creation_date = self.format_pdf_date(metadata.get('creationDate', 'No disponible'))
+        mod_date = self.format_pdf_date(metadata.get('modDate', 'No disponible'))
+        
+        # Información completa
+        return {
+            'ruta': str(pdf_path),
+            'nombre': pdf_path.name,
+            'tamaño': file_size,
+            'modificado': file_modified,
+            'hash_sha256': file_hash,
+            'creador': metadata.get('creator', 'No disponible'),
+            'productor': metadata.get('producer', 'No disponible'),
+            'titulo': metadata.get('title', 'No disponible'),
+            'asunto': metadata.get('subject', 'No disponible'),
+            'palabras_clave': metadata.get('keywords', 'No disponible'),
+            'fecha_creacion': creation_date,
+            'fecha_modificacion': mod_date,
+            'paginas': metadata['page_count'],
+            'version_pdf': metadata.get('format', '').replace('PDF ', '') or 'No disponible',
+            'id_trailer': metadata.get('id', []),
+            'xmp_document_id': (metadata.get('xmp') or {}).get('documentID', 'No disponible'),
+            'xmp_instance_id': (metadata.get('xmp') or {}).get('instanceID', 'No disponible'),
+            'modification_time': file_stat.st_mtime
+        }
+    
+    def extract_document(self, pdf_path, first_pages=None, last_pages=0, compute_hash=True):
+        """Extrae en una sola pasada el registro completo de un PDF para el almacén
+
+        Metadatos, texto por página y firma MinHash. Si el texto no se puede
+        leer el registro se guarda igualmente, sin páginas ni firma. Con
+        `first_pages` solo se leen esas primeras páginas y las `last_pages`
+        últimas; las demás quedan vacías hasta que se complete el texto. Sin
+        `compute_hash` el SHA-256 queda vacío (lo calcula la canalización).
+        """
+        success, document = self.get_pdf_metadata(pdf_path, compute_hash)
+        if not success:
+            return False, document
+        
         try:
             with fitz.open(pdf_path) as doc:
-                metadata = doc.metadata
-                
-                # Calcular hash SHA256 (solo para información, no para comparación)
-                with open(pdf_path, 'rb') as f:
-                    file_hash = hashlib.sha256(f.read()).hexdigest()
-                
-                # Obtener información del sistema de archivos
-                file_stat = pdf_path.stat()
-                file_size = file_stat.st_size
-                file_modified = datetime.fromtimestamp(file_stat.st_mtime)
-                
-                # Formatear fecha de creación
-                creation_date = self.format_pdf_date(metadata.get('creationDate', 'No disponible'))
-                mod_date = self.format_pdf_date(metadata.get('modDate', 'No disponible'))
-                
-                # Información completa
-                full_metadata = {
-                    'ruta': str(pdf_path),
-                    'nombre': pdf_path.name,
-                    'tamaño': file_size,
-                    'modificado': file_modified,
-                    'hash_sha256': file_hash,
-                    'creador': metadata.get('creator', 'No disponible'),
-                    'productor': metadata.get('producer', 'No disponible'),
-                    'titulo': metadata.get('title', 'No disponible'),
-                    'asunto': metadata.get('subject', 'No disponible'),
-                    'palabras_clave': metadata.get('keywords', 'No disponible'),
-                    'fecha_creacion': creation_date,
-                    'fecha_modificacion': mod_date,
-                    'paginas': len(doc),
-                    'modification_time': file_stat.st_mtime
-                }
-                
-                return True, full_metadata
-                
+                ranges = page_budget_ranges(len(doc), first_pages, last_pages)
+                pages_text = read_page_text(doc, ranges)
+                document['fuentes'] = self.read_fonts(doc, ranges)
         except Exception as e:
-            return False, f"Error al leer metadatos: {str(e)}"
+            print(f"Error leyendo texto de {pdf_path}: {str(e)}")
+            pages_text = []
+            ranges = [[0, 0]]
+        
+        document['paginas_texto'] = pages_text
+        document['texto_normalizado'] = fold_text("".join(pages_text))
+        document['paginas_extraidas'] = ranges
+        document['texto_completo'] = ranges == [[0, len(pages_text)]]
+        document['firma_minhash'] = self.text_index.signature("".join(pages_text))
+        return True, document
+    
+    def read_fonts(self, doc, ranges=None):
+        """Nombres de las fuentes incrustadas o referenciadas (sin el prefijo de subconjunto ABCDEF+)
+
+        Con `ranges` ([[inicio, fin], ...], los de page_budget_ranges) solo se
+        miran esas páginas: el presupuesto de páginas también acota las fuentes.
+        """
+        fonts = set()
+        if ranges is None:
+            ranges = [[0, len(doc)]]
+        page_numbers = itertools.chain.from_iterable(range(start, min(end, len(doc))) for start, end in ranges)
+        for page_number in page_numbers:
+            for font in doc.get_page_fonts(page_number):
+                if font[3]:
+                    fonts.add(font[3].split('+', 1)[-1])
+        return sorted(fonts)
+    
+    def reference_features(self, reference_metadata):
+        """Rasgos de la referencia; las fuentes se leen aquí si sus metadatos no las traen"""
+        if 'fuentes' not in reference_metadata and self.reference_file:
+            try:
+                with fitz.open(self.reference_file) as doc:
+                    reference_metadata = dict(reference_metadata, fuentes=self.read_fonts(doc))
+            except Exception as e:
+                print(f"No se pudieron leer las fuentes de la referencia: {e}")
+        return compute_features(reference_metadata)
+    
+    def score_level(self, score):
+        """Nivel (ALTA, MEDIA o BAJA) que alcanza una puntuación"""
+        for level, name in ((3, "ALTA"), (2, "MEDIA")):
+            if score >= self.score_thresholds[level]:
+                return name
+        return "BAJA"
+    
+    def benchmark_metadata_readers(self, folder_path):
+        """Compara el lector rápido con fitz.open sobre los PDFs de una carpeta
+
+        Devuelve un resumen con los tiempos de cada método, cuántos archivos
+        necesitaron fitz y en cuántos difieren los campos que usa la comparación.
+        """
+        fields = ('creator', 'producer', 'creationDate', 'modDate', 'title', 'subject', 'keywords')
+        directory_builder = DirectoryTree()
+        pdf_files = [pdf_path for pdf_path, _, _ in
+                     directory_builder.iter_files(directory_builder.validate(folder_path)[0], folder_path)]
+        summary = {'archivos': len(pdf_files), 'tiempo_rapido': 0.0, 'tiempo_fitz': 0.0,
+                   'fallback_fitz': 0, 'diferencias': []}
+        
+        for pdf_path in pdf_files:
+            start = time.perf_counter()
+            try:
+                fast = PDFInfoReader().read(pdf_path)
+            except (ValueError, OSError):
+                fast = None
+                summary['fallback_fitz'] += 1
+            summary['tiempo_rapido'] += time.perf_counter() - start
+            
+            start = time.perf_counter()
+            try:
+                with fitz.open(pdf_path) as doc:
+                    reference = dict(doc.metadata or {})
+                    reference['page_count'] = len(doc)
+            except Exception:
+                reference = None
+            summary['tiempo_fitz'] += time.perf_counter() - start
+            
+            if fast and reference:
+                different = [field for field in fields + ('page_count',)
+                             if (fast.get(field) or '') != (reference.get(field) or '')]
+                if different:
+                    summary['diferencias'].append((str(pdf_path), different))
+        
+        if summary['tiempo_rapido'] > 0:
+            summary['aceleracion'] = summary['tiempo_fitz'] / summary['tiempo_rapido']
+        return summary
     
     def format_pdf_date(self, pdf_date_string):
         """Convierte el formato de fecha PDF a formato legible"""
@@ -177,240 +3675,366 @@ class PDFMetadataAnalyzer:
     
     def normalize_metadata_value(self, value):
         """Normaliza valores de metadatos para comparación"""
-        if value == 'No disponible' or not value:
-            return None
-        return str(value).strip().lower()
+        return normalize_feature(value)
+    
+    def create_supervisor(self):
+        """Supervisor de extracción con los límites configurados en el analizador"""
+        return ExtractionSupervisor(self.extraction_workers, self.extraction_timeout, self.extraction_memory_mb)
+    
+    def create_pipeline(self, supervisor):
+        """Canalización de escaneo con la concurrencia configurada en el analizador"""
+        return ExtractionPipeline(supervisor, self.read_workers, self.hash_workers, self.pipeline_queue_size,
+                                  self.get_cost_model())
+    
+    def get_watchlist(self):
+        """Consultas de vigilancia compartidas por todos los almacenes"""
+        if self.watchlist is None:
+            self.watchlist = Watchlist(self.cache_dir / 'vigilancia.json', self.cache_dir / 'vigilancia_informe.jsonl',
+                                       self.feature_weights)
+        return self.watchlist
+    
+    def add_watch(self, name, reference_file, score_threshold=None, text_threshold=None):
+        """Vigila una referencia: los archivos que se incorporen a partir de ahora se comprueban contra ella
+
+        Sin `score_threshold` se usa la puntuación del nivel medio. Con
+        `text_threshold` también se vigila la similitud de texto.
+        """
+        success, reference_metadata = self.get_pdf_metadata(Path(reference_file))
+        if not success:
+            raise ValueError(reference_metadata)
+        features = self.for_reference(reference_file).reference_features(reference_metadata)
+        signature = None
+        if text_threshold is not None:
+            signature = self.text_index.signature(self.extract_text(Path(reference_file)))
+        if score_threshold is None:
+            score_threshold = self.score_thresholds[2]
+        self.get_watchlist().add(name, features, score_threshold, signature, text_threshold, str(reference_file))
+    
+    def review_watchlist(self, search_folder):
+        """Comprueba una vez toda una carpeta contra las consultas (p. ej. al añadir una nueva)"""
+        store = self.get_document_store(search_folder)
+        store.refresh()
+        return self.get_watchlist().check(search_folder, list(store.documents.values()))
+    
+    def get_cost_model(self):
+        """Modelo de coste de extracción compartido, guardado junto a los cachés"""
+        if self.cost_model is None:
+            self.cost_model = ExtractionCostModel(self.cache_dir / 'modelo_coste.json')
+        return self.cost_model
+    
+    def extract_text(self, pdf_path):
+        """Extrae el texto completo de un PDF (cadena vacía si no se puede leer)"""
+        try:
+            with fitz.open(pdf_path) as doc:
+                return "".join(page.get_text() for page in doc)
+        except Exception as e:
+            print(f"Error leyendo {pdf_path}: {str(e)}")
+            return ""
+    
+    def compute_text_similarity(self, store, text_threshold):
+        """Devuelve {ruta: jaccard_estimado} de los PDFs con texto casi idéntico al de referencia
+
+        Las firmas MinHash ya están en el almacén (se calculan al extraer cada
+        documento), así que solo se consulta el índice LSH.
+        """
+        reference_signature = self.text_index.signature(self.extract_text(Path(self.reference_file)))
+        return store.text_index.query(reference_signature, text_threshold)
+    
+    def find_visual_matches(self, store, reference_hashes, max_distance):
+        """Devuelve {ruta: distancia} de los PDFs cuyas páginas renderizadas se parecen a la referencia
+
+        El árbol BK del almacén (visual_index, sobre la primera página) da los
+        candidatos; después se exige que todas las páginas comparadas estén
+        dentro de la distancia máxima.
+        """
+        reference_values = [int(h, 16) for h in reference_hashes]
+        if not reference_values or reference_values[0] == 0:
+            print("La referencia no tiene huella visual utilizable")
+            return {}
+        
+        matches = {}
+        for file_path, _ in store.visual_index.query(reference_values[0], max_distance):
+            document = store.documents.get(file_path)
+            if document is None:
+                continue
+            values = [int(h, 16) for h in document['huella_visual']['hashes']]
+            distance = max(BKTree.hamming(a, b) for a, b in zip(reference_values, values))
+            if distance <= max_distance:
+                matches[file_path] = distance
+        return matches
     
-    def find_similar_by_metadata(self, reference_metadata, search_folder, include_hash=False, min_matches=2, progress_callback=None):
-        """Busca PDFs con metadatos similares - Ahora con caché automático"""
+    def find_similar_by_metadata(self, reference_metadata, search_folder, include_hash=False, min_matches=2, progress_callback=None, text_threshold=None, visual_distance=None, should_stop=None, refresh=True, score_threshold=None):
+        """Busca PDFs con metadatos similares - Ahora con caché automático
+
+        Con `text_threshold` se añade la similitud de texto (MinHash/LSH) como
+        señal adicional: los archivos cuyo texto supera el umbral se detectan
+        aunque sus metadatos no coincidan (nivel TEXTO). Con `visual_distance`
+        se compara la huella visual de las primeras páginas (nivel VISUAL),
+        útil para escaneos sin texto ni metadatos.
+
+        Devuelve (lista ordenada por puntuación, cache_used); para recibir
+        los resultados a medida que aparecen usar iter_similar_by_metadata.
+        Si `should_stop()` devuelve True el análisis se corta cuanto antes y
+        lo ya extraído queda guardado para la siguiente ejecución. Con
+        `refresh=False` se consulta el almacén tal como está (lo mantiene al
+        día un indexador en segundo plano).
+        """
         similar_files = []
-        pdf_files_data = {}
         cache_used = False
+        for kind, data in self.iter_similar_by_metadata(reference_metadata, search_folder, include_hash, min_matches,
+                                                         progress_callback, text_threshold, visual_distance,
+                                                         should_stop=should_stop, refresh=refresh,
+                                                         score_threshold=score_threshold):
+            if kind == 'coincidencia':
+                similar_files.append(data)
+            else:
+                cache_used = data['cache_used']
+                if data['cancelado']:
+                    print(f"Análisis detenido: {data['estado_cache']}")
         
-        # SIEMPRE intentar cargar desde caché primero
-        cached_data, cache_status = self.load_cache(search_folder)
-        if cached_data:
-            pdf_files_data = cached_data
-            cache_used = True
+        similar_files.sort(key=lambda x: x['score'], reverse=True)
+        return similar_files, cache_used
+    
+    def iter_similar_by_metadata(self, reference_metadata, search_folder, include_hash=False, min_matches=2, progress_callback=None, text_threshold=None, visual_distance=None, top_k=None, should_stop=None, refresh=True, score_threshold=None):
+        """Versión en streaming de find_similar_by_metadata: genera eventos (tipo, datos)
+
+        Genera ('coincidencia', resultado) en cuanto se detecta cada archivo y,
+        al final, ('resumen', {...}) con cache_used y los contadores. Con
+        `top_k` solo se conservan los K mejores en un montículo acotado, que se
+        generan ordenados al terminar la comparación.
+
+        Cada rasgo coincidente suma su peso (feature_weights); un archivo es
+        similar si su puntuación llega a `score_threshold` o, sin él, a la del
+        nivel `min_matches` (1 baja, 2 media, 3 alta) en score_thresholds. Solo
+        se puntúan los registros que comparten algún rasgo con la referencia.
+        """
+        # Almacén compartido: solo se extraen los archivos nuevos o modificados
+        store = self.get_document_store(search_folder)
+        if refresh:
+            cache_status, extracted_files = store.refresh(progress_callback, should_stop)
+        else:
+            cache_status, extracted_files = store.ensure_loaded(), []
+        scanned_files = set(extracted_files)
+        
+        # Huella visual (se calcula una vez por archivo y queda en el almacén)
+        if visual_distance is not None and self.reference_file:
+            store.ensure_visual_fingerprints(self.visual_pages, progress_callback, should_stop)
+        
+        # La similitud de texto compara documentos completos
+        if text_threshold is not None and self.reference_file:
+            store.extend_text(progress_callback, should_stop)
+        
+        total_files_to_compare = len(store.documents)
+        cache_used = total_files_to_compare > len(scanned_files)
+        if cache_used:
             print(f"✓ Caché automático: {cache_status}")
-            
-            # Convertir strings de fecha de vuelta a objetos datetime para archivos en caché
-            for file_path, file_data in pdf_files_data.items():
-                if 'modificado' in file_data and isinstance(file_data['modificado'], str):
-                    try:
-                        pdf_files_data[file_path]['modificado'] = datetime.fromisoformat(file_data['modificado'])
-                    except:
-                        # Si falla la conversión, mantener el string
-                        pass
         else:
             print(f"✗ Caché no disponible: {cache_status}")
-            # Escanear archivos si el caché no es válido
-            pdf_files = [f for f in Path(search_folder).rglob("*.pdf") 
-                        if not f.name.startswith('~$')]
-            total_files = len(pdf_files)
-            
-            for i, pdf_file in enumerate(pdf_files):
-                if progress_callback and hasattr(progress_callback, '__call__'):
-                    progress_callback(i, total_files, f"Analizando: {pdf_file.name}")
-                
-                success, metadata = self.get_pdf_metadata(pdf_file)
-                if success:
-                    pdf_files_data[str(pdf_file)] = metadata
-                
-                if i % 10 == 0:
-                    print(f"Escaneando: {i}/{total_files} archivos")
-            
-            # GUARDAR CACHÉ automáticamente después del escaneo
-            self.save_cache(search_folder, pdf_files_data)
         
-        # Normalizar metadatos de referencia
-        ref_creator = self.normalize_metadata_value(reference_metadata.get('creador'))
-        ref_producer = self.normalize_metadata_value(reference_metadata.get('productor'))
-        ref_creation_date = self.normalize_metadata_value(reference_metadata.get('fecha_creacion'))
-        ref_hash = reference_metadata.get('hash_sha256') if include_hash else None
+        # 🔥 Consulta repetida sobre el mismo almacén: se responde desde la caché de resultados
+        weights = dict(self.feature_weights)
+        if not include_hash:
+            weights['hash'] = 0
+        if score_threshold is None:
+            score_threshold = self.score_thresholds[min(max(min_matches, 1), 3)]
+        cache_key = ('similares', search_folder, store.filter_key, store.generation, self.reference_file,
+                     reference_metadata.get('hash_sha256'), include_hash, score_threshold,
+                     tuple(sorted(weights.items())), text_threshold, visual_distance, top_k)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            results, summary = cached
+            for result in results:
+                yield 'coincidencia', dict(result, from_cache=True)
+            yield 'resumen', dict(summary, cache_used=cache_used, estado_cache=cache_status,
+                                  extraidos=len(scanned_files), resultado_en_cache=True)
+            return
+        
+        visual_distances = {}
+        if visual_distance is not None and self.reference_file:
+            reference_hashes = compute_visual_fingerprint(self.reference_file, self.visual_pages)
+            visual_distances = self.find_visual_matches(store, reference_hashes, visual_distance)
+        
+        # Similitud de texto (solo consulta el índice LSH, no compara todos los pares)
+        text_scores = {}
+        if text_threshold is not None and self.reference_file:
+            text_scores = self.compute_text_similarity(store, text_threshold)
         
-        total_files_to_compare = len(pdf_files_data)
+        # 🔥 Puntuación ponderada con el índice invertido de rasgos (no recorre toda la carpeta)
+        reference_features = self.reference_features(reference_metadata)
+        compared_fields = [field for field in FEATURE_WEIGHTS if weights.get(field) and field in reference_features]
+        max_score = sum(weights[field] for field in compared_fields)
+        scores = store.feature_index.score(reference_features, weights, score_threshold)
+        candidates = list(scores)
+        candidates += [file_path for file_path in list(text_scores) + list(visual_distances) if file_path not in scores]
         
-        # Buscar coincidencias
-        for i, (file_path, metadata) in enumerate(pdf_files_data.items()):
-            if file_path == self.reference_file:
+        best_matches = []
+        returned = []
+        found = 0
+        
+        for i, file_path in enumerate(dict.fromkeys(candidates)):
+            metadata = store.documents.get(file_path)
+            if metadata is None or file_path == self.reference_file:
                 continue
             
-            if progress_callback and hasattr(progress_callback, '__call__'):
-                progress_callback(i, total_files_to_compare, f"Comparando: {Path(file_path).name}")
-            
-            comp_creator = self.normalize_metadata_value(metadata.get('creador'))
-            comp_producer = self.normalize_metadata_value(metadata.get('productor'))
-            comp_creation_date = self.normalize_metadata_value(metadata.get('fecha_creacion'))
-            comp_hash = metadata.get('hash_sha256') if include_hash else None
-            
-            matches = 0
-            total_possible = 3 + (1 if include_hash else 0)
-            match_details = []
-            
-            # Campos base
-            creator_match = False
-            producer_match = False  
-            creation_date_match = False
-            hash_match = False
-            
-            if ref_creator and comp_creator and ref_creator == comp_creator:
-                matches += 1
-                creator_match = True
-                match_details.append("✓ Creator")
-            else:
-                match_details.append("✗ Creator")
+            if should_stop and should_stop():
+                break
             
-            if ref_producer and comp_producer and ref_producer == comp_producer:
-                matches += 1
-                producer_match = True
-                match_details.append("✓ Producer")
-            else:
-                match_details.append("✗ Producer")
+            if progress_callback and hasattr(progress_callback, '__call__'):
+                progress_callback(i, len(candidates), f"Comparando: {Path(file_path).name}")
             
-            if ref_creation_date and comp_creation_date and ref_creation_date == comp_creation_date:
-                matches += 1
-                creation_date_match = True
-                match_details.append("✓ Create Date")
-            else:
-                match_details.append("✗ Create Date")
+            score, matched_fields = scores.get(file_path, (0.0, []))
+            match_details = [f"{'✓' if field in matched_fields else '✗'} {FEATURE_LABELS[field]}"
+                             for field in compared_fields]
             
-            if include_hash:
-                if ref_hash and comp_hash and ref_hash == comp_hash:
-                    matches += 1
-                    hash_match = True
-                    match_details.append("✓ Hash SHA256")
+            text_similarity = text_scores.get(file_path)
+            if text_threshold is not None:
+                if text_similarity is not None:
+                    match_details.append(f"✓ Texto ({text_similarity:.0%})")
                 else:
-                    match_details.append("✗ Hash SHA256")
+                    match_details.append("✗ Texto")
             
-            # 🔥 NUEVA LÓGICA MEJORADA para detección de trampas
-            similarity_level = "BAJA"
-            is_similar = False
+            visual_match = visual_distances.get(file_path)
+            if visual_distance is not None:
+                if visual_match is not None:
+                    match_details.append(f"✓ Huella visual (d={visual_match})")
+                else:
+                    match_details.append("✗ Huella visual")
             
-            if min_matches == 1:  # Nivel Bajo - Cualquier coincidencia
-                is_similar = matches >= 1
-                similarity_level = "BAJA"
+            is_similar = score >= score_threshold
+            similarity_level = self.score_level(score)
             
-            elif min_matches == 2:  # Nivel Medio - CREATE DATE OBLIGATORIO
-                # Requiere Create Date + al menos otro campo
-                if creation_date_match and (creator_match or producer_match or (include_hash and hash_match)):
-                    is_similar = True
-                    similarity_level = "MEDIA"
-                else:
-                    is_similar = False
+            # Texto casi idéntico aunque los metadatos no coincidan (re-exportaciones)
+            if not is_similar and text_similarity is not None:
+                is_similar = True
+                similarity_level = "TEXTO"
             
-            elif min_matches >= 3:  # Nivel Alto - Todas las coincidencias
-                is_similar = matches >= min_matches
-                similarity_level = "ALTA"
+            # Misma apariencia visual (escaneos sin texto ni metadatos útiles)
+            if not is_similar and visual_match is not None:
+                is_similar = True
+                similarity_level = "VISUAL"
             
             if is_similar:
-                similar_files.append({
+                found += 1
+                result = {
                     'metadata': metadata,
-                    'matches': matches,
-                    'total_possible': total_possible,
+                    'matches': len(matched_fields),
+                    'total_possible': len(compared_fields),
+                    'score': round(score, 2),
+                    'max_score': round(max_score, 2),
                     'similarity_level': similarity_level,
                     'match_details': match_details,
+                    'text_similarity': text_similarity,
+                    'visual_distance': visual_match,
                     'ruta_completa': file_path,
-                    'from_cache': cache_used
-                })
+                    'from_cache': file_path not in scanned_files
+                }
+                if top_k is None:
+                    returned.append(result)
+                    yield 'coincidencia', result
+                elif len(best_matches) < top_k:
+                    heapq.heappush(best_matches, (score, -i, result))
+                else:
+                    heapq.heappushpop(best_matches, (score, -i, result))
         
-        similar_files.sort(key=lambda x: x['matches'], reverse=True)
-        return similar_files, cache_used
+        for _, _, result in sorted(best_matches, key=lambda item: item[:2], reverse=True):
+            returned.append(result)
+            yield 'coincidencia', result
+        
+        summary = {
+            'cache_used': cache_used,
+            'estado_cache': cache_status,
+            'archivos': total_files_to_compare,
+            'candidatos': len(candidates),
+            'extraidos': len(scanned_files),
+            'coincidencias': found,
+            'devueltas': len(returned),
+            'cancelado': bool(should_stop and should_stop()),
+            'resultado_en_cache': False
+        }
+        if not summary['cancelado']:
+            self.result_cache.put(cache_key, (returned, summary))
+        yield 'resumen', summary
+    
+    def iter_folder_join(self, incoming_folder, archive_folder, include_hash=False, min_matches=2, score_threshold=None, text_threshold=None, progress_callback=None, should_stop=None, refresh=True):
+        """Cruza dos carpetas: genera los pares (entrante, archivo) que se parecen
+
+        En lugar de una búsqueda de similares por cada PDF entrante es un hash
+        join en una sola pasada: el índice invertido de rasgos del almacén del
+        archivo (su FeatureIndex, ya construido al cargarlo) hace de tabla de
+        la fase de construcción y cada registro entrante la sondea con sus
+        valores normalizados. El coste crece con el tamaño de las dos carpetas
+        y el número de pares, no con su producto. Las reglas son las de
+        find_similar_by_metadata: pesos, umbral (o nivel `min_matches`) y, con
+        `text_threshold`, la similitud de texto por LSH (nivel TEXTO).
+        """
+        incoming = self.get_document_store(incoming_folder)
+        archive = self.get_document_store(archive_folder)
+        for store in (incoming, archive):
+            if refresh:
+                store.refresh(progress_callback, should_stop)
+            else:
+                store.ensure_loaded()
+            if text_threshold is not None:
+                store.extend_text(progress_callback, should_stop)
+        
+        weights = dict(self.feature_weights)
+        if not include_hash:
+            weights['hash'] = 0
+        if score_threshold is None:
+            score_threshold = self.score_thresholds[min(max(min_matches, 1), 3)]
+        
+        documents = list(incoming.documents.items())
+        for i, (file_path, document) in enumerate(documents):
+            if should_stop and should_stop():
+                return
+            if progress_callback and hasattr(progress_callback, '__call__'):
+                progress_callback(i, len(documents), f"Cruzando: {Path(file_path).name}")
+            
+            features = compute_features(document)
+            compared_fields = [field for field in FEATURE_WEIGHTS if weights.get(field) and field in features]
+            max_score = sum(weights[field] for field in compared_fields)
+            scores = archive.feature_index.score(features, weights, score_threshold)
+            text_scores = {}
+            if text_threshold is not None:
+                text_scores = archive.text_index.query(document.get('firma_minhash'), text_threshold)
+            
+            for archive_path in dict.fromkeys(list(scores) + list(text_scores)):
+                if archive_path == file_path:
+                    continue
+                score, matched_fields = scores.get(archive_path, (0.0, []))
+                text_similarity = text_scores.get(archive_path)
+                if score >= score_threshold:
+                    similarity_level = self.score_level(score)
+                elif text_similarity is not None:
+                    similarity_level = "TEXTO"
+                else:
+                    continue
+                yield {
+                    'entrante': file_path,
+                    'archivo': archive_path,
+                    'nivel': similarity_level,
+                    'puntuacion': round(score, 2),
+                    'puntuacion_max': round(max_score, 2),
+                    'coincidencias': len(matched_fields),
+                    'similitud_texto': text_similarity,
+                    'detalles': [FEATURE_LABELS[field] for field in matched_fields]
+                }
 
 class PDFSearchTab:
-    def __init__(self, parent_frame):
+    def __init__(self, parent_frame, analyzer=None, query_client=None):
         self.parent = parent_frame
         self.is_searching = False
         self.stop_search = False
-        self.cache_file = Path("C:/Users/Jose/Proyectos/analizador_metadata_archivobase/cache_text.json")
-        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # Mismo almacén de documentos que el análisis de metadatos
+        self.analyzer = analyzer or PDFMetadataAnalyzer()
+        self.query_client = query_client
         self.setup_search_tab()
     
-    def get_folder_modification_time(self, folder_path):
-        """Obtiene el tiempo de modificación de una carpeta recursivamente"""
-        try:
-            folder = Path(folder_path)
-            if not folder.exists():
-                return None
-            
-            # Obtener el tiempo de modificación de la carpeta principal
-            latest_time = folder.stat().st_mtime
-            
-            # Buscar recursivamente en subcarpetas
-            for item in folder.rglob('*'):
-                if item.is_file():
-                    item_time = item.stat().st_mtime
-                    if item_time > latest_time:
-                        latest_time = item_time
-            
-            return latest_time
-        except Exception as e:
-            print(f"Error obteniendo tiempo de modificación de carpeta: {e}")
-            return None
-    
-    def load_text_cache(self, search_folder):
-        """Carga el caché de texto si existe y es válido"""
-        try:
-            if not self.cache_file.exists():
-                return None, "No existe archivo de caché de texto"
-            
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            
-            # Verificar si la carpeta es la misma
-            cached_folder = cache_data.get('search_folder')
-            if cached_folder != search_folder:
-                return None, "Carpeta diferente"
-            
-            # Verificar si la carpeta ha sido modificada
-            current_mod_time = self.get_folder_modification_time(search_folder)
-            cached_mod_time = cache_data.get('folder_modification_time')
-            
-            if current_mod_time != cached_mod_time:
-                return None, "Carpeta modificada"
-            
-            # Verificar integridad de los archivos en caché
-            text_cache = cache_data.get('text_cache', {})
-            for file_path, file_data in text_cache.items():
-                if not Path(file_path).exists():
-                    return None, "Archivo en caché no existe"
-                
-                # Verificar si el archivo ha sido modificado
-                current_file_time = Path(file_path).stat().st_mtime
-                cached_file_time = file_data.get('modification_time')
-                if current_file_time != cached_file_time:
-                    return None, "Archivo modificado"
-            
-            return text_cache, "Caché de texto válido"
-            
-        except Exception as e:
-            print(f"Error cargando caché de texto: {e}")
-            return None, f"Error: {str(e)}"
-    
-    def save_text_cache(self, search_folder, text_cache):
-        """Guarda el texto extraído en caché"""
-        try:
-            cache_data = {
-                'search_folder': search_folder,
-                'folder_modification_time': self.get_folder_modification_time(search_folder),
-                'cache_timestamp': time.time(),
-                'cache_date': datetime.now().isoformat(),
-                'total_files': len(text_cache),
-                'text_cache': text_cache
-            }
-            
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, ensure_ascii=False)
-            
-            print(f"Caché de texto guardado exitosamente: {len(text_cache)} archivos")
-            
-        except Exception as e:
-            print(f"Error guardando caché de texto: {e}")
-    
     def setup_search_tab(self):
         # Variables
         self.folder_path = tk.StringVar()
         self.search_text = tk.StringVar()
+        self.full_coverage = tk.BooleanVar(value=False)
         
         # Marco principal de búsqueda
         search_main_frame = ttk.Frame(self.parent)
@@ -450,6 +4074,10 @@ class PDFSearchTab:
                                      command=self.stop_search_process, state=tk.DISABLED)
         self.stop_button.pack(side=tk.LEFT, padx=2)
         
+        # Sin marcar solo se busca en las páginas extraídas en la primera pasada
+        ttk.Checkbutton(selection_frame, text="Buscar en todas las páginas (completa la extracción)",
+                        variable=self.full_coverage).grid(row=2, column=1, sticky=tk.W, pady=5)
+        
         selection_frame.columnconfigure(1, weight=1)
         
         # Progress bar
@@ -491,6 +4119,16 @@ class PDFSearchTab:
         
         # Bind para abrir archivo con doble click
         self.results_list.bind('<Double-Button-1>', lambda e: self.open_selected_file())
+        self.results_list.bind('<<ListboxSelect>>', lambda e: self.show_snippets())
+        
+        # Fragmentos del archivo seleccionado (salen del texto en caché, sin abrir el PDF)
+        snippets_frame = ttk.LabelFrame(results_frame, text="Fragmentos", padding="5")
+        snippets_frame.pack(fill=tk.X, pady=(10, 0))
+        self.snippets_text = tk.Text(snippets_frame, height=7, wrap=tk.WORD)
+        self.snippets_text.pack(fill=tk.X)
+        self.snippets_text.tag_configure('pagina', foreground='#555555')
+        self.snippets_text.tag_configure('acierto', background='#fff2a8')
+        self.hits = {}
     
     def select_folder(self):
         folder = filedialog.askdirectory(title="Seleccionar carpeta para buscar en PDFs")
@@ -508,6 +4146,8 @@ class PDFSearchTab:
         
         # Limpiar resultados anteriores
         self.results_list.delete(0, tk.END)
+        self.snippets_text.delete(1.0, tk.END)
+        self.hits = {}
         
         # Configurar interfaz para búsqueda
         self.is_searching = True
@@ -543,63 +4183,46 @@ class PDFSearchTab:
         try:
             found_files = []
             search_string = self.search_text.get().strip()
+            full_coverage = self.full_coverage.get()
+            
+            if self.query_client:
+                # El servidor de consultas ya tiene el índice en memoria
+                self.parent.after(0, lambda: self.status_label.config(text="Consultando al servidor..."))
+                for file_path, hits in self.query_client.search_hits(self.folder_path.get(), search_string, full_coverage):
+                    found_files.append(file_path)
+                    self.hits[file_path] = hits
+                    self.parent.after(0, lambda f=file_path: self.results_list.insert(tk.END, f))
+                self.parent.after(0, self.show_search_results, found_files, self.stop_search, True)
+                return
             
-            # Excluir archivos temporales que comienzan con ~$
-            pdf_files = [f for f in Path(self.folder_path.get()).rglob("*.pdf") 
-                        if not f.name.startswith('~$')]
-            total_files = len(pdf_files)
+            # 🔥 NUEVO: ALMACÉN DE DOCUMENTOS COMPARTIDO (solo se extraen archivos nuevos o modificados,
+            # en procesos vigilados: un PDF que cuelga fitz no detiene la búsqueda)
+            store = self.analyzer.get_document_store(self.folder_path.get())
             
-            # 🔥 NUEVO: CARGAR CACHÉ DE TEXTO
-            text_cache = {}
-            cache_used = False
+            def report_progress(i, total, message, work=None):
+                self.parent.after(0, lambda: self.status_label.config(text=f"{message} ({i+1}/{total})"))
             
-            cached_data, cache_status = self.load_text_cache(self.folder_path.get())
-            if cached_data:
-                text_cache = cached_data
-                cache_used = True
+            cache_status, extracted_files = store.refresh(report_progress, should_stop=lambda: self.stop_search)
+            cache_used = len(store.documents) > len(extracted_files)
+            
+            if cache_used:
                 print(f"✓ Caché de texto: {cache_status}")
-                self.parent.after(0, lambda: self.status_label.config(text=f"Usando caché de texto - Buscando en {len(text_cache)} archivos..."))
             else:
                 print(f"✗ Caché de texto no disponible: {cache_status}")
-                # Si no hay caché válido, extraer texto de todos los archivos
-                text_cache = {}
-                for i, pdf_file in enumerate(pdf_files):
-                    if self.stop_search:
-                        break
-                        
-                    self.parent.after(0, lambda f=pdf_file.name, i=i, total=total_files: 
-                                   self.status_label.config(text=f"Extrayendo texto {i+1}/{total_files}: {f}"))
-                    
-                    try:
-                        with fitz.open(pdf_file) as doc:
-                            text = ""
-                            for page in doc:
-                                if self.stop_search:
-                                    break
-                                text += page.get_text()
-                            
-                            text_cache[str(pdf_file)] = {
-                                'full_text': text,
-                                'modification_time': pdf_file.stat().st_mtime
-                            }
-                            
-                    except Exception as e:
-                        print(f"Error leyendo {pdf_file}: {str(e)}")
-                
-                # Guardar caché de texto
-                self.save_text_cache(self.folder_path.get(), text_cache)
             
             # 🔥 BÚSQUEDA EN CACHÉ DE TEXTO (MUY RÁPIDO)
             self.parent.after(0, lambda: self.status_label.config(text="Buscando en caché de texto..."))
             
-            for file_path, text_data in text_cache.items():
-                if self.stop_search:
-                    break
-                
-                if search_string.lower() in text_data['full_text'].lower():
-                    found_files.append(file_path)
-                    # Actualizar lista en el hilo principal
-                    self.parent.after(0, lambda f=file_path: self.results_list.insert(tk.END, f))
+            if full_coverage and store.incomplete_documents():
+                self.parent.after(0, lambda: self.status_label.config(text="Completando el texto de los documentos..."))
+                store.extend_text(report_progress, should_stop=lambda: self.stop_search)
+            
+            for file_path, hits in store.search_hits(search_string, should_stop=lambda: self.stop_search):
+                found_files.append(file_path)
+                self.hits[file_path] = hits
+                # Actualizar lista en el hilo principal
+                self.parent.after(0, lambda f=file_path: self.results_list.insert(tk.END, f))
+            print(f"Caché de textos: {store.text_store.statistics()}")
             
             # Mostrar resultados finales
             self.parent.after(0, self.show_search_results, found_files, self.stop_search, cache_used)
@@ -622,6 +4245,34 @@ class PDFSearchTab:
             self.status_label.config(text=f"Búsqueda completada. No se encontraron archivos{cache_status}")
             messagebox.showinfo("Resultados", "No se encontraron archivos con el texto buscado")
     
+    def show_snippets(self):
+        """Muestra la página, la posición y el contexto de los aciertos del archivo seleccionado"""
+        self.snippets_text.delete(1.0, tk.END)
+        selection = self.results_list.curselection()
+        if not selection:
+            return
+        hits = self.hits.get(self.results_list.get(selection[0]))
+        if not hits:
+            return
+        
+        for hit in hits['aciertos']:
+            self.snippets_text.insert(tk.END, f"Pág. {hit['pagina']} [{hit['inicio']}-{hit['fin']}]  ", 'pagina')
+            self.snippets_text.insert(tk.END, hit['fragmento'] + "\n")
+        if hits['total'] > len(hits['aciertos']):
+            self.snippets_text.insert(tk.END, f"... y {hits['total'] - len(hits['aciertos'])} coincidencias más", 'pagina')
+        
+        # Lo encontrado tal como está en el texto (puede llevar acentos que la consulta no tenía)
+        for needle in {hit.get('texto') or self.search_text.get().strip() for hit in hits['aciertos']}:
+            needle = " ".join(needle.split())
+            position = '1.0'
+            while needle:
+                position = self.snippets_text.search(needle, position, stopindex=tk.END, nocase=True)
+                if not position:
+                    break
+                end = f"{position}+{len(needle)}c"
+                self.snippets_text.tag_add('acierto', position, end)
+                position = end
+    
     def open_selected_file(self):
         selection = self.results_list.curselection()
         if not selection:
@@ -638,12 +4289,13 @@ class PDFSearchTab:
                 messagebox.showerror("Error", f"No se pudo abrir el archivo: {file_path}")
 
 class MetadataAnalyzerGUI:
-    def __init__(self, root):
+    def __init__(self, root, query_client=None):
         self.root = root
         self.root.title("Analizador de Metadatos - Caché Automático + Buscador de Texto")
         self.root.geometry("1400x1000")
         
         self.analyzer = PDFMetadataAnalyzer()
+        self.query_client = query_client
         self.reference_metadata = None
         self.detected_files = []
         self.analysis_start_time = None
@@ -701,17 +4353,51 @@ class MetadataAnalyzerGUI:
         ttk.Checkbutton(left_config, text="Incluir Hash SHA256 en la comparación", 
                        variable=self.include_hash_var).pack(anchor=tk.W, pady=2)
         
+        text_similarity_frame = ttk.Frame(left_config)
+        text_similarity_frame.pack(fill=tk.X, pady=2)
+        
+        self.include_text_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(text_similarity_frame, text="Incluir similitud de texto (MinHash) - umbral:", 
+                       variable=self.include_text_var).pack(side=tk.LEFT)
+        self.text_threshold_var = tk.DoubleVar(value=0.6)
+        ttk.Spinbox(text_similarity_frame, from_=0.1, to=1.0, increment=0.05, width=5,
+                   textvariable=self.text_threshold_var).pack(side=tk.LEFT, padx=(5, 0))
+        
+        visual_frame = ttk.Frame(left_config)
+        visual_frame.pack(fill=tk.X, pady=2)
+        
+        self.include_visual_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(visual_frame, text="Incluir huella visual (primera página) - distancia máx.:", 
+                       variable=self.include_visual_var).pack(side=tk.LEFT)
+        self.visual_distance_var = tk.IntVar(value=6)
+        ttk.Spinbox(visual_frame, from_=0, to=20, increment=1, width=5,
+                   textvariable=self.visual_distance_var).pack(side=tk.LEFT, padx=(5, 0))
+        
+        filters_frame = ttk.Frame(left_config)
+        filters_frame.pack(fill=tk.X, pady=2)
+        
+        ttk.Label(filters_frame, text="Excluir (globs, separados por comas):").pack(side=tk.LEFT)
+        self.exclude_var = tk.StringVar(value="")
+        ttk.Entry(filters_frame, textvariable=self.exclude_var, width=30).pack(side=tk.LEFT, padx=(5, 10))
+        ttk.Label(filters_frame, text="Profundidad máx. (0 = sin límite):").pack(side=tk.LEFT)
+        self.max_depth_var = tk.IntVar(value=0)
+        ttk.Spinbox(filters_frame, from_=0, to=50, increment=1, width=5,
+                   textvariable=self.max_depth_var).pack(side=tk.LEFT, padx=(5, 0))
+        
         ttk.Label(left_config, text="Nivel de detección:").pack(anchor=tk.W, pady=(10, 5))
         
         self.similarity_var = tk.StringVar(value="media")  # PREDETERMINADO: MEDIA
         similarity_frame = ttk.Frame(left_config)
         similarity_frame.pack(fill=tk.X, pady=5)
         
-        ttk.Radiobutton(similarity_frame, text="Baja (1+ coincidencia)", 
+        # Los niveles son umbrales de la puntuación ponderada de rasgos (score_thresholds)
+        thresholds = self.analyzer.score_thresholds
+        weights = self.analyzer.feature_weights
+        ttk.Radiobutton(similarity_frame, text=f"Baja (puntuación ≥ {thresholds[1]:g})", 
                        variable=self.similarity_var, value="baja").pack(side=tk.LEFT)
-        ttk.Radiobutton(similarity_frame, text="Media (Create Date + otro campo)", 
+        ttk.Radiobutton(similarity_frame, text=f"Media (puntuación ≥ {thresholds[2]:g})", 
                        variable=self.similarity_var, value="media").pack(side=tk.LEFT, padx=(20, 0))
-        ttk.Radiobutton(similarity_frame, text="Alta (3+ coincidencias)", 
+        ttk.Radiobutton(similarity_frame, text=f"Alta (puntuación ≥ {thresholds[3]:g})", 
                        variable=self.similarity_var, value="alta").pack(side=tk.LEFT, padx=(20, 0))
         
         right_config = ttk.Frame(config_frame)
@@ -725,8 +4411,11 @@ class MetadataAnalyzerGUI:
             "• Ubicación: C:/Users/Jose/Proyectos/analizador_metadata_archivobase/\n\n"
             "🎯 RECOMENDACIÓN (PREDETERMINADO):\n"
             "• 'Media' para máxima detección de trampas\n"
-            "• Create Date + otro campo\n"
-            "• Hash solo para archivos idénticos"
+            f"• Puntuación ≥ {thresholds[2]:g} (p. ej. Create Date {weights['fecha_creacion']:g} "
+            f"+ Creator {weights['creador']:g})\n"
+            "• Hash solo para archivos idénticos\n"
+            "• Texto para copias re-exportadas con otra herramienta\n"
+            "• Huella visual para escaneos sin texto"
         )
         ttk.Label(right_config, text=info_text, justify=tk.LEFT).pack(anchor=tk.W)
         
@@ -760,6 +4449,10 @@ class MetadataAnalyzerGUI:
                                       command=self.open_all_detected, state='disabled')
         self.open_all_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.export_btn = ttk.Button(button_frame, text="💾 EXPORTAR RESULTADOS", 
+                                    command=self.export_results, state='disabled')
+        self.export_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         self.stop_btn = ttk.Button(button_frame, text="⏹️ DETENER ANÁLISIS", 
                                   command=self.stop_analysis, state='disabled')
         self.stop_btn.pack(side=tk.LEFT, padx=(0, 10))
@@ -792,7 +4485,7 @@ class MetadataAnalyzerGUI:
     
     def setup_search_frame(self):
         """Configura la pestaña de búsqueda de texto"""
-        self.pdf_search_tab = PDFSearchTab(self.search_frame)
+        self.pdf_search_tab = PDFSearchTab(self.search_frame, self.analyzer, self.query_client)
     
     def setup_reference_frame(self):
         self.reference_text = tk.Text(self.reference_frame, height=20, wrap=tk.WORD, font=("Consolas", 9))
@@ -823,7 +4516,7 @@ class MetadataAnalyzerGUI:
         
         self.results_tree.heading('similitud', text='Nivel')
         self.results_tree.heading('nombre', text='Nombre Archivo')
-        self.results_tree.heading('coincidencias', text='Coincidencias')
+        self.results_tree.heading('coincidencias', text='Puntuación')
         self.results_tree.heading('creador', text='Creator')
         self.results_tree.heading('productor', text='Producer')
         self.results_tree.heading('fecha_creacion', text='Create Date')
@@ -868,8 +4561,14 @@ class MetadataAnalyzerGUI:
         
         self.results_tree.bind('<<TreeviewSelect>>', self.on_tree_select)
     
-    def update_progress(self, current, total, current_file):
-        """Actualiza la barra de progreso y la información actual"""
+    def update_progress(self, current, total, current_file, work=None):
+        """Actualiza la barra de progreso y la información actual
+
+        `work` ({'bytes', 'bytes_total', 'coste', 'coste_total'}) llega durante
+        la extracción y es lo que usa la estimación de tiempo.
+        """
+        self.progress_counts = (current, total)
+        self.work_progress = work
         if total > 0:
             progress_percent = (current / total) * 100
             self.progress['value'] = progress_percent
@@ -901,22 +4600,26 @@ class MetadataAnalyzerGUI:
         
         self.root.after(300, self.animate_progress)
     
-    def update_time_display(self, start_time, processed=0, total=0):
+    def work_fraction(self):
+        """Fracción hecha del trabajo: por coste estimado, por bytes o, sin esos datos, por archivos"""
+        work = self.work_progress or {}
+        for done, total in ((work.get('coste'), work.get('coste_total')),
+                            (work.get('bytes'), work.get('bytes_total')),
+                            self.progress_counts):
+            if done and total:
+                return min(done / total, 1.0)
+        return None
+    
+    def update_time_display(self, start_time):
         if not self.is_analyzing:
             return
         
         elapsed = time.time() - start_time
         
-        if processed > 0 and total > 0:
-            if processed < 10:
-                time_per_file = elapsed / processed if processed > 0 else 0
-                estimated_total = time_per_file * total
-                self.total_estimated_time = estimated_total
-            else:
-                progress_ratio = processed / total
-                if progress_ratio > 0:
-                    estimated_total = elapsed / progress_ratio
-                    self.total_estimated_time = estimated_total
+        # El ritmo observado (segundos por unidad de coste) corrige el modelo y el paralelismo
+        progress_ratio = self.work_fraction()
+        if progress_ratio:
+            self.total_estimated_time = elapsed / progress_ratio
             
             if self.total_estimated_time:
                 remaining = max(0, self.total_estimated_time - elapsed)
@@ -932,7 +4635,7 @@ class MetadataAnalyzerGUI:
             elapsed_str = self.format_time(elapsed)
             self.time_label.config(text=f"Transcurrido: {elapsed_str}")
         
-        self.root.after(1000, self.update_time_display, start_time, processed, total)
+        self.root.after(1000, self.update_time_display, start_time)
     
     def format_time(self, seconds):
         if seconds < 60:
@@ -989,13 +4692,14 @@ class MetadataAnalyzerGUI:
         # Determinar nivel mínimo basado en la selección
         if self.similarity_var.get() == "baja":
             min_matches = 1
-            nivel_text = "BAJA (1+ coincidencia)"
+            nivel_text = "BAJA"
         elif self.similarity_var.get() == "media":
             min_matches = 2  
-            nivel_text = "MEDIA (Create Date + otro campo)"
+            nivel_text = "MEDIA"
         else:
             min_matches = 3
-            nivel_text = "ALTA (3+ coincidencias)"
+            nivel_text = "ALTA"
+        nivel_text += f" (puntuación ≥ {self.analyzer.score_thresholds[min_matches]:g})"
         
         info_text = f"""
 ╔══════════════════════════════════════════════════════════════╗
@@ -1015,9 +4719,15 @@ class MetadataAnalyzerGUI:
    • Producer: {metadata['productor']}
    • Create Date: {metadata['fecha_creacion']}
    • Hash SHA256: {metadata['hash_sha256'][:32]}...{' (INCLUIDO)' if include_hash else ' (NO incluido)'}
+   • /ID del trailer: {' / '.join(part[:16] for part in metadata['id_trailer']) or 'No disponible'}
+   • XMP DocumentID: {metadata['xmp_document_id']}
+   • XMP InstanceID: {metadata['xmp_instance_id']}
+   • Versión PDF: {metadata['version_pdf']}
 
 📊 CONFIGURACIÓN ACTUAL:
    • Incluir Hash: {'SÍ' if include_hash else 'NO'}
+   • Similitud de texto: {f"SÍ (umbral {self.text_threshold_var.get():.2f})" if self.include_text_var.get() else 'NO'}
+   • Huella visual: {f"SÍ (distancia máx. {self.visual_distance_var.get()})" if self.include_visual_var.get() else 'NO'}
    • Caché: AUTOMÁTICO (siempre activo)
    • Nivel: {nivel_text}
 
@@ -1056,9 +4766,15 @@ class MetadataAnalyzerGUI:
         
         self.clear_results()
         
+        # Filtros del recorrido (cada configuración usa su propio caché)
+        exclude = [pattern.strip() for pattern in self.exclude_var.get().split(',') if pattern.strip()]
+        self.analyzer.scan_filters = ScanFilters(exclude=exclude, max_depth=self.max_depth_var.get() or None)
+        
         self.is_analyzing = True
         self.analysis_start_time = time.time()
         self.total_estimated_time = None
+        self.progress_counts = (0, 0)
+        self.work_progress = None
         
         self.analyze_btn.config(state='disabled')
         self.stop_btn.config(state='normal')
@@ -1082,9 +4798,11 @@ class MetadataAnalyzerGUI:
         self.details_text.delete(1.0, tk.END)
         self.open_selected_btn.config(state='disabled')
         self.open_all_btn.config(state='disabled')
+        self.export_btn.config(state='disabled')
         self.detected_files = []
     
     def run_analysis(self):
+        cancelled = False
         try:
             include_hash = self.include_hash_var.get()
             
@@ -1096,36 +4814,55 @@ class MetadataAnalyzerGUI:
             else:  # alta
                 min_matches = 3
             
+            text_threshold = self.text_threshold_var.get() if self.include_text_var.get() else None
+            visual_distance = self.visual_distance_var.get() if self.include_visual_var.get() else None
+            
             self.status_label.config(text="Iniciando análisis con caché automático...")
             
-            similar_files, cache_used = self.analyzer.find_similar_by_metadata(
-                self.reference_metadata, 
-                self.analyzer.search_folder, 
-                include_hash, 
-                min_matches,
-                progress_callback=self.update_progress
-            )
+            if self.query_client:
+                similar_files, cache_used = self.query_client.find_similar(
+                    self.analyzer.reference_file, self.analyzer.search_folder, include_hash, min_matches,
+                    text_threshold=text_threshold, visual_distance=visual_distance)
+            else:
+                similar_files, cache_used = self.analyzer.find_similar_by_metadata(
+                    self.reference_metadata, 
+                    self.analyzer.search_folder, 
+                    include_hash, 
+                    min_matches,
+                    progress_callback=self.update_progress,
+                    text_threshold=text_threshold,
+                    visual_distance=visual_distance,
+                    should_stop=lambda: not self.is_analyzing
+                )
             
             self.detected_files = similar_files
             self.display_results(similar_files, cache_used)
+            if not self.is_analyzing:
+                cancelled = True
+                self.status_label.config(text=f"Análisis detenido: {len(similar_files)} archivos detectados "
+                                              f"(lo extraído queda guardado y se reanudará)")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error durante el análisis: {str(e)}")
         finally:
-            self.analysis_finished()
+            self.analysis_finished(cancelled)
     
-    def analysis_finished(self):
+    def analysis_finished(self, cancelled=False):
+        """Restaura los controles; un análisis detenido conserva su mensaje de estado"""
         self.is_analyzing = False
         self.analyze_btn.config(state='normal')
         self.stop_btn.config(state='disabled')
-        self.progress['value'] = 100
-        self.current_file_label.config(text="Completado")
         
         elapsed = time.time() - self.analysis_start_time
         elapsed_str = self.format_time(elapsed)
+        self.time_label.config(text=f"Tiempo total: {elapsed_str}")
+        if cancelled:
+            self.current_file_label.config(text="Detenido")
+            return
         
+        self.progress['value'] = 100
+        self.current_file_label.config(text="Completado")
         self.status_label.config(text=f"Análisis completado en {elapsed_str}")
-        self.time_label.config(text=f"Tiempo total: {elapsed_str}")
         
         self.play_completion_sound()
     
@@ -1138,6 +4875,10 @@ class MetadataAnalyzerGUI:
                 tags = ('high',)
             elif file_info['similarity_level'] == 'MEDIA':
                 tags = ('medium',)
+            elif file_info['similarity_level'] == 'TEXTO':
+                tags = ('text',)
+            elif file_info['similarity_level'] == 'VISUAL':
+                tags = ('visual',)
             else:
                 tags = ('low',)
             
@@ -1146,7 +4887,7 @@ class MetadataAnalyzerGUI:
             self.results_tree.insert('', 'end', values=(
                 file_info['similarity_level'],
                 metadata['nombre'],
-                f"{file_info['matches']}/{file_info['total_possible']}",
+                f"{file_info['score']:g}/{file_info['max_score']:g}",
                 self.truncate_text(metadata['creador'], 25),
                 self.truncate_text(metadata['productor'], 25),
                 metadata['fecha_creacion'],
@@ -1157,6 +4898,8 @@ class MetadataAnalyzerGUI:
         self.results_tree.tag_configure('high', background='#e8f5e8')
         self.results_tree.tag_configure('medium', background='#fff9e6')
         self.results_tree.tag_configure('low', background='#ffe6e6')
+        self.results_tree.tag_configure('text', background='#e6f0ff')
+        self.results_tree.tag_configure('visual', background='#f3e6ff')
         
         total_matches = len(similar_files)
         cache_status = " (con caché)" if cache_used else " (sin caché - escaneo completo)"
@@ -1164,6 +4907,7 @@ class MetadataAnalyzerGUI:
         
         if total_matches > 0:
             self.open_all_btn.config(state='normal')
+            self.export_btn.config(state='normal')
     
     def truncate_text(self, text, max_length):
         if not text or text == 'No disponible':
@@ -1202,7 +4946,10 @@ class MetadataAnalyzerGUI:
 🎯 COINCIDENCIAS CON REFERENCIA:
    • Nivel: {match_info['similarity_level'] if match_info else 'N/A'}
    • Coincidencias: {match_info['matches'] if match_info else 'N/A'}/{match_info['total_possible'] if match_info else 'N/A'}
+   • Puntuación: {f"{match_info['score']:g}/{match_info['max_score']:g}" if match_info else 'N/A'}
    • Detalles: {', '.join(match_info['match_details']) if match_info else 'N/A'}
+   • Similitud de texto: {f"{match_info['text_similarity']:.0%}" if match_info and match_info.get('text_similarity') is not None else 'N/A'}
+   • Huella visual: {f"distancia {match_info['visual_distance']}" if match_info and match_info.get('visual_distance') is not None else 'N/A'}
 
 📋 METADATOS PRINCIPALES:
    • Creator: {metadata['creador']}
@@ -1237,6 +4984,25 @@ class MetadataAnalyzerGUI:
         for file_info in self.detected_files:
             self.open_pdf_file(file_info['metadata']['ruta'])
     
+    def export_results(self):
+        """Guarda los archivos detectados en CSV, JSON Lines o Parquet"""
+        if not self.detected_files:
+            return
+        filetypes = [("CSV", "*.csv"), ("JSON Lines", "*.jsonl")]
+        if pyarrow is not None:
+            filetypes.append(("Parquet", "*.parquet"))
+        output_path = filedialog.asksaveasfilename(title="Exportar resultados", defaultextension=".csv",
+                                                   filetypes=filetypes)
+        if not output_path:
+            return
+        try:
+            exporter = RecordExporter()
+            total = exporter.export((RecordExporter.match_record(result) for result in self.detected_files),
+                                    output_path, columns=RecordExporter.MATCH_COLUMNS + exporter.DEFAULT_COLUMNS)
+            self.status_label.config(text=f"{total} resultados exportados a {Path(output_path).name}")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {str(e)}")
+    
     def open_pdf_file(self, file_path):
         try:
             os.startfile(file_path)
@@ -1270,6 +5036,269 @@ if __name__ == "__main__":
         print("❌ Error: Se requiere PyMuPDF. Instala con: pip install PyMuPDF")
         exit(1)
     
+    parser = argparse.ArgumentParser(description="Analizador de metadatos de PDFs")
+    parser.add_argument('--benchmark-metadatos', metavar='CARPETA',
+                        help="Compara el lector rápido de metadatos con fitz sobre una carpeta")
+    parser.add_argument('--benchmark-recorrido', metavar='CARPETA',
+                        help="Compara el recorrido secuencial y el paralelo de una carpeta")
+    parser.add_argument('--latencia', type=float, default=0.0, metavar='SEGUNDOS',
+                        help="Latencia simulada por listado en --benchmark-recorrido (p. ej. 0.02 para SMB)")
+    parser.add_argument('--incluir', action='append', metavar='GLOB',
+                        help="Solo analiza los PDFs cuyo nombre o ruta relativa coincide (repetible)")
+    parser.add_argument('--excluir', action='append', metavar='GLOB',
+                        help="Excluye archivos y poda carpetas completas, p. ej. backup o .snapshot (repetible)")
+    parser.add_argument('--profundidad-max', type=int, metavar='N',
+                        help="Profundidad máxima de subcarpetas")
+    parser.add_argument('--tamano-min', type=int, metavar='BYTES', help="Tamaño mínimo de los PDFs")
+    parser.add_argument('--tamano-max', type=int, metavar='BYTES', help="Tamaño máximo de los PDFs")
+    parser.add_argument('--desde', metavar='AAAA-MM-DD', help="Solo PDFs modificados desde esta fecha")
+    parser.add_argument('--hasta', metavar='AAAA-MM-DD', help="Solo PDFs modificados hasta esta fecha")
+    parser.add_argument('--indexar', metavar='CARPETA', nargs='+',
+                        help="Mantiene actualizados en segundo plano los almacenes de estas carpetas")
+    parser.add_argument('--intervalo-sondeo', type=float, default=60, metavar='SEGUNDOS',
+                        help="Intervalo de sondeo del indexador (por defecto 60)")
+    parser.add_argument('--servidor', action='store_true',
+                        help="Arranca el servidor local de consultas (se combina con --indexar)")
+    parser.add_argument('--puerto', type=int, default=8765,
+                        help="Puerto del servidor de consultas (por defecto 8765)")
+    parser.add_argument('--usar-servidor', metavar='URL',
+                        help="La interfaz y las consultas usan un servidor ya arrancado (p. ej. http://127.0.0.1:8765)")
+    parser.add_argument('--memoria-texto-mb', type=int, default=256, metavar='MB',
+                        help="Memoria máxima para el texto de los documentos ya descomprimido (por defecto 256)")
+    parser.add_argument('--disco-texto-mb', type=int, default=8192, metavar='MB',
+                        help="Disco máximo para el texto comprimido de los documentos (por defecto 8192)")
+    parser.add_argument('--paginas-inicio', type=int, metavar='N',
+                        help="La primera extracción solo lee las N primeras páginas de cada PDF")
+    parser.add_argument('--paginas-final', type=int, default=0, metavar='M',
+                        help="Con --paginas-inicio, lee también las M últimas páginas")
+    parser.add_argument('--cobertura-completa', action='store_true',
+                        help="--buscar completa antes el texto de todas las páginas")
+    parser.add_argument('--procesos', type=int, metavar='N',
+                        help="Procesos de extracción de metadatos y texto")
+    parser.add_argument('--hilos-lectura', type=int, default=4, metavar='N',
+                        help="Hilos que leen los PDFs por adelantado (por defecto 4)")
+    parser.add_argument('--hilos-hash', type=int, default=2, metavar='N',
+                        help="Hilos que calculan el SHA-256 (por defecto 2)")
+    parser.add_argument('--tamano-cola', type=int, default=8, metavar='N',
+                        help="Capacidad de cada cola entre etapas (por defecto 8)")
+    parser.add_argument('--peso', action='append', metavar='RASGO=PESO',
+                        help=f"Cambia el peso de un rasgo en la puntuación ({', '.join(FEATURE_WEIGHTS)}; repetible)")
+    parser.add_argument('--umbral', type=float, metavar='PUNTOS',
+                        help="Puntuación mínima de --similares (por defecto la del nivel medio)")
+    parser.add_argument('--exportar', nargs=2, metavar=('CARPETA', 'ARCHIVO'),
+                        help="Exporta los metadatos de la carpeta a .csv, .jsonl o .parquet")
+    parser.add_argument('--salida', metavar='ARCHIVO',
+                        help="Con --similares, exporta los resultados a .csv, .jsonl o .parquet")
+    parser.add_argument('--formato', choices=RecordExporter.FORMATS,
+                        help="Formato de exportación (por defecto según la extensión)")
+    parser.add_argument('--columnas', metavar='COL1,COL2',
+                        help=f"Columnas exportadas (por defecto: {','.join(RecordExporter.DEFAULT_COLUMNS)})")
+    parser.add_argument('--vigilar', nargs=2, metavar=('NOMBRE', 'REFERENCIA'),
+                        help="Añade una consulta de vigilancia: cada PDF nuevo o modificado que se indexe se "
+                             "compara con la referencia (usa --umbral y --umbral-texto)")
+    parser.add_argument('--umbral-texto', type=float, metavar='0-1',
+                        help="Con --vigilar o --cruzar, tiene en cuenta también la similitud de texto con este umbral")
+    parser.add_argument('--dejar-de-vigilar', metavar='NOMBRE', help="Elimina una consulta de vigilancia")
+    parser.add_argument('--vigilancias', action='store_true',
+                        help="Lista las consultas de vigilancia y las últimas coincidencias del informe")
+    parser.add_argument('--revisar-vigilancia', metavar='CARPETA',
+                        help="Comprueba toda una carpeta contra las consultas de vigilancia")
+    parser.add_argument('--buscar', nargs=2, metavar=('CARPETA', 'TEXTO'),
+                        help="Busca un texto en los PDFs de una carpeta")
+    parser.add_argument('--similares', nargs=2, metavar=('REFERENCIA', 'CARPETA'),
+                        help="Busca PDFs con metadatos similares a la referencia (nivel medio)")
+    parser.add_argument('--cruzar', nargs=2, metavar=('ENTRANTES', 'ARCHIVO'),
+                        help="Pares de PDFs de ENTRANTES con metadatos similares a alguno de ARCHIVO, en una "
+                             "sola pasada (usa --umbral, --umbral-texto y --salida)")
+    args = parser.parse_args()
+    
+    scan_filters = ScanFilters(
+        include=args.incluir,
+        exclude=args.excluir,
+        max_depth=args.profundidad_max,
+        min_size=args.tamano_min,
+        max_size=args.tamano_max,
+        modified_after=datetime.fromisoformat(args.desde).timestamp() if args.desde else None,
+        modified_before=(datetime.fromisoformat(args.hasta) + timedelta(days=1)).timestamp() if args.hasta else None
+    )
+    
+    def create_analyzer():
+        analyzer = PDFMetadataAnalyzer()
+        analyzer.scan_filters = scan_filters
+        analyzer.text_memory_mb = args.memoria_texto_mb
+        analyzer.text_disk_mb = args.disco_texto_mb
+        analyzer.text_first_pages = args.paginas_inicio
+        analyzer.text_last_pages = args.paginas_final
+        if args.procesos:
+            analyzer.extraction_workers = args.procesos
+        analyzer.read_workers = args.hilos_lectura
+        analyzer.hash_workers = args.hilos_hash
+        analyzer.pipeline_queue_size = args.tamano_cola
+        for weight in args.peso or []:
+            field, _, value = weight.partition('=')
+            if field not in FEATURE_WEIGHTS:
+                parser.error(f"Rasgo desconocido: {field}")
+            analyzer.feature_weights[field] = float(value)
+        return analyzer
+    
+    if args.benchmark_metadatos:
+        summary = PDFMetadataAnalyzer().benchmark_metadata_readers(args.benchmark_metadatos)
+        print(f"Archivos: {summary['archivos']}")
+        print(f"Lector rápido: {summary['tiempo_rapido']:.3f}s (recurrió a fitz en {summary['fallback_fitz']})")
+        print(f"fitz.open:     {summary['tiempo_fitz']:.3f}s")
+        if 'aceleracion' in summary:
+            print(f"Aceleración:   x{summary['aceleracion']:.1f}")
+        for file_path, fields in summary['diferencias']:
+            print(f"  Diferencias en {file_path}: {', '.join(fields)}")
+        exit(0)
+    
+    if args.benchmark_recorrido:
+        for workers in (1, PDFMetadataAnalyzer().walk_workers):
+            walker = DirectoryTree(workers, simulated_latency=args.latencia, filters=scan_filters)
+            start = time.perf_counter()
+            tree, folders = walker.validate(args.benchmark_recorrido)
+            pdf_count = sum(1 for _ in walker.iter_files(tree, args.benchmark_recorrido))
+            print(f"{workers:>3} hilos: {time.perf_counter() - start:.2f}s - {len(folders)} carpetas, {pdf_count} PDFs")
+        exit(0)
+    
+    if args.servidor or args.indexar:
+        analyzer = create_analyzer()
+        indexer = None
+        if args.indexar:
+            indexer = BackgroundIndexer(analyzer, args.indexar, poll_interval=args.intervalo_sondeo)
+            indexer.start()
+        try:
+            if args.servidor:
+                QueryServer(analyzer, port=args.puerto, indexer=indexer).serve_forever()
+            else:
+                print("Indexador en marcha (Ctrl+C para salir)")
+                while True:
+                    time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if indexer:
+                indexer.stop()
+        exit(0)
+    
+    if args.vigilar or args.dejar_de_vigilar or args.vigilancias or args.revisar_vigilancia:
+        analyzer = create_analyzer()
+        watchlist = analyzer.get_watchlist()
+        if args.vigilar:
+            name, reference_file = args.vigilar
+            try:
+                analyzer.add_watch(name, reference_file, args.umbral, args.umbral_texto)
+            except ValueError as e:
+                print(f"❌ {e}")
+                exit(1)
+            print(f"Vigilando «{name}» ({len(watchlist.queries)} consultas en {watchlist.path})")
+        if args.dejar_de_vigilar:
+            if not watchlist.remove(args.dejar_de_vigilar):
+                print(f"❌ No existe la consulta «{args.dejar_de_vigilar}»")
+                exit(1)
+            print(f"Consulta «{args.dejar_de_vigilar}» eliminada")
+        if args.revisar_vigilancia:
+            hits = analyzer.review_watchlist(args.revisar_vigilancia)
+            print(f"{len(hits)} coincidencias nuevas")
+        if args.vigilancias:
+            for name, query in watchlist.queries.items():
+                text = f", texto ≥ {query['umbral_texto']:g}" if query.get('umbral_texto') is not None else ""
+                print(f"{name}: {query['referencia']} (umbral {query['umbral']:g}{text}, desde {query['creada']})")
+            try:
+                with open(watchlist.report_path, 'r', encoding='utf-8') as f:
+                    recent = deque(f, maxlen=20)
+            except OSError:
+                recent = []
+            for line in recent:
+                hit = json.loads(line)
+                print(f"  {hit['fecha']}  «{hit['consulta']}»  {hit['ruta']} ({hit['puntuacion']:g})")
+        exit(0)
+    
+    query_client = QueryClient(args.usar_servidor) if args.usar_servidor else None
+    export_columns = args.columnas.split(',') if args.columnas else None
+    
+    if args.exportar:
+        folder, output_path = args.exportar
+        exporter = RecordExporter(export_columns)
+        try:
+            exporter.format_for(output_path, args.formato)
+        except ValueError as e:
+            print(f"❌ {e}")
+            exit(1)
+        store = create_analyzer().get_document_store(folder)
+        print(store.refresh()[0])
+        start = time.perf_counter()
+        total = exporter.export(store.iter_records(), output_path, args.formato)
+        print(f"{total} registros exportados a {output_path} en {time.perf_counter() - start:.2f}s")
+        exit(0)
+    
+    if args.buscar:
+        folder, search_string = args.buscar
+        if query_client:
+            found_files = query_client.search_hits(folder, search_string, args.cobertura_completa)
+        else:
+            store = create_analyzer().get_document_store(folder)
+            store.refresh()
+            found_files = list(store.search_hits(search_string, full_coverage=args.cobertura_completa))
+            statistics = store.text_store.statistics()
+            print(f"Caché de textos: {statistics['aciertos_memoria']} en memoria, {statistics['lecturas_disco']} "
+                  f"leídos de disco, {statistics['fallos']} fallos, {statistics['expulsiones_memoria']} expulsiones "
+                  f"de memoria, {statistics['expulsiones_disco']} de disco ({statistics['bytes_disco'] // 1024} KB en disco)")
+        for file_path, hits in found_files:
+            print(f"{file_path} ({hits['total']} coincidencias)")
+            for hit in hits['aciertos']:
+                print(f"    pág. {hit['pagina']} [{hit['inicio']}-{hit['fin']}]: {hit['fragmento']}")
+        print(f"{len(found_files)} archivos con el texto")
+        exit(0)
+    
+    if args.similares:
+        reference_file, folder = args.similares
+        if query_client:
+            similar_files, _ = query_client.find_similar(reference_file, folder, score_threshold=args.umbral)
+        else:
+            analyzer = create_analyzer().for_reference(reference_file)
+            success, reference_metadata = analyzer.get_pdf_metadata(Path(reference_file))
+            if not success:
+                print(f"❌ {reference_metadata}")
+                exit(1)
+            similar_files, _ = analyzer.find_similar_by_metadata(reference_metadata, folder, score_threshold=args.umbral)
+        for file_info in similar_files:
+            print(f"{file_info['similarity_level']:<6} {file_info['score']:g}/{file_info['max_score']:g}  {file_info['ruta_completa']}")
+        print(f"{len(similar_files)} archivos detectados")
+        if args.salida:
+            exporter = RecordExporter(export_columns or RecordExporter.MATCH_COLUMNS + RecordExporter.DEFAULT_COLUMNS)
+            try:
+                total = exporter.export((RecordExporter.match_record(result) for result in similar_files),
+                                        args.salida, args.formato)
+            except ValueError as e:
+                print(f"❌ {e}")
+                exit(1)
+            print(f"{total} resultados exportados a {args.salida}")
+        exit(0)
+    
+    if args.cruzar:
+        incoming_folder, archive_folder = args.cruzar
+        exporter = RecordExporter(export_columns or RecordExporter.JOIN_COLUMNS)
+        if args.salida:
+            try:
+                exporter.format_for(args.salida, args.formato)
+            except ValueError as e:
+                print(f"❌ {e}")
+                exit(1)
+        analyzer = create_analyzer()
+        start = time.perf_counter()
+        pairs = []
+        for pair in analyzer.iter_folder_join(incoming_folder, archive_folder, score_threshold=args.umbral,
+                                              text_threshold=args.umbral_texto):
+            pairs.append(pair)
+            print(f"{pair['nivel']:<6} {pair['puntuacion']:g}/{pair['puntuacion_max']:g}  "
+                  f"{pair['entrante']} ↔ {pair['archivo']}")
+        print(f"{len(pairs)} pares en {time.perf_counter() - start:.2f}s")
+        if args.salida:
+            total = exporter.export(pairs, args.salida, args.formato)
+            print(f"{total} pares exportados a {args.salida}")
+        exit(0)
+    
     root = tk.Tk()
-    app = MetadataAnalyzerGUI(root)
+    app = MetadataAnalyzerGUI(root, query_client)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,151 @@
+import hashlib
+import importlib
+import json
+import os
+import queue
+import sys
+import types
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+# El analizador es un único módulo en la raíz del repositorio
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# fitz (PyMuPDF) y winsound (solo Windows) se importan al cargar el módulo; sin ellos
+# se sustituyen por módulos vacíos y las pruebas que abren PDFs reales se saltan
+STUBBED_MODULES = set()
+for module_name in ('fitz', 'winsound'):
+    try:
+        importlib.import_module(module_name)
+    except ImportError:
+        sys.modules[module_name] = types.ModuleType(module_name)
+        STUBBED_MODULES.add(module_name)
+
+import analizador_metadata_archivobase as analizador  # noqa: E402
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "request(id): petición del backlog que cubre la prueba (p. ej. 'user-030')")
+
+
+@pytest.fixture
+def fitz_module():
+    """PyMuPDF real; la prueba se salta si solo está el módulo vacío"""
+    if 'fitz' in STUBBED_MODULES:
+        pytest.skip("PyMuPDF (fitz) no está instalado")
+    return sys.modules['fitz']
+
+
+def write_document(path, creator, text, mtime=None, **metadata):
+    """'PDF' de prueba para FakeSupervisor: el creador y el texto, separados por '|' ('\\f' separa páginas)
+
+    Los campos de `metadata` (productor, fecha_creacion...) van en JSON entre los dos.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if metadata:
+        creator = f"{creator}|{json.dumps(metadata)}"
+    path.write_text(f"{creator}|{text}", encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+# Firmas MinHash como las de extract_document, para la similitud de texto
+SIGNATURES = analizador.TextSimilarityIndex()
+
+
+def fake_extract(kind, file_path, options):
+    """Extracción de FakeSupervisor: lee el archivo de write_document sin fitz"""
+    creator, _, text = Path(file_path).read_text(encoding='utf-8').partition('|')
+    metadata = {}
+    if text.startswith('{'):
+        metadata_json, _, text = text.partition('|')
+        metadata = json.loads(metadata_json)
+    if creator == 'roto':
+        return False, "PDF dañado"
+    pages = text.split('\f')
+    if kind == 'text':
+        return True, pages
+    file_stat = Path(file_path).stat()
+    # Como extract_document: sin 'calcular_hash' el hash lo pone la etapa de hash de la canalización
+    compute_hash = options.get('calcular_hash', True)
+    return True, dict(metadata, **{
+        'ruta': str(file_path),
+        'nombre': Path(file_path).name,
+        'tamaño': file_stat.st_size,
+        'modificado': datetime.fromtimestamp(file_stat.st_mtime),
+        'modification_time': file_stat.st_mtime,
+        'hash_sha256': hashlib.sha256(Path(file_path).read_bytes()).hexdigest() if compute_hash else '',
+        'creador': creator,
+        'paginas': len(pages),
+        'paginas_texto': pages,
+        'paginas_extraidas': [[0, len(pages)]],
+        'texto_completo': True,
+        'firma_minhash': SIGNATURES.signature("".join(pages)),
+    })
+
+
+class FakeSupervisor:
+    """ExtractionSupervisor sin procesos: extrae en el propio hilo con fake_extract
+
+    `runs` anota (tipo, [rutas]) de cada ejecución para comprobar cuántas
+    veces se abrió cada archivo.
+    """
+    
+    quarantine_entries = analizador.ExtractionSupervisor.quarantine_entries
+    
+    def __init__(self, runs):
+        self.workers = 1
+        self.durations = {}
+        self.quarantined = {}
+        self.runs = runs
+    
+    def run(self, kind, pdf_files, options=None, should_stop=None, file_options=None):
+        files = []
+        self.runs.append((kind, files))
+        for pdf_file in self.iter_files(pdf_files):
+            if should_stop and should_stop():
+                return
+            files.append(str(pdf_file))
+            task_options = dict(options or {}, **(file_options or {}).get(str(pdf_file), {}))
+            success, result = fake_extract(kind, pdf_file, task_options)
+            if success:
+                self.durations[str(pdf_file)] = 0.01
+            else:
+                self.quarantined[str(pdf_file)] = result
+            yield pdf_file, success, result
+    
+    def iter_files(self, pdf_files):
+        if not isinstance(pdf_files, queue.Queue):
+            yield from pdf_files
+            return
+        while True:
+            pdf_file = pdf_files.get()
+            if pdf_file is None:
+                return
+            yield pdf_file
+
+
+@pytest.fixture
+def supervisor_runs():
+    """Ejecuciones de los FakeSupervisor creados por `fake_supervisor_factory`"""
+    return []
+
+
+@pytest.fixture
+def fake_supervisor_factory(supervisor_runs):
+    return lambda *args: FakeSupervisor(supervisor_runs)
+
+
+@pytest.fixture
+def make_store(tmp_path, fake_supervisor_factory):
+    """DocumentStore de una carpeta con FakeSupervisor; cada llamada crea una instancia nueva, como otro proceso"""
+    (tmp_path / 'cache').mkdir(exist_ok=True)
+    
+    def make(folder, **kwargs):
+        kwargs.setdefault('supervisor_factory', fake_supervisor_factory)
+        kwargs.setdefault('text_store', analizador.TextBlobStore(tmp_path / 'cache' / 'textos'))
+        return analizador.DocumentStore(tmp_path / 'cache', str(folder), **kwargs)
+    return make
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from analizador_metadata_archivobase import DirectoryTree
+
+pytestmark = pytest.mark.request('user-026')
+
+
+def write_pdf(path, content, mtime):
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+
+
+def test_unchanged_tree_has_no_dirty_folders(tmp_path):
+    write_pdf(tmp_path / 'a.pdf', b'%PDF-1.4 uno', 1_700_000_000)
+    (tmp_path / 'sub').mkdir()
+    write_pdf(tmp_path / 'sub' / 'b.pdf', b'%PDF-1.4 dos', 1_700_000_000)
+    builder = DirectoryTree(workers=2)
+    
+    tree, dirty = builder.validate(tmp_path)
+    assert sorted(dirty) == sorted([str(tmp_path), str(tmp_path / 'sub')])
+    
+    tree, dirty = builder.validate(tmp_path, tree)
+    assert dirty == []
+    assert sorted(path.name for path, _, _ in builder.iter_files(tree, tmp_path)) == ['a.pdf', 'b.pdf']
+
+
+def test_in_place_edit_is_detected_without_folder_mtime_change(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    pdf_path = tmp_path / 'sub' / 'b.pdf'
+    write_pdf(pdf_path, b'%PDF-1.4 dos', 1_700_000_000)
+    builder = DirectoryTree(workers=2)
+    tree, _ = builder.validate(tmp_path)
+    
+    folder_mtime = (tmp_path / 'sub').stat().st_mtime
+    write_pdf(pdf_path, b'%PDF-1.4 otro contenido', 1_700_000_100)
+    os.utime(tmp_path / 'sub', (folder_mtime, folder_mtime))
+    
+    tree, dirty = builder.validate(tmp_path, tree)
+    assert dirty == [str(tmp_path / 'sub')]
+    assert tree['dirs']['sub']['files']['b.pdf'] == [pdf_path.stat().st_size, 1_700_000_100]
+
+
+def test_unchanged_folders_skip_file_stats_without_full_check(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    pdf_path = tmp_path / 'sub' / 'b.pdf'
+    write_pdf(pdf_path, b'%PDF-1.4 dos', 1_700_000_000)
+    builder = DirectoryTree(workers=2)
+    tree, _ = builder.validate(tmp_path)
+    
+    folder_mtime = (tmp_path / 'sub').stat().st_mtime
+    write_pdf(pdf_path, b'%PDF-1.4 otro contenido', 1_700_000_100)
+    os.utime(tmp_path / 'sub', (folder_mtime, folder_mtime))
+    
+    unchecked, dirty = builder.validate(tmp_path, tree, check_files=False)
+    assert dirty == []
+    assert unchecked == tree
+    
+    # Un archivo que se sabe que cambió (un evento) sí se comprueba
+    tree, dirty = builder.validate(tmp_path, tree, check_files=False, changed_files={str(pdf_path)})
+    assert dirty == [str(tmp_path / 'sub')]
+    assert tree['dirs']['sub']['files']['b.pdf'] == [pdf_path.stat().st_size, 1_700_000_100]
+
+
+def test_new_and_removed_files_mark_their_folder(tmp_path):
+    write_pdf(tmp_path / 'a.pdf', b'%PDF-1.4 uno', 1_700_000_000)
+    builder = DirectoryTree(workers=2)
+    tree, _ = builder.validate(tmp_path)
+    
+    write_pdf(tmp_path / 'nuevo.pdf', b'%PDF-1.4 nuevo', 1_700_000_000)
+    (tmp_path / 'a.pdf').unlink()
+    (tmp_path / '~$temporal.pdf').write_bytes(b'')
+    os.utime(tmp_path, (1_700_000_500, 1_700_000_500))
+    
+    tree, dirty = builder.validate(tmp_path, tree)
+    assert dirty == [str(tmp_path)]
+    assert list(tree['files']) == ['nuevo.pdf']
+
+
+def test_split_folder_reuses_only_matching_records(tmp_path):
+    builder = DirectoryTree()
+    files = {'igual.pdf': [100, 1_700_000_000.5], 'editado.pdf': [120, 1_700_000_200.0], 'nuevo.pdf': [50, 1.0],
+             'roto.pdf': [70, 5.0]}
+    cached_entries = {
+        str(tmp_path / 'igual.pdf'): {'tamaño': 100, 'modification_time': 1_700_000_000.5},
+        str(tmp_path / 'editado.pdf'): {'tamaño': 120, 'modification_time': 1_700_000_000.0},
+    }
+    quarantine = {str(tmp_path / 'roto.pdf'): {'tamaño': 70, 'modification_time': 5.0}}
+    
+    reusable, pending = builder.split_folder(tmp_path, files, cached_entries, quarantine)
+    assert list(reusable) == [str(tmp_path / 'igual.pdf')]
+    assert sorted(path.name for path in pending) == ['editado.pdf', 'nuevo.pdf']
@@ -0,0 +1,61 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from analizador_metadata_archivobase import DocumentRecord, compute_features, timestamp_ns
+
+pytestmark = pytest.mark.request('user-046')
+
+HASH = 'ab' * 32
+
+
+def raw_document(path='/datos/a.pdf', creator='Microsoft Word'):
+    return {
+        'ruta': path, 'nombre': os.path.basename(path), 'tamaño': 1234,
+        'modificado': datetime(2024, 5, 6, 7, 8, 9, 123456), 'modification_time': 1_714_979_289.123456,
+        'hash_sha256': HASH, 'creador': creator, 'productor': 'No disponible', 'paginas': 3,
+        'id_trailer': ['00FF', 'AA11'], 'fuentes': ['Arial', 'Calibri'], 'paginas_extraidas': [[0, 2], [2, 3]],
+        'firma_minhash': [1, 2, 4_000_000_000], 'texto_completo': True, 'etiqueta': 'fuera de FIELDS',
+    }
+
+
+def test_record_reads_like_the_original_dictionary():
+    record = DocumentRecord(raw_document())
+    
+    assert record['hash_sha256'] == HASH
+    assert isinstance(record.hash_sha256, bytes) and len(record.hash_sha256) == 32
+    assert record['modificado'] == datetime(2024, 5, 6, 7, 8, 9, 123456)
+    assert timestamp_ns(record['modification_time']) == timestamp_ns(1_714_979_289.123456)
+    assert record['fuentes'] == ('Arial', 'Calibri')
+    assert list(record['firma_minhash']) == [1, 2, 4_000_000_000]
+    assert record['etiqueta'] == 'fuera de FIELDS'
+    assert record.get('titulo') is None and 'titulo' not in record
+
+
+def test_round_trip_through_json_keeps_every_field():
+    record = DocumentRecord(raw_document())
+    reloaded = DocumentRecord(json.loads(json.dumps(record.serializable(), ensure_ascii=False)))
+    
+    assert dict(reloaded) == dict(record)
+    assert reloaded.serializable() == record.serializable()
+
+
+def test_repeated_values_are_shared_between_records():
+    first = DocumentRecord(raw_document('/datos/a.pdf'))
+    second = DocumentRecord(json.loads(json.dumps(DocumentRecord(raw_document('/datos/b.pdf')).serializable())))
+    
+    assert first['creador'] is second['creador']
+    assert first['fuentes'] is second['fuentes']
+    assert first['paginas_extraidas'] is second['paginas_extraidas']
+
+
+def test_features_are_derived_from_the_fields_and_not_stored():
+    record = DocumentRecord(raw_document())
+    
+    assert 'rasgos' not in record
+    assert record.features() == compute_features(raw_document())
+    assert record.features()['hash'] == HASH
+    record['creador'] = 'LibreOffice'
+    assert record.features()['creador'] == 'libreoffice'
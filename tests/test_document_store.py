@@ -0,0 +1,159 @@
+import hashlib
+import os
+
+import pytest
+
+import analizador_metadata_archivobase as analizador
+from conftest import write_document
+
+
+def document_runs(supervisor_runs):
+    """Rutas que pasaron por una extracción 'document', de todas las ejecuciones"""
+    return sorted(path for kind, files in supervisor_runs if kind == 'document' for path in files)
+
+
+def touch_folder(folder, mtime):
+    os.utime(folder, (mtime, mtime))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'docs'
+    write_document(folder / 'a.pdf', 'word', 'primera factura')
+    write_document(folder / 'sub' / 'b.pdf', 'writer', 'segunda factura')
+    write_document(folder / 'sub' / 'c.pdf', 'scanner', 'albarán')
+    return folder
+
+
+@pytest.mark.request('user-031')
+def test_refresh_extracts_once_and_a_new_instance_reuses_the_store(folder, make_store, supervisor_runs):
+    store = make_store(folder)
+    status, extracted = store.refresh()
+    assert status == "No existe almacén de documentos"
+    assert sorted(extracted) == sorted(str(path) for path in folder.rglob('*.pdf'))
+    assert document_runs(supervisor_runs) == sorted(extracted)
+    
+    del supervisor_runs[:]
+    assert store.refresh() == ("Caché válido", [])
+    
+    other = make_store(folder)
+    assert other.refresh() == ("Caché válido", [])
+    assert document_runs(supervisor_runs) == []
+    assert other.documents[str(folder / 'a.pdf')]['creador'] == 'word'
+    assert other.get_pages(other.documents[str(folder / 'a.pdf')]) == ['primera factura']
+
+
+@pytest.mark.request('user-031')
+def test_refresh_drops_deleted_files_and_reextracts_changed_ones(folder, make_store, supervisor_runs):
+    store = make_store(folder)
+    store.refresh()
+    del supervisor_runs[:]
+    
+    (folder / 'sub' / 'c.pdf').unlink()
+    write_document(folder / 'sub' / 'b.pdf', 'writer', 'segunda factura corregida', mtime=1_800_000_000)
+    touch_folder(folder / 'sub', 1_800_000_100)
+    status, extracted = store.refresh()
+    
+    assert extracted == [str(folder / 'sub' / 'b.pdf')]
+    assert document_runs(supervisor_runs) == extracted
+    assert sorted(store.documents) == sorted([str(folder / 'a.pdf'), str(folder / 'sub' / 'b.pdf')])
+    assert store.get_pages(store.documents[str(folder / 'sub' / 'b.pdf')]) == ['segunda factura corregida']
+    assert "1 eliminados" in status
+
+
+@pytest.mark.request('user-031')
+def test_broken_files_stay_in_quarantine_until_they_change(folder, make_store, supervisor_runs):
+    write_document(folder / 'roto.pdf', 'roto', '')
+    store = make_store(folder)
+    store.refresh()
+    assert str(folder / 'roto.pdf') in store.quarantine
+    assert str(folder / 'roto.pdf') not in store.documents
+    
+    del supervisor_runs[:]
+    touch_folder(folder, 1_800_000_000)
+    store.refresh()
+    assert document_runs(supervisor_runs) == []
+    
+    write_document(folder / 'roto.pdf', 'word', 'reparado', mtime=1_800_000_050)
+    touch_folder(folder, 1_800_000_100)
+    store.refresh()
+    assert document_runs(supervisor_runs) == [str(folder / 'roto.pdf')]
+    assert str(folder / 'roto.pdf') not in store.quarantine
+
+
+@pytest.mark.request('user-032')
+def test_identical_copies_are_cloned_without_extraction(folder, make_store, supervisor_runs):
+    write_document(folder / 'copia' / 'a.pdf', 'word', 'primera factura')
+    store = make_store(folder)
+    store.refresh()
+    
+    extracted_copies = [path for path in document_runs(supervisor_runs) if path.endswith('a.pdf')]
+    assert len(extracted_copies) == 1
+    original, copy = (store.documents[str(folder / 'a.pdf')], store.documents[str(folder / 'copia' / 'a.pdf')])
+    assert copy['ruta'] == str(folder / 'copia' / 'a.pdf')
+    assert copy['hash_sha256'] == original['hash_sha256']
+    assert copy['hash_sha256'] == hashlib.sha256((folder / 'copia' / 'a.pdf').read_bytes()).hexdigest()
+    assert store.get_pages(copy) == ['primera factura']
+    
+    # Una copia que aparece después se clona del registro ya guardado
+    del supervisor_runs[:]
+    write_document(folder / 'otra' / 'a.pdf', 'word', 'primera factura')
+    status, extracted = store.refresh()
+    assert extracted == [str(folder / 'otra' / 'a.pdf')]
+    assert document_runs(supervisor_runs) == []
+    assert "1 reutilizados por contenido" in status
+
+
+@pytest.mark.request('user-032')
+def test_same_sampled_key_with_other_content_is_extracted(tmp_path, make_store, supervisor_runs):
+    folder = tmp_path / 'docs'
+    text = 'x' * 320_000
+    first = write_document(folder / 'uno.pdf', 'word', text)
+    # El cambio cae fuera de los tres fragmentos que lee content_key
+    second = write_document(folder / 'dos.pdf', 'word', text[:100_000] + 'y' + text[100_001:])
+    store = make_store(folder)
+    assert store.content_key(first) == store.content_key(second)
+    store.refresh()
+    
+    assert document_runs(supervisor_runs) == sorted([str(first), str(second)])
+    for pdf_file in (first, second):
+        document = store.documents[str(pdf_file)]
+        assert document['hash_sha256'] == hashlib.sha256(pdf_file.read_bytes()).hexdigest()
+    # El primero que se extrae se queda la clave; el otro la distingue con su SHA256
+    keys = sorted(store.documents[str(pdf_file)]['huella_rapida'] for pdf_file in (first, second))
+    sampled_key = store.content_key(first)
+    assert keys[0] == sampled_key
+    assert keys[1] in {f"{sampled_key}|{store.documents[str(pdf_file)]['hash_sha256']}" for pdf_file in (first, second)}
+
+
+@pytest.mark.request('user-034')
+def test_stopped_refresh_resumes_from_the_checkpoint(tmp_path, make_store, supervisor_runs, monkeypatch):
+    monkeypatch.setattr(analizador.DocumentStore, 'CHECKPOINT_SECONDS', 0)
+    folder = tmp_path / 'docs'
+    files = [write_document(folder / f"doc{i}.pdf", 'word', f"documento {i}") for i in range(8)]
+    
+    def after_three():
+        return sum(len(paths) for kind, paths in supervisor_runs if kind == 'document') >= 3
+    
+    status, extracted = make_store(folder).refresh(should_stop=after_three)
+    assert status.startswith("Escaneo detenido")
+    assert len(extracted) == 3
+    
+    # Otra instancia (p. ej. tras cerrar el programa) carga lo guardado y extrae solo el resto
+    del supervisor_runs[:]
+    store = make_store(folder)
+    store.load()
+    assert sorted(store.documents) == sorted(extracted)
+    status, resumed = store.refresh()
+    assert sorted(resumed) == sorted(set(map(str, files)).difference(extracted))
+    assert document_runs(supervisor_runs) == sorted(resumed)
+    assert store.refresh() == ("Caché válido", [])
+    
+    # Lo mismo cuando ya había árbol: la carpeta sigue contando como cambiada hasta terminar
+    del supervisor_runs[:]
+    added = [write_document(folder / 'nuevos' / f"doc{i}.pdf", 'word', f"nuevo {i}") for i in range(6)]
+    status, extracted = make_store(folder).refresh(should_stop=after_three)
+    assert status.startswith("Escaneo detenido") and len(extracted) == 3
+    del supervisor_runs[:]
+    status, resumed = make_store(folder).refresh()
+    assert sorted(resumed) == sorted(set(map(str, added)).difference(extracted))
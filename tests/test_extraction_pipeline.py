@@ -0,0 +1,84 @@
+import hashlib
+import threading
+
+import pytest
+
+from analizador_metadata_archivobase import ExtractionCostModel, ExtractionPipeline
+from conftest import FakeSupervisor, write_document
+
+pytestmark = pytest.mark.request('user-042')
+
+
+@pytest.fixture
+def documents(tmp_path):
+    return [write_document(tmp_path / f"doc{i}.pdf", 'word', 'texto ' * (i + 1)) for i in range(6)]
+
+
+def run_pipeline(documents, store_result, runs=None):
+    pipeline = ExtractionPipeline(FakeSupervisor([] if runs is None else runs), read_workers=2, hash_workers=2,
+                                  queue_size=2)
+    
+    def walk(submit):
+        for pdf_file in documents:
+            submit(pdf_file)
+    
+    return pipeline.run(walk, store_result, {'calcular_hash': False})
+
+
+def test_every_file_goes_through_all_stages_once(documents):
+    stored = {}
+    runs = []
+    summary = run_pipeline(documents, lambda pdf_file, success, result: stored.setdefault(str(pdf_file), result),
+                              runs)
+    
+    assert sorted(stored) == sorted(str(pdf_file) for pdf_file in documents)
+    assert [kind for kind, _ in runs] == ['document']
+    assert sorted(runs[0][1]) == sorted(stored)
+    for pdf_file in documents:
+        # El supervisor no calcula el hash: lo añade la etapa de hash leyendo el archivo
+        assert stored[str(pdf_file)]['hash_sha256'] == hashlib.sha256(pdf_file.read_bytes()).hexdigest()
+    assert all(queue['elementos'] == len(documents) for queue in summary['colas'].values())
+    assert all(queue['maxima'] <= queue['capacidad'] for queue in summary['colas'].values())
+
+
+def test_failed_extractions_reach_the_writer(tmp_path, documents):
+    broken = write_document(tmp_path / 'roto.pdf', 'roto', '')
+    results = {}
+    run_pipeline(documents + [broken], lambda pdf_file, success, result: results.setdefault(pdf_file.name, success))
+    
+    assert results.pop('roto.pdf') is False
+    assert all(results.values())
+
+
+def test_a_failing_stage_raises_instead_of_hanging(documents):
+    def store_result(pdf_file, success, result):
+        raise RuntimeError("disco lleno")
+    
+    outcome = {}
+    
+    def target():
+        try:
+            run_pipeline(documents, store_result)
+        except RuntimeError as e:
+            outcome['error'] = str(e)
+    
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert outcome == {'error': "disco lleno"}
+
+
+@pytest.mark.request('user-048')
+def test_cost_model_learns_fixed_and_per_megabyte_cost(tmp_path):
+    model = ExtractionCostModel(tmp_path / 'modelo_coste.json')
+    assert model.coefficients() == (model.DEFAULT_FIXED, model.DEFAULT_PER_MB)
+    
+    for size in (1_000_000, 2_000_000, 4_000_000, 8_000_000):
+        model.observe(size, 0.5 + 0.25 * size / 1e6)
+    fixed, per_mb = model.coefficients()
+    assert fixed == pytest.approx(0.5, rel=0.05)
+    assert per_mb == pytest.approx(0.25, rel=0.05)
+    
+    model.save()
+    assert ExtractionCostModel(tmp_path / 'modelo_coste.json').estimate(10_000_000) == pytest.approx(3.0, rel=0.05)
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import analizador_metadata_archivobase as analizador
+from analizador_metadata_archivobase import ExtractionSupervisor
+
+# Los procesos de extracción heredan la extracción sustituida solo si se crean con fork
+pytestmark = [pytest.mark.request('user-030'),
+              pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                                 reason="la extracción sustituida solo llega a los procesos con fork")]
+
+
+def fake_extract_document(self, pdf_path, first_pages=None, last_pages=0, compute_hash=True):
+    if 'cuelga' in pdf_path.name:
+        time.sleep(60)
+    if 'revienta' in pdf_path.name:
+        os._exit(3)
+    return True, {'ruta': str(pdf_path), 'primeras_paginas': first_pages}
+
+
+@pytest.fixture
+def pdf_folder(tmp_path, monkeypatch):
+    # PDFMetadataAnalyzer crea su carpeta de caché relativa al directorio actual
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analizador.PDFMetadataAnalyzer, 'extract_document', fake_extract_document)
+    for name in ('a.pdf', 'b.pdf', 'cuelga.pdf', 'revienta.pdf'):
+        (tmp_path / name).write_bytes(b'%PDF-1.4')
+    return tmp_path
+
+
+def run_all(supervisor, files, **kwargs):
+    return {os.path.basename(str(pdf_file)): (success, result)
+            for pdf_file, success, result in supervisor.run('document', files, **kwargs)}
+
+
+def test_hanging_file_times_out_and_is_quarantined(pdf_folder):
+    supervisor = ExtractionSupervisor(workers=2, timeout=1)
+    results = run_all(supervisor, [pdf_folder / 'cuelga.pdf', pdf_folder / 'a.pdf', pdf_folder / 'b.pdf'])
+    
+    assert results['cuelga.pdf'] == (False, "Tiempo agotado (1s)")
+    assert results['a.pdf'][0] and results['b.pdf'][0]
+    assert list(supervisor.quarantined) == [str(pdf_folder / 'cuelga.pdf')]
+    entry = supervisor.quarantine_entries()[str(pdf_folder / 'cuelga.pdf')]
+    assert entry['tamaño'] == len(b'%PDF-1.4') and entry['motivo'] == "Tiempo agotado (1s)"
+
+
+def test_crashed_worker_is_replaced_and_the_rest_still_runs(pdf_folder):
+    supervisor = ExtractionSupervisor(workers=1, timeout=30)
+    results = run_all(supervisor, [pdf_folder / 'revienta.pdf', pdf_folder / 'a.pdf'])
+    
+    assert results['revienta.pdf'] == (False, "El proceso de extracción terminó inesperadamente")
+    assert results['a.pdf'] == (True, {'ruta': str(pdf_folder / 'a.pdf'), 'primeras_paginas': None})
+    assert list(supervisor.quarantined) == [str(pdf_folder / 'revienta.pdf')]
+    assert str(pdf_folder / 'a.pdf') in supervisor.durations
+
+
+def test_should_stop_ends_the_run(pdf_folder):
+    supervisor = ExtractionSupervisor(workers=1, timeout=30)
+    results = run_all(supervisor, [pdf_folder / 'a.pdf', pdf_folder / 'b.pdf'], should_stop=lambda: True)
+    assert results == {}
+
+
+@pytest.mark.request('user-040')
+def test_file_options_override_the_shared_options(pdf_folder):
+    supervisor = ExtractionSupervisor(workers=1, timeout=30)
+    results = run_all(supervisor, [pdf_folder / 'a.pdf', pdf_folder / 'b.pdf'], options={'primeras_paginas': 2},
+                      file_options={str(pdf_folder / 'b.pdf'): {'primeras_paginas': 5}})
+    
+    assert results['a.pdf'][1]['primeras_paginas'] == 2
+    assert results['b.pdf'][1]['primeras_paginas'] == 5
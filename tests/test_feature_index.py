@@ -0,0 +1,56 @@
+import pytest
+
+from analizador_metadata_archivobase import FeatureIndex
+
+WEIGHTS = {'version_pdf': 0.25, 'paginas': 0.5, 'creador': 1.0, 'fecha_creacion': 2.0}
+REFERENCE = {'version_pdf': '1.7', 'paginas': '3', 'creador': 'word', 'fecha_creacion': '2021-03-04'}
+
+
+def build_index():
+    index = FeatureIndex()
+    index.add('misma_fecha.pdf', {'version_pdf': '1.7', 'fecha_creacion': '2021-03-04'})
+    index.add('solo_debiles.pdf', {'version_pdf': '1.7', 'paginas': '3', 'creador': 'word'})
+    index.add('otro.pdf', {'version_pdf': '1.4', 'creador': 'writer'})
+    return index
+
+
+@pytest.mark.request('user-043')
+def test_scores_sum_the_weights_of_matching_fields():
+    scores = build_index().score(REFERENCE, WEIGHTS)
+    assert scores['misma_fecha.pdf'] == (2.25, ['version_pdf', 'fecha_creacion'])
+    assert scores['solo_debiles.pdf'] == (1.75, ['version_pdf', 'paginas', 'creador'])
+    assert 'otro.pdf' not in scores
+
+
+@pytest.mark.request('user-043')
+def test_weak_fields_that_cannot_reach_the_threshold_are_pruned():
+    # versión + páginas + creador suman 1.75: por sí solos no generan candidatos con umbral 3
+    scores = build_index().score(REFERENCE, WEIGHTS, threshold=3.0)
+    assert list(scores) == ['misma_fecha.pdf']
+
+
+@pytest.mark.request('user-043')
+def test_removed_and_replaced_documents_leave_no_postings():
+    index = build_index()
+    index.remove('misma_fecha.pdf')
+    index.add('solo_debiles.pdf', {'creador': 'writer'})
+    
+    assert index.score(REFERENCE, WEIGHTS) == {}
+    assert ('fecha_creacion', '2021-03-04') not in index.postings
+    assert index.postings[('creador', 'writer')] == {'otro.pdf', 'solo_debiles.pdf'}
+
+
+@pytest.mark.request('user-046')
+def test_lookup_index_reads_features_from_the_records():
+    records = {'a.pdf': {'creador': 'word', 'hash': 'aa'}, 'b.pdf': {'creador': 'word', 'hash': 'bb'}}
+    index = FeatureIndex(records.get)
+    for file_path, features in records.items():
+        index.add(file_path, features)
+    assert index.features == {}
+    assert index.postings[('hash', 'aa')] == 'a.pdf'
+    
+    index.remove('b.pdf')
+    del records['b.pdf']
+    assert index.postings[('creador', 'word')] == 'a.pdf'
+    assert index.score({'creador': 'word', 'hash': 'aa'}, {'creador': 1.0, 'hash': 3.0}) == {
+        'a.pdf': (4.0, ['creador', 'hash'])}
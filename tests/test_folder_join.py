@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import analizador_metadata_archivobase as analizador
+from conftest import write_document
+
+pytestmark = pytest.mark.request('user-050')
+
+INVOICE = "Factura del suministro eléctrico de la oficina central correspondiente al primer trimestre " * 5
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch, fake_supervisor_factory):
+    # PDFMetadataAnalyzer crea su carpeta de caché relativa al directorio actual
+    monkeypatch.chdir(tmp_path)
+    analyzer = analizador.PDFMetadataAnalyzer()
+    analyzer.cache_dir = tmp_path / 'cache'
+    analyzer.cache_dir.mkdir()
+    analyzer.create_supervisor = fake_supervisor_factory
+    return analyzer
+
+
+@pytest.fixture
+def folders(tmp_path):
+    incoming = tmp_path / 'entrantes'
+    archive = tmp_path / 'archivo'
+    write_document(incoming / 'nueva.pdf', 'word', 'contrato', fecha_creacion='2024-01-01T10:00:00')
+    write_document(incoming / 'escaneo.pdf', 'scanner', 'albarán', fecha_creacion='2023-05-05T08:00:00')
+    write_document(archive / 'contrato.pdf', 'word', 'contrato firmado', fecha_creacion='2024-01-01T10:00:00')
+    write_document(archive / 'otro.pdf', 'word', 'nada que ver', fecha_creacion='2022-02-02T12:00:00')
+    return incoming, archive
+
+
+def pairs(results):
+    return sorted((os.path.basename(result['entrante']), os.path.basename(result['archivo'])) for result in results)
+
+
+def test_join_yields_the_pairs_above_the_threshold(analyzer, folders):
+    incoming, archive = folders
+    results = list(analyzer.iter_folder_join(str(incoming), str(archive)))
+    
+    assert pairs(results) == [('nueva.pdf', 'contrato.pdf')]
+    result, = results
+    assert result['puntuacion'] == 3.5 and result['coincidencias'] == 3
+    assert sorted(result['detalles']) == ['Create Date', 'Creator', 'Páginas']
+    assert result['nivel'] == analyzer.score_level(3.5)
+
+
+def test_a_lower_level_widens_the_join(analyzer, folders):
+    incoming, archive = folders
+    results = analyzer.iter_folder_join(str(incoming), str(archive), min_matches=1)
+    assert pairs(results) == [('nueva.pdf', 'contrato.pdf'), ('nueva.pdf', 'otro.pdf')]
+
+
+def test_hash_only_counts_when_asked(analyzer, folders):
+    incoming, archive = folders
+    write_document(incoming / 'copia.pdf', 'scanner', 'idéntico')
+    write_document(archive / 'original.pdf', 'scanner', 'idéntico')
+    
+    without_hash = [result for result in analyzer.iter_folder_join(str(incoming), str(archive))
+                    if result['entrante'].endswith('copia.pdf')]
+    assert without_hash == []
+    with_hash = [result for result in analyzer.iter_folder_join(str(incoming), str(archive), include_hash=True,
+                                                                refresh=False)
+                 if result['entrante'].endswith('copia.pdf')]
+    assert [result['archivo'] for result in with_hash] == [str(archive / 'original.pdf')]
+    assert 'Hash SHA256' in with_hash[0]['detalles']
+
+
+def test_text_similarity_pairs_documents_with_other_metadata(analyzer, folders):
+    incoming, archive = folders
+    write_document(incoming / 'reenvio.pdf', 'outlook', INVOICE)
+    write_document(archive / 'factura.pdf', 'sap', INVOICE + "Importe total")
+    
+    results = [result for result in analyzer.iter_folder_join(str(incoming), str(archive), text_threshold=0.5)
+               if result['entrante'].endswith('reenvio.pdf')]
+    assert [(result['archivo'], result['nivel']) for result in results] == [(str(archive / 'factura.pdf'), "TEXTO")]
+    assert results[0]['similitud_texto'] >= 0.5
+
+
+def test_join_stops_when_asked(analyzer, folders):
+    incoming, archive = folders
+    list(analyzer.iter_folder_join(str(incoming), str(archive)))
+    assert list(analyzer.iter_folder_join(str(incoming), str(archive), refresh=False, should_stop=lambda: True)) == []
@@ -0,0 +1,57 @@
+import pytest
+
+from analizador_metadata_archivobase import PDFInfoReader
+
+pytestmark = pytest.mark.request('user-029')
+
+OBJECTS = [
+    b"<< /Type /Catalog /Pages 2 0 R >>",
+    b"<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>",
+    b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 10 10] >>",
+    b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 10 10] >>",
+    b"<< /Producer (Acrobat Distiller) /Creator (Microsoft Word) /CreationDate (D:20210304101112) >>",
+]
+FILE_ID = b"<00112233445566778899AABBCCDDEEFF> <FFEEDDCCBBAA99887766554433221100>"
+
+
+def build_pdf(path, offset_shift=None):
+    """PDF mínimo con tabla xref clásica; `offset_shift` = (objeto, objeto al que apunta su entrada)"""
+    data = b"%PDF-1.6\n"
+    offsets = []
+    for number, body in enumerate(OBJECTS, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    if offset_shift:
+        offsets[offset_shift[0] - 1] = offsets[offset_shift[1] - 1]
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(OBJECTS) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += (b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R /ID [" % (len(OBJECTS) + 1) + FILE_ID
+             + b"] >>\nstartxref\n%d\n%%%%EOF\n" % xref)
+    path.write_bytes(data)
+    return path
+
+
+def test_reads_info_pages_and_id_from_trailer_and_xref(tmp_path):
+    info = PDFInfoReader().read(build_pdf(tmp_path / 'doc.pdf'))
+    
+    assert info['producer'] == 'Acrobat Distiller'
+    assert info['creator'] == 'Microsoft Word'
+    assert info['creationDate'] == 'D:20210304101112'
+    assert info['format'] == 'PDF 1.6'
+    assert info['page_count'] == 2
+    assert [value.lower() for value in info['id']] == ['00112233445566778899aabbccddeeff',
+                                                       'ffeeddccbbaa99887766554433221100']
+
+
+def test_xref_offset_pointing_to_another_object_raises(tmp_path):
+    # La entrada del Info apunta a la cabecera de una página: se recurre a fitz
+    with pytest.raises(ValueError):
+        PDFInfoReader().read(build_pdf(tmp_path / 'roto.pdf', offset_shift=(5, 3)))
+
+
+def test_missing_startxref_raises(tmp_path):
+    path = tmp_path / 'truncado.pdf'
+    path.write_bytes(build_pdf(tmp_path / 'doc.pdf').read_bytes()[:200])
+    with pytest.raises(ValueError):
+        PDFInfoReader().read(path)
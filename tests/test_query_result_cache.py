@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from analizador_metadata_archivobase import QueryResultCache
+from conftest import write_document
+
+pytestmark = pytest.mark.request('user-037')
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_store_changes_invalidate_cached_searches(tmp_path, make_store, monkeypatch):
+    folder = tmp_path / 'docs'
+    write_document(folder / 'a.pdf', 'word', "factura de enero")
+    cache = QueryResultCache()
+    store = make_store(folder, result_cache=cache)
+    store.refresh()
+    
+    assert [path for path, _ in store.search_hits("factura")] == [str(folder / 'a.pdf')]
+    # La repetición sale de la caché de resultados sin leer ningún texto
+    reads = []
+    get_entry = store.text_store.get_entry
+    monkeypatch.setattr(store.text_store, 'get_entry', lambda key: reads.append(key) or get_entry(key))
+    assert [path for path, _ in store.search_hits("factura")] == [str(folder / 'a.pdf')]
+    assert reads == [] and cache.hits == 1
+    
+    write_document(folder / 'b.pdf', 'word', "factura de febrero")
+    store.refresh()
+    assert sorted(path for path, _ in store.search_hits("factura")) == [str(folder / 'a.pdf'), str(folder / 'b.pdf')]
+    assert reads
+    
+    os.remove(folder / 'a.pdf')
+    store.refresh()
+    assert [path for path, _ in store.search_hits("factura")] == [str(folder / 'b.pdf')]
+
+
+def test_a_stopped_search_is_not_cached(tmp_path, make_store):
+    folder = tmp_path / 'docs'
+    write_document(folder / 'a.pdf', 'word', "factura")
+    cache = QueryResultCache()
+    store = make_store(folder, result_cache=cache)
+    store.refresh()
+    
+    assert list(store.search_hits("factura", should_stop=lambda: True)) == []
+    assert not cache.entries
+    assert [path for path, _ in store.search_hits("factura")] == [str(folder / 'a.pdf')]
@@ -0,0 +1,78 @@
+import csv
+import json
+from datetime import datetime
+
+import pytest
+
+import analizador_metadata_archivobase as analizador
+from analizador_metadata_archivobase import RecordExporter
+
+pytestmark = pytest.mark.request('user-044')
+
+RECORDS = [
+    {'ruta': 'C:/docs/a.pdf', 'tamaño': 1200, 'modificado': datetime(2024, 3, 1, 9, 30),
+     'creador': 'Microsoft® Word', 'fuentes': ['Arial', 'Calibri'], 'paginas': 3},
+    {'ruta': 'C:/docs/b.pdf', 'tamaño': 800, 'modificado': datetime(2024, 3, 2), 'creador': None,
+     'fuentes': [], 'paginas': 1},
+    {'ruta': 'C:/docs/c.pdf', 'tamaño': 50, 'modificado': datetime(2024, 3, 3), 'creador': 'Writer',
+     'fuentes': ['Times'], 'paginas': None},
+]
+COLUMNS = ['ruta', 'tamaño', 'modificado', 'creador', 'fuentes', 'paginas']
+
+
+def test_jsonl_writes_only_the_requested_columns(tmp_path):
+    output = tmp_path / 'registros.jsonl'
+    # Lotes más pequeños que el número de registros: se escriben en varias pasadas
+    assert RecordExporter(columns=COLUMNS, batch_size=2).export(iter(RECORDS), output) == 3
+    
+    rows = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+    assert [list(row) for row in rows] == [COLUMNS] * 3
+    assert rows[0] == {'ruta': 'C:/docs/a.pdf', 'tamaño': 1200, 'modificado': '2024-03-01T09:30:00',
+                       'creador': 'Microsoft® Word', 'fuentes': 'Arial|Calibri', 'paginas': 3}
+    assert rows[1]['creador'] is None and rows[1]['fuentes'] == ''
+    assert not (tmp_path / 'registros.jsonl.tmp').exists()
+
+
+def test_csv_has_a_header_and_excel_friendly_encoding(tmp_path):
+    output = tmp_path / 'registros.csv'
+    RecordExporter(batch_size=2).export(RECORDS, output, columns=['ruta', 'creador', 'fuentes'])
+    
+    assert output.read_bytes().startswith(b'\xef\xbb\xbf')
+    with open(output, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows == [['ruta', 'creador', 'fuentes'], ['C:/docs/a.pdf', 'Microsoft® Word', 'Arial|Calibri'],
+                    ['C:/docs/b.pdf', '', ''], ['C:/docs/c.pdf', 'Writer', 'Times']]
+
+
+def test_unknown_format_is_rejected_before_writing(tmp_path):
+    with pytest.raises(ValueError, match="desconocido"):
+        RecordExporter().export(RECORDS, tmp_path / 'registros.xlsx')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_export_leaves_no_partial_file(tmp_path):
+    def records():
+        yield RECORDS[0]
+        raise OSError("disco lleno")
+    
+    output = tmp_path / 'registros.jsonl'
+    with pytest.raises(OSError):
+        RecordExporter(batch_size=1).export(records(), output)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parquet_keeps_numeric_columns_typed(tmp_path):
+    pytest.importorskip('pyarrow.parquet')
+    output = tmp_path / 'registros.parquet'
+    RecordExporter(columns=COLUMNS, batch_size=2).export(RECORDS, output)
+    
+    table = analizador.pyarrow.parquet.read_table(str(output))
+    assert str(table.schema.field('tamaño').type) == 'int64'
+    assert table.column('paginas').to_pylist() == [3, 1, None]
+    assert table.column('fuentes').to_pylist() == ['Arial|Calibri', '', 'Times']
+
+
+def test_parquet_without_pyarrow_asks_to_install_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(analizador, 'pyarrow', None)
+    with pytest.raises(ValueError, match="pyarrow"):
+        RecordExporter().export(RECORDS, tmp_path / 'registros.parquet')
@@ -0,0 +1,63 @@
+import pytest
+
+from analizador_metadata_archivobase import DirectoryTree, ScanFilters
+from conftest import write_document
+
+pytestmark = pytest.mark.request('user-039')
+
+
+def test_folders_are_pruned_by_name_relative_glob_and_depth():
+    filters = ScanFilters(exclude=['backup', 'clientes/*/tmp'], max_depth=2)
+    assert filters.accepts_dir('facturas', 'facturas', 1)
+    assert not filters.accepts_dir('backup', 'facturas/backup', 2)
+    assert not filters.accepts_dir('tmp', 'clientes/acme/tmp', 2)
+    assert filters.accepts_dir('tmp', 'tmp', 1)
+    assert not filters.accepts_dir('2024', 'facturas/enero/2024', 3)
+
+
+def test_files_are_filtered_by_glob_size_and_date():
+    filters = ScanFilters(include=['fac*'], exclude=['*borrador*'], min_size=100, max_size=1000,
+                          modified_after=1_700_000_000, modified_before=1_800_000_000)
+    assert filters.accepts_file('factura.pdf', 'enero/factura.pdf', 500, 1_750_000_000)
+    assert not filters.accepts_file('albaran.pdf', 'albaran.pdf', 500, 1_750_000_000)
+    assert not filters.accepts_file('factura_borrador.pdf', 'factura_borrador.pdf', 500, 1_750_000_000)
+    assert not filters.accepts_file('factura.pdf', 'factura.pdf', 50, 1_750_000_000)
+    assert not filters.accepts_file('factura.pdf', 'factura.pdf', 5000, 1_750_000_000)
+    assert not filters.accepts_file('factura.pdf', 'factura.pdf', 500, 1_600_000_000)
+    assert not filters.accepts_file('factura.pdf', 'factura.pdf', 500, 1_900_000_000)
+
+
+def test_cache_key_is_empty_without_filters_and_stable_otherwise():
+    assert ScanFilters().cache_key() == ''
+    assert ScanFilters(exclude=['backup']).cache_key() == ScanFilters(exclude=['backup']).cache_key()
+    assert ScanFilters(exclude=['backup']).cache_key() != ScanFilters(exclude=['tmp']).cache_key()
+
+
+def test_excluded_folders_are_never_listed(tmp_path):
+    write_document(tmp_path / 'a.pdf', 'word', 'uno')
+    write_document(tmp_path / 'backup' / 'a.pdf', 'word', 'copia')
+    write_document(tmp_path / 'sub' / 'hondo' / 'b.pdf', 'word', 'dos')
+    builder = DirectoryTree(workers=2, filters=ScanFilters(exclude=['backup'], max_depth=1))
+    listed = []
+    list_directory = builder.list_directory
+    
+    def spy(folder, *args):
+        listed.append(folder.name)
+        return list_directory(folder, *args)
+    
+    builder.list_directory = spy
+    tree, _ = builder.validate(tmp_path)
+    assert sorted(listed) == sorted([tmp_path.name, 'sub'])
+    assert [str(path) for path, _, _ in builder.iter_files(tree, tmp_path)] == [str(tmp_path / 'a.pdf')]
+
+
+def test_each_filter_configuration_has_its_own_store(tmp_path, make_store):
+    folder = tmp_path / 'docs'
+    write_document(folder / 'a.pdf', 'word', 'uno')
+    write_document(folder / 'backup' / 'b.pdf', 'word', 'copia')
+    filtered = make_store(folder, directory_builder=DirectoryTree(filters=ScanFilters(exclude=['backup'])))
+    full = make_store(folder)
+    
+    assert filtered.store_file != full.store_file
+    assert filtered.refresh()[1] == [str(folder / 'a.pdf')]
+    assert sorted(full.refresh()[1]) == [str(folder / 'a.pdf'), str(folder / 'backup' / 'b.pdf')]
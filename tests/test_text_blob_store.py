@@ -0,0 +1,63 @@
+import pytest
+
+from analizador_metadata_archivobase import TextBlobStore
+from conftest import write_document
+
+pytestmark = pytest.mark.request('user-040')
+
+PAGES = {key: [f"página {i} de {key} " * 20 for i in range(3)] for key in ('a', 'b', 'c')}
+
+
+def test_memory_budget_counts_the_decompressed_entries(tmp_path):
+    entry_size = TextBlobStore.memory_size_of(TextBlobStore(tmp_path).put('a', PAGES['a']))
+    store = TextBlobStore(tmp_path / 'textos', memory_budget=entry_size * 2 + entry_size // 2)
+    for key, pages in PAGES.items():
+        store.put(key, pages)
+    
+    statistics = store.statistics()
+    assert (statistics['en_memoria'], statistics['expulsiones_memoria']) == (2, 1)
+    assert statistics['bytes_memoria'] == sum(TextBlobStore.memory_size_of(entry) for entry, _ in store.memory.values())
+    # Dos entradas descomprimidas ocupan más que las tres comprimidas del disco
+    assert statistics['bytes_memoria'] > statistics['bytes_disco']
+    
+    # La expulsada de memoria sigue en disco
+    assert store.get('a') == PAGES['a']
+    assert store.statistics()['lecturas_disco'] == 1
+
+
+def test_disk_budget_removes_the_least_recently_used_blobs(tmp_path):
+    store = TextBlobStore(tmp_path / 'textos', memory_budget=1, disk_budget=1)
+    for key, pages in PAGES.items():
+        store.put(key, pages)
+    
+    statistics = store.statistics()
+    assert (statistics['en_disco'], statistics['expulsiones_disco']) == (1, 2)
+    assert not store.blob_path('a').exists()
+    assert store.get('a') is None
+    assert store.get('c') == PAGES['c']
+    # Otra instancia reconstruye el índice del disco
+    assert TextBlobStore(tmp_path / 'textos').statistics()['en_disco'] == 1
+
+
+def test_entries_keep_the_folded_text_and_offsets(tmp_path):
+    entry = TextBlobStore(tmp_path).put('k', ["Árbol ", "CAFÉ"])
+    assert entry.folded == "arbol cafe"
+    reloaded = TextBlobStore(tmp_path).get_entry('k')
+    assert reloaded == entry
+
+
+def test_evicted_texts_are_recovered_in_one_supervisor_run(tmp_path, make_store, supervisor_runs):
+    folder = tmp_path / 'docs'
+    for name, text in (('uno.pdf', 'factura de enero'), ('dos.pdf', 'factura de febrero'),
+                       ('tres.pdf', 'albarán de marzo')):
+        write_document(folder / name, 'word', text)
+    text_store = TextBlobStore(tmp_path / 'textos', memory_budget=1, disk_budget=1)
+    store = make_store(folder, text_store=text_store)
+    store.refresh()
+    del supervisor_runs[:]
+    
+    hits = dict(store.search_hits('FACTURA'))
+    assert sorted(hits) == sorted(str(folder / name) for name in ('uno.pdf', 'dos.pdf'))
+    text_runs = [files for kind, files in supervisor_runs if kind == 'text']
+    assert len(text_runs) == 1
+    assert text_store.statistics()['reextracciones'] == len(text_runs[0]) == 2
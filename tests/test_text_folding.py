@@ -0,0 +1,33 @@
+import pytest
+
+from analizador_metadata_archivobase import fold_text, original_offset
+
+pytestmark = pytest.mark.request('user-047')
+
+
+def test_ascii_text_is_only_lowercased():
+    assert fold_text("Factura 2024 ABC") == ("factura 2024 abc", [[], []])
+
+
+def test_accents_and_case_are_removed_but_enye_is_kept():
+    folded, _ = fold_text("Árbol ÑANDÚ Información")
+    assert folded == "arbol ñandu informacion"
+
+
+def test_offsets_map_folded_matches_back_to_the_original():
+    text = "ﬁn de la Straße en Córdoba"
+    folded, offsets = fold_text(text)
+    
+    for needle, original in (("strasse", "Straße"), ("cordoba", "Córdoba"), ("fin", "ﬁn")):
+        start = folded.index(needle)
+        original_start = original_offset(offsets, start)
+        original_end = original_offset(offsets, start + len(needle) - 1) + 1
+        assert text[original_start:original_end] == original
+
+
+def test_combining_marks_do_not_shift_later_offsets():
+    text = "café con leche"
+    folded, offsets = fold_text(text)
+    assert folded == "cafe con leche"
+    start = folded.index("leche")
+    assert text[original_offset(offsets, start):].startswith("leche")
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from conftest import write_document
+
+pytestmark = pytest.mark.request('user-045')
+
+
+@pytest.fixture
+def store(tmp_path, make_store):
+    folder = tmp_path / 'docs'
+    write_document(folder / 'a.pdf', 'word', "Portada\fLa FACTURA número 7 del camión\fOtra factura pendiente")
+    write_document(folder / 'b.pdf', 'word', "Albarán sin nada que ver")
+    store = make_store(folder)
+    store.refresh()
+    return store
+
+
+def test_hits_carry_page_offsets_and_snippet(store):
+    results = dict(store.search_hits("factura"))
+    assert list(results) == [os.path.join(store.search_folder, 'a.pdf')]
+    hits = results[os.path.join(store.search_folder, 'a.pdf')]
+    
+    assert hits['total'] == 2
+    first, second = hits['aciertos']
+    assert (first['pagina'], first['inicio'], first['fin'], first['texto']) == (2, 3, 10, 'FACTURA')
+    assert (second['pagina'], second['inicio'], second['fin'], second['texto']) == (3, 5, 12, 'factura')
+    assert 'La FACTURA número 7' in first['fragmento']
+
+
+def test_search_ignores_case_and_accents(store):
+    assert [hits['aciertos'][0]['texto'] for _, hits in store.search_hits("CAMION")] == ['camión']
+    assert [hits['aciertos'][0]['texto'] for _, hits in store.search_hits("albaran")] == ['Albarán']
+    assert list(store.search_text("numero 7")) == [os.path.join(store.search_folder, 'a.pdf')]
+    assert list(store.search_text("presupuesto")) == []
+
+
+def test_max_hits_limits_the_located_hits_but_not_the_count(store):
+    (_, hits), = store.search_hits("factura", max_hits=1)
+    assert hits['total'] == 2
+    assert len(hits['aciertos']) == 1
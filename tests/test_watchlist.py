@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from analizador_metadata_archivobase import Watchlist
+
+pytestmark = pytest.mark.request('user-049')
+
+
+def open_watchlist(tmp_path):
+    return Watchlist(tmp_path / 'vigilancia.json', tmp_path / 'vigilancia_informe.jsonl')
+
+
+def document(path, creator, quick_hash='h'):
+    return {'ruta': path, 'creador': creator, 'huella_rapida': quick_hash}
+
+
+def test_queries_persist_between_instances(tmp_path):
+    open_watchlist(tmp_path).add('sospechoso', {'creador': 'scanner x'}, 1.0, reference='ref.pdf')
+    
+    watchlist = open_watchlist(tmp_path)
+    assert watchlist.queries['sospechoso']['referencia'] == 'ref.pdf'
+    assert watchlist.remove('sospechoso')
+    assert open_watchlist(tmp_path).queries == {}
+
+
+def test_saves_from_two_processes_are_merged(tmp_path):
+    daemon = open_watchlist(tmp_path)
+    cli = open_watchlist(tmp_path)
+    
+    cli.add('desde_cli', {'creador': 'a'}, 1.0)
+    daemon.add('desde_indexador', {'creador': 'b'}, 1.0)
+    assert sorted(open_watchlist(tmp_path).queries) == ['desde_cli', 'desde_indexador']
+    
+    # El indexador ve la consulta de la CLI sin reiniciarse
+    hits = daemon.check('carpeta', [document('carpeta/x.pdf', 'a')])
+    assert [hit['consulta'] for hit in hits] == ['desde_cli']
+    
+    cli.remove('desde_indexador')
+    assert sorted(open_watchlist(tmp_path).queries) == ['desde_cli']
+
+
+def test_matches_are_reported_once_per_content(tmp_path):
+    watchlist = open_watchlist(tmp_path)
+    watchlist.add('sospechoso', {'creador': 'a'}, 1.0)
+    
+    assert len(watchlist.check('carpeta', [document('carpeta/x.pdf', 'a')])) == 1
+    assert open_watchlist(tmp_path).check('carpeta', [document('carpeta/x.pdf', 'a')]) == []
+    assert len(watchlist.check('carpeta', [document('carpeta/x.pdf', 'a', 'otro')])) == 1
+    
+    report = (tmp_path / 'vigilancia_informe.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['ruta'] for line in report] == ['carpeta/x.pdf', 'carpeta/x.pdf']
+
+
+def test_reported_keys_are_capped(tmp_path):
+    watchlist = open_watchlist(tmp_path)
+    watchlist.MAX_REPORTED = 3
+    watchlist.add('sospechoso', {'creador': 'a'}, 1.0)
+    for i in range(5):
+        watchlist.check('carpeta', [document(f'carpeta/{i}.pdf', 'a')])
+    
+    data = json.loads((tmp_path / 'vigilancia.json').read_text(encoding='utf-8'))
+    assert len(data['notificados']['sospechoso']) == 3
+    assert not (tmp_path / 'vigilancia.lock').exists()